@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的 AstrBot 替身
+
+在没有安装 AstrBot、没有网络的环境中加载插件：
+- install_astrbot_stubs: 注册最小化的 astrbot.api 模块（已安装真实 AstrBot 时不做任何事）
+- load_plugin: 把插件目录作为包加载，返回 main 模块
+- load_module: 只导入包内不依赖 AstrBot 的模块（storage、codec 等相对导入其他模块，不能按文件路径单独加载）
+- FakeContext / FakeEvent: 可注入延迟的 Context 与消息事件
+"""
+
+import asyncio        # 模拟发送延迟
+import importlib      # 导入插件模块
+import importlib.util # 按路径创建包
+import logging        # 替身日志记录器
+import sys            # 模块注册
+import types          # 动态创建模块
+from pathlib import Path    # 路径处理
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = "apq_plugin"
+
+# StarTools.get_data_dir 返回的目录，由 set_data_root 指定
+_data_root = {"path": Path("/tmp/apq_bench")}
+
+
+def set_data_root(path: Path) -> None:
+    """指定插件数据目录的根路径
+
+    Args:
+        path: 根路径，插件数据位于 <path>/mapleroyalsapq
+    """
+    _data_root["path"] = Path(path)
+
+
+def install_astrbot_stubs() -> None:
+    """注册最小化的 astrbot.api / astrbot.api.event / astrbot.api.star 模块"""
+    try:
+        import astrbot.api  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    api = types.ModuleType("astrbot.api")
+    api.logger = logging.getLogger("astrbot")
+    api.AstrBotConfig = type("AstrBotConfig", (dict,), {})
+
+    event = types.ModuleType("astrbot.api.event")
+
+    class _Filter:
+        """filter.command 替身：原样返回处理函数"""
+
+        def command(self, *args, **kwargs):
+            return lambda fn: fn
+
+    event.filter = _Filter()
+    event.AstrMessageEvent = type("AstrMessageEvent", (), {})
+
+    star = types.ModuleType("astrbot.api.star")
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    class StarTools:
+        @staticmethod
+        def get_data_dir(name):
+            return _data_root["path"] / name
+
+    star.Star = Star
+    star.StarTools = StarTools
+    star.Context = type("Context", (), {})
+    star.register = lambda *args, **kwargs: (lambda cls: cls)
+
+    root = types.ModuleType("astrbot")
+    root.api = api
+    api.event = event
+    api.star = star
+    sys.modules.update({
+        "astrbot": root,
+        "astrbot.api": api,
+        "astrbot.api.event": event,
+        "astrbot.api.star": star,
+    })
+
+
+def load_module(name: str):
+    """把插件目录作为包注册，导入其中一个不依赖 AstrBot 的模块（如 storage、codec）
+
+    Args:
+        name: 模块名
+    Returns:
+        module: 导入的模块
+    """
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_loader(PACKAGE_NAME, loader=None, is_package=True)
+        package = importlib.util.module_from_spec(spec)
+        package.__path__ = [str(ROOT)]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+def load_plugin():
+    """把插件目录作为包加载并返回 main 模块"""
+    install_astrbot_stubs()
+    return load_module("main")
+
+
+class FakeContext:
+    """Context 替身：send_message 按群聊注入固定延迟，可指定失败的群聊"""
+
+    def __init__(self, latency: float = 0.0, slow_groups=None, slow_latency: float = 0.0, failing_groups=None):
+        """初始化
+
+        Args:
+            latency: 普通群聊的发送延迟（秒）
+            slow_groups: 慢群聊集合
+            slow_latency: 慢群聊的发送延迟（秒）
+            failing_groups: 发送时抛出异常的群聊集合
+        """
+        self.latency = latency
+        self.slow_groups = set(slow_groups or ())
+        self.slow_latency = slow_latency
+        self.failing_groups = set(failing_groups or ())
+        self.sent = []
+
+    async def send_message(self, group_id, message):
+        delay = self.slow_latency if group_id in self.slow_groups else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if group_id in self.failing_groups:
+            raise RuntimeError("send failed")
+        self.sent.append(group_id)
+        return True
+
+
+class FakeEvent:
+    """AstrMessageEvent 替身"""
+
+    def __init__(self, sender_id: str, group: str = "", message: str = "", admin: bool = False):
+        """初始化
+
+        Args:
+            sender_id: 发送者QQ号
+            group: 群号，为空表示私聊
+            message: 原始消息文本
+            admin: 发送者是否为群管理员
+        """
+        self.sender_id = str(sender_id)
+        self.unified_msg_origin = f"aiocqhttp:GroupMessage:{group}" if group else f"aiocqhttp:FriendMessage:{sender_id}"
+        self.message_str = message
+        sender = types.SimpleNamespace(role="admin" if admin else "member")
+        self.message_obj = types.SimpleNamespace(sender=sender, group_id=group or None)
+
+    def get_sender_id(self):
+        return self.sender_id
+
+    def get_sender_name(self):
+        return f"user{self.sender_id}"
+
+    def plain_result(self, text):
+        return text
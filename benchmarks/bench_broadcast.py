@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+满员广播端到端延迟基准测试
+
+使用注入延迟的 context.send_message 替身，对比
+- sequential: 旧实现，逐个 await 每个群聊
+- concurrent: 当前实现，有并发上限和单群超时，并在后台发送
+第6人的 /加入APQ 返回耗时，以及所有群聊发送完成的耗时
+
+用法：python benchmarks/bench_broadcast.py [--groups 40] [--latency 0.05]
+"""
+
+import argparse       # 命令行参数
+import asyncio        # 事件循环
+import logging        # 关闭插件日志输出
+import sys            # 路径处理
+import tempfile       # 临时数据目录
+import time           # 计时
+from pathlib import Path    # 路径处理
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import _stubs  # noqa: E402
+
+
+async def sequential_broadcast(context, groups, message) -> None:
+    """旧实现：逐个群聊串行发送"""
+    for group_id in groups:
+        try:
+            await context.send_message(group_id, message)
+        except Exception:
+            pass
+
+
+async def fill_roster(plugin, groups) -> None:
+    """让所有群都被记录，然后在第一个群里创建APQ并加入5人"""
+    FakeEvent = _stubs.FakeEvent
+    for g in groups:
+        await plugin.query_apq(FakeEvent("1", group=g))
+    await plugin.create_apq(FakeEvent("1", group=groups[0]), "cap", "br", "拳手")
+    for i in range(2, plugin.TEAM_SIZE):
+        await plugin.join_apq(FakeEvent(str(i), group=groups[0]), f"c{i}", "gr", "法师")
+
+
+async def run(args) -> None:
+    main = _stubs.load_plugin()
+    logging.getLogger("astrbot").setLevel(logging.CRITICAL)
+    groups = [str(700000 + i) for i in range(args.groups)]
+    slow = set(groups[: args.slow])
+    group_ids = [f"aiocqhttp:GroupMessage:{g}" for g in groups]
+    slow_ids = {f"aiocqhttp:GroupMessage:{g}" for g in slow}
+
+    for mode in ("sequential", "concurrent"):
+        with tempfile.TemporaryDirectory() as tmp:
+            _stubs.set_data_root(Path(tmp))
+            context = _stubs.FakeContext(latency=args.latency, slow_groups=slow_ids, slow_latency=args.slow_latency)
+            plugin = main.APQPlugin(context, main.AstrBotConfig({
+                "broadcast_concurrency": args.concurrency,
+                "broadcast_timeout_seconds": args.timeout,
+                # 同一个用户在所有群里查询以登记群聊，关闭限流
+                "rate_limit_user_per_minute": 0,
+                "rate_limit_group_per_minute": 0,
+            }))
+            await fill_roster(plugin, groups)
+            if mode == "sequential":
+                # 用旧的串行实现替换广播
+                plugin._broadcast_to_all_groups = (
+                    lambda message, groups=None: sequential_broadcast(context, groups or group_ids, message))
+
+            start = time.perf_counter()
+            await plugin.join_apq(_stubs.FakeEvent("99", group=groups[0]), "last", "gr", "主教")
+            reply = time.perf_counter() - start
+            await asyncio.gather(*plugin._background_tasks)
+            done = time.perf_counter() - start
+            if mode == "sequential":
+                # 旧实现在回复前 await 整个广播，回复耗时等于全部发送耗时
+                reply = done
+            await plugin.terminate()
+            print(f"{mode:<12} reply {reply * 1000:>9.1f} ms   all sent {done * 1000:>9.1f} ms   "
+                  f"delivered {len(context.sent)}/{len(groups)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=40, help="记录的群聊数量")
+    parser.add_argument("--latency", type=float, default=0.05, help="普通群聊发送延迟（秒）")
+    parser.add_argument("--slow", type=int, default=2, help="慢群聊数量")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="慢群聊发送延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发上限")
+    parser.add_argument("--timeout", type=float, default=0.5, help="单群发送超时（秒）")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 编解码基准测试
+
+在已安装的每种实现（orjson / msgspec / 标准库 json）上测量三类数据的编码、解码耗时和大小：
+- database: 多个群的会话（满员名单 + 长候补名单）和匹配队列，内存中是 Player / Session 模型，
+            分别按缩进两格（旧的 database.json 格式，即 json/pretty）和紧凑格式编码整个状态
+- history:  大量历史归档记录，每条编码为一行（与 history/*.jsonl.gz 解压后的内容相同）
+- groups:   大量群聊登记，每个群一行（与 groups.jsonl 压缩后的内容相同）
+每项取多次运行中最快的一次
+
+用法：python benchmarks/bench_codec.py [--groups 200] [--waitlist 30] [--queue 30]
+                                       [--history 20000] [--tracked 5000] [--repeat 5]
+"""
+
+import argparse       # 命令行参数
+import random         # 随机生成数据
+import sys            # 路径处理
+import time           # 计时
+from pathlib import Path    # 路径处理
+from typing import Callable, List  # 类型提示
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import _stubs  # noqa: E402
+
+JOBS = ["拳手", "船长", "刀飞", "标飞", "法师", "主教", "火毒", "冰雷", "弓手", "弩手", "英雄", "圣骑", "黑骑"]
+
+
+def make_player(models, rng: random.Random, uid: int):
+    """生成一名玩家"""
+    return models.Player(str(100000 + uid), f"玩家{uid}", f"char{uid}", rng.choice(("br", "gr")),
+                         rng.choice(JOBS), 1700000000 + uid)
+
+
+def make_state(models, groups: int, waitlist: int, queue: int, seed: int = 23) -> dict:
+    """生成插件状态：每个群一个满员会话、一条候补名单和一条匹配队列"""
+    rng = random.Random(seed)
+    uid = 0
+    sessions, queues = {}, {}
+    for g in range(groups):
+        sid = f"qq:GroupMessage:{800000 + g}"
+        members = [make_player(models, rng, uid + i) for i in range(6)]
+        uid += 6
+        waiting = [make_player(models, rng, uid + i) for i in range(waitlist)]
+        uid += waitlist
+        sessions[sid] = models.Session("recruiting", captain=members[0], members=members,
+                                       waitlist=waiting, created_at=1700000000 + g)
+        queues[sid] = [make_player(models, rng, uid + i) for i in range(queue)]
+        uid += queue
+    return {"sessions": sessions, "queues": queues, "tracked_groups": []}
+
+
+def make_history(history, count: int, seed: int = 29) -> List[dict]:
+    """生成历史归档记录"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        members = [{"qq_number": str(100000 + rng.randrange(5000)), "nickname": f"玩家{i}-{k}",
+                    "character_id": f"char{i}-{k}", "gender": rng.choice(("br", "gr")), "job": rng.choice(JOBS)}
+                   for k in range(6)]
+        records.append(history.HistoryArchive.make_record(
+            rng.choice(history.OUTCOMES), f"qq:GroupMessage:{800000 + i % 200}", members,
+            captain=members[0]["qq_number"], started_at=1700000000 + i * 60, ts=1700003600 + i * 60))
+    return records
+
+
+def best(fn: Callable[[], object], repeat: int) -> float:
+    """多次运行中最快的一次（秒）"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def row(backend: str, payload: str, fmt: str, encode_s: float, decode_s: float, size: int) -> None:
+    print(f"{backend:<9}{payload:<10}{fmt:<9}{encode_s * 1000:>12.2f}{decode_s * 1000:>12.2f}{size:>12}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=200, help="会话（群聊）数量")
+    parser.add_argument("--waitlist", type=int, default=30, help="每个会话的候补人数")
+    parser.add_argument("--queue", type=int, default=30, help="每个群匹配队列的人数")
+    parser.add_argument("--history", type=int, default=20000, help="历史记录条数")
+    parser.add_argument("--tracked", type=int, default=5000, help="登记的群聊数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    args = parser.parse_args()
+
+    codec = _stubs.load_module("codec")
+    models = _stubs.load_module("models")
+    history = _stubs.load_module("history")
+
+    state = make_state(models, args.groups, args.waitlist, args.queue)
+    records = make_history(history, args.history)
+    groups = [{"g": f"qq:GroupMessage:{800000 + g}", "t": 1700000000 + g} for g in range(args.tracked)]
+
+    print(f"implementations: {', '.join(codec.available())}")
+    print(f"{'impl':<9}{'payload':<10}{'format':<9}{'encode(ms)':>12}{'decode(ms)':>12}{'bytes':>12}")
+    for name in codec.available():
+        codec.select(name)
+        for fmt, pretty in (("pretty", True), ("compact", False)):
+            data = codec.dumps(state, pretty=pretty)
+            row(name, "database", fmt,
+                best(lambda: codec.dumps(state, pretty=pretty), args.repeat),
+                best(lambda: codec.loads(data), args.repeat), len(data))
+        for payload, items in (("history", records), ("groups", groups)):
+            lines = [codec.dumps(item) + b"\n" for item in items]
+            row(name, payload, "lines",
+                best(lambda: [codec.dumps(item) + b"\n" for item in items], args.repeat),
+                best(lambda: [codec.loads(line) for line in lines], args.repeat), sum(map(len, lines)))
+
+
+if __name__ == "__main__":
+    main()
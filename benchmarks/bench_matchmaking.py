@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+匹配队列组队基准测试
+
+玩家逐个入队，每次入队后尝试成队（成队的玩家出队），对比
+- rescan:      每次入队都从头扫描整个队列重新求解（不分桶）
+- incremental: 当前实现，按 性别 -> 职业 分桶，多路归并各桶队首
+每次入队的耗时以及组成的队伍数
+
+用法：python benchmarks/bench_matchmaking.py [--pools 10,100,1000] [--br-ratio 0.7] [--max-per-job 2]
+"""
+
+import argparse       # 命令行参数
+import importlib.util # 按路径加载插件模块
+import random         # 随机生成玩家
+import statistics     # 延迟统计
+import sys            # 模块注册
+import time           # 计时
+from pathlib import Path    # 路径处理
+
+ROOT = Path(__file__).resolve().parent.parent
+
+JOBS = ["拳手", "船长", "刀飞", "标飞", "法师", "主教", "火毒", "冰雷", "弓手", "弩手", "英雄", "圣骑", "黑骑"]
+
+
+def load_matchmaking():
+    """按文件路径加载 matchmaking.py（不依赖 AstrBot）"""
+    spec = importlib.util.spec_from_file_location("apq_matchmaking", ROOT / "matchmaking.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_players(count: int, br_ratio: float, seed: int = 11) -> list:
+    """生成一批玩家，性别按比例倾斜，让部分玩家需要排队等待"""
+    rng = random.Random(seed)
+    return [
+        {
+            "qq_number": str(100000 + i),
+            "nickname": f"玩家{i}",
+            "character_id": f"char{i}",
+            "gender": "br" if rng.random() < br_ratio else "gr",
+            "job": rng.choice(JOBS),
+        }
+        for i in range(count)
+    ]
+
+
+class RescanQueue:
+    """对照实现：队列是一个列表，每次都按入队顺序从头扫描求解"""
+
+    def __init__(self, rules, job_key):
+        self.rules = rules
+        self.job_key = job_key
+        self.players = []
+
+    def add(self, player):
+        self.players.append(player)
+
+    def match(self):
+        size = self.rules.team_size
+        cap = self.rules.job_cap
+        best = None
+        for n_br in self.rules.splits():
+            need = {"br": n_br, "gr": size - n_br}
+            # 与 MatchQueue 相同的两步精确求解，只是每次都从头扫描整个列表
+            keyed = [(p, p["gender"], self.job_key(p["job"])) for p in self.players if need[p["gender"]] > 0]
+            available = {}
+            end = None
+            for i, (p, gender, job) in enumerate(keyed):
+                available[gender, job] = available.get((gender, job), 0) + 1
+                if i + 1 >= size and self.rules.can_fill(need, available, {}):
+                    end = i + 1
+                    break
+            if end is None:
+                continue
+            used = {}
+            picked = []
+            for p, gender, job in keyed[:end]:
+                available[gender, job] -= 1
+                if need[gender] <= 0 or used.get(job, 0) >= cap:
+                    continue
+                need[gender] -= 1
+                used[job] = used.get(job, 0) + 1
+                if self.rules.can_fill(need, available, used):
+                    picked.append(p)
+                    continue
+                need[gender] += 1
+                used[job] -= 1
+            if best is None or self.players.index(picked[-1]) < self.players.index(best[-1]):
+                best = picked
+        return best
+
+    def remove_party(self, party):
+        chosen = {id(p) for p in party}
+        self.players = [p for p in self.players if id(p) not in chosen]
+
+
+def run_queue(queue, players, remove) -> tuple:
+    """逐个入队并尝试成队，返回 (每次入队耗时列表, 成队数)"""
+    latencies = []
+    parties = 0
+    for player in players:
+        start = time.perf_counter()
+        queue.add(player)
+        party = queue.match()
+        if party is not None:
+            remove(queue, party)
+            parties += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, parties
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pools", default="10,100,1000", help="逗号分隔的玩家数量")
+    parser.add_argument("--br-ratio", type=float, default=0.7, help="br 玩家占比")
+    parser.add_argument("--min-each", type=int, default=1, help="每队 br/gr 各自的最少人数")
+    parser.add_argument("--max-per-job", type=int, default=2, help="同一职业的人数上限，0 表示不限")
+    args = parser.parse_args()
+
+    mm = load_matchmaking()
+    rules = mm.CompositionRules(
+        team_size=6, min_br=args.min_each, max_br=6 - args.min_each,
+        min_gr=args.min_each, max_gr=6 - args.min_each, max_per_job=args.max_per_job,
+    )
+
+    def remove_incremental(queue, party):
+        for p in party:
+            queue.remove(p["qq_number"])
+
+    print(f"{'pool':>6} {'impl':<12}{'mean(us)':>10}{'p99(us)':>10}{'max(us)':>10}{'parties':>9}{'queued':>8}")
+    for count in (int(x) for x in args.pools.split(",")):
+        players = make_players(count, args.br_ratio)
+        cases = [
+            ("rescan", RescanQueue(rules, mm.job_key), lambda q, party: q.remove_party(party)),
+            ("incremental", mm.MatchQueue(rules), remove_incremental),
+        ]
+        for name, queue, remove in cases:
+            latencies, parties = run_queue(queue, [dict(p) for p in players], remove)
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            queued = len(queue.players) if name == "rescan" else len(queue)
+            print(f"{count:>6} {name:<12}"
+                  f"{statistics.mean(latencies) * 1e6:>10.1f}"
+                  f"{p99 * 1e6:>10.1f}"
+                  f"{latencies[-1] * 1e6:>10.1f}"
+                  f"{parties:>9}{queued:>8}")
+
+
+if __name__ == "__main__":
+    main()
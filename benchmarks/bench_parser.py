@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+角色参数解析基准测试
+
+对比 /加入APQ 等命令的参数解析吞吐量：
+- legacy:   旧实现，每次调用 re.match 传入字符串模式（经过 re 模块缓存查找），
+            并用 f-string + repr 输出三条 info 日志（日志写入内存，不计终端开销）
+- compiled: 当前实现 parsing.parse_role_args，模块加载时编译好的前缀正则 + str.split 一次切分，
+            不输出日志（debug_log 关闭时的热路径）
+输入混合了半角/全角空格、中英文性别别名和含空格的职业
+
+用法：python benchmarks/bench_parser.py [--count 200000]
+"""
+
+import argparse       # 命令行参数
+import importlib.util # 按路径加载插件模块
+import io             # 内存日志
+import logging        # 旧实现的日志开销
+import random         # 随机生成输入
+import re             # 旧实现的正则
+import sys            # 模块注册
+import time           # 计时
+from pathlib import Path    # 路径处理
+
+ROOT = Path(__file__).resolve().parent.parent
+
+JOBS = ["拳手", "船长", "刀飞", "标飞", "法师", "主教", "火毒", "冰雷", "弓手", "弩手", "英雄", "圣骑", "黑骑", "超级 弓手"]
+GENDERS = ["br", "gr", "新娘", "新郎", "BR", "Gr"]
+COMMANDS = ["创建APQ", "加入APQ", "更换APQ角色"]
+
+LEGACY_PATTERN = r'^\s*(\S+)\s+(br|gr|新郎|新娘)\s+(\S+(?:\s+\S+)*)\s*$'
+LEGACY_GENDERS = {"br": "br", "新娘": "br", "gr": "gr", "新郎": "gr"}
+
+
+def load_parsing():
+    """按文件路径加载 parsing.py（不依赖 AstrBot）"""
+    spec = importlib.util.spec_from_file_location("apq_parsing", ROOT / "parsing.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_messages(count: int, seed: int = 18) -> list:
+    """生成一批完整的命令消息，约四分之一使用全角空格"""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        sep = "　" if rng.random() < 0.25 else " "
+        messages.append(sep.join([f"/{rng.choice(COMMANDS)}", f"char{i}", rng.choice(GENDERS), rng.choice(JOBS)]))
+    return messages
+
+
+def legacy_parse(message: str, logger: logging.Logger):
+    """旧实现：去掉命令名后用字符串模式匹配，并输出调试 info 日志"""
+    content = message.split(maxsplit=1)[1] if " " in message else message
+    content = content.strip()
+    match = re.match(LEGACY_PATTERN, content, re.IGNORECASE)
+    logger.info(f"apq: 解析加入命令 - 原始内容: {repr(content)}")
+    logger.info(f"apq: 正则匹配结果: {match}")
+    if not match:
+        return None
+    char_id, gender_raw, job = (g.strip() for g in match.groups())
+    logger.info(f"apq: 解析结果 - char_id={repr(char_id)}, gender={repr(gender_raw)}, job={repr(job)}")
+    gender = LEGACY_GENDERS.get(gender_raw.lower())
+    return (char_id, gender, job) if gender else None
+
+
+def bench(name: str, parse, messages: list) -> None:
+    """解析全部消息并打印吞吐量和成功解析的数量"""
+    start = time.perf_counter()
+    parsed = sum(1 for message in messages if parse(message) is not None)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10}{len(messages) / elapsed:>14.0f}{elapsed / len(messages) * 1e6:>10.2f}{parsed:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=200000, help="解析的消息数量")
+    args = parser.parse_args()
+
+    parsing = load_parsing()
+    messages = make_messages(args.count)
+
+    logger = logging.getLogger("bench_parser")
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    def compiled_parse(message: str):
+        role, _ = parsing.parse_role_args(message, ())
+        return role
+
+    print(f"{'impl':<10}{'parses/sec':>14}{'us/op':>10}{'parsed':>9}")
+    bench("legacy", lambda m: legacy_parse(m, logger), messages)
+    bench("compiled", compiled_parse, messages)
+
+
+if __name__ == "__main__":
+    main()
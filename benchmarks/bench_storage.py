@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+存储后端变更延迟基准测试
+
+对比 snapshot / journal / sqlite 三种后端在单条变更（不合并刷盘的最坏情况）下的写入延迟
+用法：python benchmarks/bench_storage.py [--ops 2000] [--groups 50]
+"""
+
+import argparse       # 命令行参数
+import random         # 随机生成变更序列
+import statistics     # 延迟统计
+import sys            # 路径处理
+import tempfile       # 临时数据目录
+import time           # 计时
+from pathlib import Path    # 路径处理
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import _stubs  # noqa: E402
+
+
+# 所有变更都落在同一个群的会话上
+SESSION = "qq:GroupMessage:0"
+
+
+def make_player(i: int) -> dict:
+    """生成一名测试玩家"""
+    return {
+        "qq_number": str(100000 + i),
+        "nickname": f"玩家{i}",
+        "character_id": f"char{i}",
+        "gender": "br" if i % 2 else "gr",
+        "job": "拳手",
+    }
+
+
+def make_records(ops: int, groups: int, seed: int = 7) -> list:
+    """生成与真实命令分布相近的变更序列：加入/退出/更换为主，偶尔创建"""
+    rng = random.Random(seed)
+    records = [{"op": "track_group", "group_id": f"qq:GroupMessage:{g}"} for g in range(groups)]
+    records.append({"op": "create", "session": SESSION, "player": make_player(0)})
+    for _ in range(ops):
+        i = rng.randrange(1, 6)
+        roll = rng.random()
+        if roll < 0.5:
+            records.append({"op": "join", "session": SESSION, "player": make_player(i)})
+        elif roll < 0.8:
+            records.append({"op": "quit", "session": SESSION, "qq_number": str(100000 + i)})
+        else:
+            records.append({"op": "replace", "session": SESSION, "qq_number": str(100000 + i),
+                            "character_id": f"alt{i}", "gender": "gr", "job": "法师"})
+    return records
+
+
+def apply(state: dict, record: dict) -> None:
+    """最小化的状态变更（与插件 _op_* 语义一致），保证 snapshot 后端写入真实大小的状态"""
+    op = record["op"]
+    if op == "track_group":
+        state["tracked_groups"].append(record["group_id"])
+        return
+    if op == "create":
+        state["sessions"][record["session"]] = {
+            "status": "recruiting", "captain": dict(record["player"]), "members": [dict(record["player"])],
+        }
+        return
+    session = state["sessions"][record["session"]]
+    members = session["members"]
+    if op == "join":
+        session["members"] = [p for p in members if p["qq_number"] != record["player"]["qq_number"]]
+        session["members"].append(dict(record["player"]))
+    elif op == "quit":
+        session["members"] = [p for p in members if p["qq_number"] != record["qq_number"]]
+    elif op == "replace":
+        for p in members:
+            if p["qq_number"] == record["qq_number"]:
+                p.update(character_id=record["character_id"], gender=record["gender"], job=record["job"])
+
+
+def run_backend(store, records: list) -> list:
+    """逐条执行 prepare + write，返回每条变更的耗时（秒）"""
+    state = {"sessions": {}, "tracked_groups": []}
+    latencies = []
+    for record in records:
+        apply(state, record)
+        start = time.perf_counter()
+        store.write(store.prepare([record], state))
+        latencies.append(time.perf_counter() - start)
+    store.close()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=2000, help="变更次数")
+    parser.add_argument("--groups", type=int, default=50, help="记录的群聊数量")
+    args = parser.parse_args()
+
+    storage = _stubs.load_module("storage")
+    records = make_records(args.ops, args.groups)
+    print(f"{'backend':<10}{'ops':>8}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}{'bytes':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        backends = [
+            storage.SnapshotStore(tmp / "snap.json", keep=3),
+            storage.JournalStore(tmp / "journal.json", tmp / "journal.log", compact_threshold=200, keep=3),
+            storage.SQLiteStore(tmp / "db.sqlite3"),
+        ]
+        for store in backends:
+            store.load()
+            latencies = sorted(run_backend(store, records))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{store.name:<10}{len(latencies):>8}"
+                  f"{statistics.mean(latencies) * 1e6:>12.1f}"
+                  f"{statistics.median(latencies) * 1e6:>12.1f}"
+                  f"{p99 * 1e6:>12.1f}"
+                  f"{store.bytes_written:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+命令混合负载基准测试
+
+在替身 Context / AstrBotConfig / StarTools.get_data_dir 和合成的 AstrMessageEvent 上实例化 APQPlugin，
+按接近真实的比例驱动 创建/加入/退出/查询/更换/我的APQ 命令，覆盖多个群聊和大量用户：
+- 命令按突发（burst）成批并发执行，模拟多个群同时刷屏，延迟包含等待会话锁的时间
+- 每种存储模式各跑一遍，报告 ops/sec、各命令与整体的 p50/p99 延迟，以及写盘字节数
+  （存储后端、历史归档和群聊登记统计的写入量，Linux 上另外给出 /proc/self/io 的 wchar 增量）
+- 报告刷盘次数和每条命令平均的刷盘次数、写盘字节数；默认合并窗口为 0（每轮事件循环刷盘一次），
+  整个运行跨越大量刷盘窗口，写盘量反映的是每次变更的实际开销，而不是少数几次整文件写入
+- 不需要网络，也不需要安装 AstrBot
+
+每种模式重复运行 --repeat 次，吞吐和延迟、写盘量、刷盘次数各取最好的一次，减少单次运行的抖动；
+可以把结果保存为 JSON，之后用 --baseline 对比，超过允许的退化比例时以非零状态退出，用于回归门禁
+
+用法：python benchmarks/bench_workload.py [--ops 5000] [--groups 20] [--users 300] [--burst 16] [--flush-ms 0] [--repeat 3]
+                                          [--modes snapshot,journal,sqlite] [--json out.json]
+                                          [--baseline base.json --max-regression 0.25]
+"""
+
+import argparse       # 命令行参数
+import asyncio        # 事件循环
+import json           # 结果输出
+import logging        # 关闭插件日志输出
+import random         # 生成命令序列
+import sys            # 路径处理与退出码
+import tempfile       # 临时数据目录
+import time           # 计时
+from pathlib import Path    # 路径处理
+from typing import Dict, List, Optional  # 类型提示
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import _stubs  # noqa: E402
+
+JOBS = ["拳手", "船长", "刀飞", "标飞", "法师", "主教", "火毒", "冰雷", "弓手", "弩手", "英雄", "圣骑", "黑骑"]
+
+# 命令比例：加入和查询最多，创建、退出、更换较少
+MIX = [("join", 0.40), ("query", 0.22), ("quit", 0.10), ("replace", 0.10), ("create", 0.10), ("my", 0.08)]
+
+
+def make_ops(count: int, groups: int, users: int, seed: int = 17) -> List[tuple]:
+    """生成命令序列
+
+    每个用户有一个常驻群（偶尔去别的群），角色ID随更换次数变化，保证同一用户前后一致
+
+    Returns:
+        List[tuple]: (命令, QQ号, 群号, 参数...)
+    """
+    rng = random.Random(seed)
+    home = {u: rng.randrange(groups) for u in range(users)}
+    version = {u: 0 for u in range(users)}
+    names, weights = zip(*MIX)
+    ops = []
+    for _ in range(count):
+        kind = rng.choices(names, weights)[0]
+        user = rng.randrange(users)
+        group = home[user] if rng.random() < 0.9 else rng.randrange(groups)
+        if kind == "replace":
+            version[user] += 1
+        char_id = f"c{user}v{version[user]}"
+        gender = rng.choice(("br", "gr", "新娘", "新郎"))
+        ops.append((kind, str(100000 + user), str(800000 + group), char_id, gender, rng.choice(JOBS)))
+    return ops
+
+
+def proc_wchar() -> Optional[int]:
+    """当前进程累计写入的字节数（Linux /proc/self/io 的 wchar），不可用时返回None"""
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """已排序样本的分位数"""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def dispatch(plugin, op: tuple) -> None:
+    """把一条合成命令交给对应的处理器"""
+    kind, uid, group, char_id, gender, job = op
+    event = _stubs.FakeEvent(uid, group=group)
+    if kind == "create":
+        await plugin.create_apq(event, char_id, gender, job)
+    elif kind == "join":
+        await plugin.join_apq(event, char_id, gender, job)
+    elif kind == "replace":
+        await plugin.replace_apq(event, char_id, gender, job)
+    elif kind == "quit":
+        await plugin.quit_apq(event)
+    elif kind == "my":
+        await plugin.my_apq(event)
+    else:
+        await plugin.query_apq(event)
+
+
+async def run_mode(main, mode: str, ops: List[tuple], burst: int, flush_ms: int) -> Dict[str, object]:
+    """在一种存储模式下跑完整个命令序列
+
+    Returns:
+        Dict[str, object]: 该模式的结果
+    """
+    latencies: Dict[str, List[float]] = {}
+
+    async def timed(op: tuple) -> None:
+        start = time.perf_counter()
+        await dispatch(plugin, op)
+        latencies.setdefault(op[0], []).append(time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _stubs.set_data_root(Path(tmp))
+        plugin = main.APQPlugin(_stubs.FakeContext(), main.AstrBotConfig({
+            "storage_mode": mode,
+            "flush_interval_ms": flush_ms,
+            "metrics_export_interval_seconds": 0,
+            # 测的是命令本身的开销，合成负载远超真实用户的频率，关闭限流
+            "rate_limit_user_per_minute": 0,
+            "rate_limit_group_per_minute": 0,
+        }))
+        wchar_before = proc_wchar()
+        start = time.perf_counter()
+        for i in range(0, len(ops), burst):
+            await asyncio.gather(*(timed(op) for op in ops[i:i + burst]))
+        elapsed = time.perf_counter() - start
+        # 等待后台广播，卸载时强制刷盘，写盘量包含最后一次刷盘
+        if plugin._background_tasks:
+            await asyncio.gather(*plugin._background_tasks)
+        await plugin.terminate()
+        wchar_after = proc_wchar()
+
+        everything = sorted(x for samples in latencies.values() for x in samples)
+        bytes_written = plugin._store.bytes_written + plugin.history.bytes_written + plugin.groups.bytes_written
+        flushes = plugin.persist_stats["flushes"]
+        result: Dict[str, object] = {
+            "mode": mode,
+            "ops": len(ops),
+            "burst": burst,
+            "flush_ms": flush_ms,
+            "seconds": elapsed,
+            "ops_per_sec": len(ops) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(everything, 0.50) * 1000,
+            "p99_ms": percentile(everything, 0.99) * 1000,
+            "bytes_written": bytes_written,
+            "bytes_per_op": bytes_written / len(ops) if ops else 0.0,
+            "wchar": (wchar_after - wchar_before) if wchar_before is not None and wchar_after is not None else None,
+            "flushes": flushes,
+            "flushes_per_op": flushes / len(ops) if ops else 0.0,
+            "commands": {},
+        }
+        for kind, samples in sorted(latencies.items()):
+            samples.sort()
+            result["commands"][kind] = {
+                "count": len(samples),
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+            }
+        return result
+
+
+def best_of(runs: List[Dict[str, object]]) -> Dict[str, object]:
+    """合并同一模式的多次运行：以最快的一次为准，各项指标取多次中最好的值
+
+    Args:
+        runs: 同一模式的多次结果
+    Returns:
+        Dict[str, object]: 合并后的结果
+    """
+    result = dict(max(runs, key=lambda r: r["ops_per_sec"]))
+    for key in ("p50_ms", "p99_ms", "bytes_written", "bytes_per_op", "flushes", "flushes_per_op"):
+        result[key] = min(r[key] for r in runs)
+    result["repeat"] = len(runs)
+    return result
+
+
+def print_result(result: Dict[str, object]) -> None:
+    """打印一种模式的结果"""
+    wchar = result["wchar"]
+    print(f"\n[{result['mode']}] best of {result['repeat']}: {result['ops']} ops in {result['seconds']:.2f}s  "
+          f"{result['ops_per_sec']:.0f} ops/s  p50 {result['p50_ms']:.3f}ms  p99 {result['p99_ms']:.3f}ms  "
+          f"bytes_written {result['bytes_written']} ({result['bytes_per_op']:.0f}/op)  "
+          f"wchar {wchar if wchar is not None else 'n/a'}  "
+          f"flushes {result['flushes']} ({result['flushes_per_op']:.3f}/op)")
+    print(f"  {'command':<10}{'count':>8}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for kind, row in result["commands"].items():
+        print(f"  {kind:<10}{row['count']:>8}{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}")
+
+
+def compare(results: List[Dict[str, object]], baseline_path: Path, tolerance: float) -> List[str]:
+    """与基线对比，返回超过允许退化比例的项
+
+    命令数、突发大小或合并窗口与基线不同时写盘量没有可比性，直接判为不通过；
+    每条命令的刷盘次数和写盘字节数同样参与门禁，合并失效（刷盘次数上升）也会被发现
+
+    Args:
+        results: 本次结果
+        baseline_path: 基线 JSON（之前用 --json 保存）
+        tolerance: 允许的退化比例（0.25 表示 25%）
+    Returns:
+        List[str]: 退化描述，为空表示通过
+    """
+    baseline = {r["mode"]: r for r in json.loads(baseline_path.read_text(encoding="utf-8"))}
+    failures = []
+    for result in results:
+        base = baseline.get(result["mode"])
+        if base is None:
+            continue
+        params = ("ops", "burst", "flush_ms")
+        if any(base.get(key) != result[key] for key in params):
+            failures.append(f"{result['mode']}: baseline was recorded with "
+                            + ", ".join(f"{key}={base.get(key)}" for key in params)
+                            + ", this run uses " + ", ".join(f"{key}={result[key]}" for key in params))
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            failures.append(f"{result['mode']}: ops/s {result['ops_per_sec']:.0f} < baseline {base['ops_per_sec']:.0f}")
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            failures.append(f"{result['mode']}: p99 {result['p99_ms']:.3f}ms > baseline {base['p99_ms']:.3f}ms")
+        if result["bytes_written"] > base["bytes_written"] * (1 + tolerance):
+            failures.append(f"{result['mode']}: bytes_written {result['bytes_written']} > "
+                            f"baseline {base['bytes_written']}")
+        if result["flushes_per_op"] > base["flushes_per_op"] * (1 + tolerance):
+            failures.append(f"{result['mode']}: flushes/op {result['flushes_per_op']:.3f} > "
+                            f"baseline {base['flushes_per_op']:.3f}")
+    return failures
+
+
+async def run(args) -> int:
+    main = _stubs.load_plugin()
+    logging.getLogger("astrbot").setLevel(logging.CRITICAL)
+    ops = make_ops(args.ops, args.groups, args.users, seed=args.seed)
+    results = []
+    for mode in args.modes.split(","):
+        runs = [await run_mode(main, mode, ops, args.burst, args.flush_ms) for _ in range(max(1, args.repeat))]
+        result = best_of(runs)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.baseline:
+        failures = compare(results, Path(args.baseline), args.max_regression)
+        for line in failures:
+            print(f"REGRESSION {line}")
+        return 1 if failures else 0
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=5000, help="命令总数")
+    parser.add_argument("--groups", type=int, default=20, help="群聊数量")
+    parser.add_argument("--users", type=int, default=300, help="用户数量")
+    parser.add_argument("--burst", type=int, default=16, help="每批并发执行的命令数")
+    parser.add_argument("--flush-ms", type=int, default=0,
+                        help="flush_interval_ms 配置（默认0：运行跨越大量刷盘窗口，写盘量才有意义）")
+    parser.add_argument("--repeat", type=int, default=3, help="每种模式重复运行的次数")
+    parser.add_argument("--modes", default="snapshot,journal,sqlite", help="逗号分隔的存储模式")
+    parser.add_argument("--seed", type=int, default=17, help="随机种子")
+    parser.add_argument("--json", help="把结果保存为 JSON")
+    parser.add_argument("--baseline", help="对比的基线 JSON，退化超过 --max-regression 时退出码为1")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="允许的退化比例")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
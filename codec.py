@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件 JSON 编解码
+
+数据库快照、追加日志、历史归档、群聊登记、发件箱和出勤统计的编解码都经过这里，
+按已安装的库自动选择最快的实现：orjson > msgspec > 标准库 json
+- dumps 输出 UTF-8 字节（中文不转义），默认为紧凑格式（无缩进、无多余空格），
+  pretty=True 时缩进两格，供人工查看的导出使用
+- loads 接受 str 或 bytes，解析失败统一抛出 ValueError（与 json.loads 一致）
+- 内存中的模型对象（Player、Session）按 to_dict 编码
+- 各实现读写的都是标准 JSON，切换实现或在没有安装加速库的机器上打开数据文件都不受影响
+"""
+
+import json           # 标准库实现（总是可用）
+from typing import Any, Callable, Dict, List, Mapping, Union  # 类型提示
+
+try:
+    import orjson     # 可选：最快的实现
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec    # 可选：次快的实现
+except ImportError:
+    msgspec = None
+
+
+def _plain(obj: Any) -> Any:
+    """编码钩子：内存中的模型对象（Player、Session）按 to_dict 转为持久化格式，
+    实现不直接支持的映射类型（如统计中的 Counter）转为普通字典"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_dict()
+
+
+def _json_dumps(obj: Any, pretty: bool) -> bytes:
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=_plain).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_plain).encode("utf-8")
+
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    return json.loads(data)
+
+
+def _make_orjson() -> Dict[str, Callable]:
+    # 非字符串键按标准库的方式转成字符串，而不是报错
+    compact = orjson.OPT_NON_STR_KEYS
+    pretty = compact | orjson.OPT_INDENT_2
+
+    def dumps(obj: Any, indent: bool) -> bytes:
+        return orjson.dumps(obj, default=_plain, option=pretty if indent else compact)
+
+    # orjson.JSONDecodeError 是 ValueError 的子类
+    return {"dumps": dumps, "loads": orjson.loads}
+
+
+def _make_msgspec() -> Dict[str, Callable]:
+    encoder = msgspec.json.Encoder(enc_hook=_plain)
+    decoder = msgspec.json.Decoder()
+
+    def dumps(obj: Any, indent: bool) -> bytes:
+        data = encoder.encode(obj)
+        return msgspec.json.format(data, indent=2) if indent else data
+
+    def loads(data: Union[bytes, str]) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as exc:
+            raise ValueError(str(exc)) from exc
+
+    return {"dumps": dumps, "loads": loads}
+
+
+# 已安装的实现，按速度从快到慢排列
+_BACKENDS: Dict[str, Callable[[], Dict[str, Callable]]] = {}
+if orjson is not None:
+    _BACKENDS["orjson"] = _make_orjson
+if msgspec is not None:
+    _BACKENDS["msgspec"] = _make_msgspec
+_BACKENDS["json"] = lambda: {"dumps": _json_dumps, "loads": _json_loads}
+
+_active: Dict[str, Any] = {}
+
+
+def available() -> List[str]:
+    """已安装的实现名称（按速度从快到慢）
+
+    Returns:
+        List[str]: 例如 ["orjson", "json"]
+    """
+    return list(_BACKENDS)
+
+
+def select(name: str = "auto") -> str:
+    """选择使用的实现
+
+    Args:
+        name: orjson / msgspec / json，auto 或未安装的实现会使用最快的已安装实现
+    Returns:
+        str: 实际使用的实现名称
+    """
+    if name not in _BACKENDS:
+        name = next(iter(_BACKENDS))
+    _active.update(_BACKENDS[name](), name=name)
+    return name
+
+
+def backend() -> str:
+    """当前使用的实现名称"""
+    return _active["name"]
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """编码为 UTF-8 JSON
+
+    Args:
+        obj: 要编码的对象
+        pretty: 是否缩进两格（默认紧凑格式）
+    Returns:
+        bytes: JSON 字节
+    """
+    return _active["dumps"](obj, pretty)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """解析 JSON
+
+    Args:
+        data: JSON 文本或 UTF-8 字节
+    Returns:
+        Any: 解析结果
+    Raises:
+        ValueError: 内容不是合法的 JSON
+    """
+    return _active["loads"](data)
+
+
+select()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件群聊登记
+
+记录使用过APQ命令的群聊（满员广播的目标）及每个群最后一次使用的时间：
+- 内存中是按首次登记顺序排列的 群聊ID -> 最后活跃时间 字典，去重和刷新都是 O(1)
+- 保存在数据目录的 groups.jsonl 中，只追加、不重写整个数据库：
+  新群登记、活跃时间刷新、移除各追加一行；活跃时间只在距上次落盘超过 resolution 秒时才追加，
+  每条命令都会经过登记，但绝大多数调用不产生任何写入
+- 文件中的行数远多于登记的群时，下一次写入改为原子重写整个文件，每个群一行
+- 超过 ttl 未使用的群从广播目标中移除，避免向已解散或已退出的群发送
+"""
+
+import logging        # 日志
+import os             # 文件同步
+from pathlib import Path    # 路径处理
+from typing import Dict, Iterable, Iterator, List, Optional  # 类型提示
+
+from . import codec   # JSON 编解码
+from .storage import atomic_write_text  # 原子写入
+
+
+def _line(record: Dict[str, object]) -> str:
+    """编码一行记录"""
+    return codec.dumps(record).decode("utf-8") + "\n"
+
+
+class GroupRegistry:
+    """群聊登记表"""
+
+    def __init__(self, path: Path, resolution: float = 3600.0, log: Optional[logging.Logger] = None):
+        """初始化登记表
+
+        Args:
+            path: 登记文件路径（groups.jsonl）
+            resolution: 活跃时间的落盘精度（秒），距上次落盘不足该时间的刷新只更新内存
+            log: 日志记录器，默认使用模块级 logger
+        """
+        self.path = path
+        self.resolution = max(0.0, float(resolution))
+        self.log = log or logging.getLogger(__name__)
+        self.last_seen: Dict[str, float] = {}   # 群聊ID -> 最后活跃时间（按首次登记顺序）
+        self._persisted: Dict[str, float] = {}  # 群聊ID -> 已落盘的活跃时间
+        self._pending: List[str] = []           # 尚未写入文件的行
+        self.lines = 0                          # 文件中的行数（判断是否需要压缩）
+        self.bytes_written = 0
+
+    def __contains__(self, group_id: str) -> bool:
+        return group_id in self.last_seen
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.last_seen)
+
+    def __len__(self) -> int:
+        return len(self.last_seen)
+
+    def load(self) -> bool:
+        """从文件恢复登记表
+
+        最后一行可能因崩溃而写了一半，解析失败的行会被跳过
+
+        Returns:
+            bool: 文件存在时返回True；不存在时需要由旧数据迁移（见 seed）
+        """
+        if not self.path.exists():
+            return False
+        with self.path.open("rb") as fp:
+            for lineno, line in enumerate(fp, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = codec.loads(line)
+                except ValueError:
+                    self.log.warning("apq: groups line %d is corrupted, skipped", lineno)
+                    continue
+                self.lines += 1
+                if record.get("clear"):
+                    self.last_seen.clear()
+                elif record.get("drop"):
+                    self.last_seen.pop(record.get("g"), None)
+                elif record.get("g"):
+                    self.last_seen[record["g"]] = float(record.get("t", 0))
+        self._persisted = dict(self.last_seen)
+        return True
+
+    def seed(self, group_ids: Iterable[str], now: float) -> None:
+        """由旧版数据库中的群聊ID列表迁移（活跃时间按迁移时间计算）
+
+        Args:
+            group_ids: 按登记顺序排列的群聊ID
+            now: 当前时间戳
+        """
+        for group_id in group_ids:
+            self.touch(group_id, now)
+
+    def touch(self, group_id: str, now: float) -> bool:
+        """登记群聊或刷新其活跃时间
+
+        Args:
+            group_id: 群聊ID
+            now: 当前时间戳
+        Returns:
+            bool: 新登记的群返回True
+        """
+        new = group_id not in self.last_seen
+        self.last_seen[group_id] = now
+        if new or now - self._persisted.get(group_id, 0.0) >= self.resolution:
+            self._persisted[group_id] = now
+            self._pending.append(_line({"g": group_id, "t": int(now)}))
+        return new
+
+    def evict(self, now: float, ttl: float) -> List[str]:
+        """移除超过 ttl 秒未使用的群
+
+        Args:
+            now: 当前时间戳
+            ttl: 不活跃时长（秒），0 表示不移除
+        Returns:
+            List[str]: 被移除的群聊ID
+        """
+        if ttl <= 0:
+            return []
+        stale = [g for g, seen in self.last_seen.items() if now - seen >= ttl]
+        for group_id in stale:
+            del self.last_seen[group_id]
+            self._persisted.pop(group_id, None)
+            self._pending.append(_line({"g": group_id, "drop": True}))
+        return stale
+
+    def clear(self) -> None:
+        """清空登记表（全部重置时调用）"""
+        self.last_seen.clear()
+        self._persisted.clear()
+        self._pending.append(_line({"clear": True}))
+
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未写入文件的变更"""
+        return bool(self._pending)
+
+    def drain(self) -> Optional[tuple]:
+        """在事件循环线程上取出待写入的内容
+
+        文件行数超过登记数的两倍（至少 64 行）时改为编码整张表，由 write 压缩重写
+
+        Returns:
+            Optional[tuple]: (待追加的行, 压缩后的全文或None)，没有待写内容时返回None
+        """
+        if not self._pending:
+            return None
+        lines, self._pending = self._pending, []
+        compact_text = None
+        if self.lines + len(lines) > max(64, 2 * len(self.last_seen)):
+            self._persisted = dict(self.last_seen)
+            compact_text = "".join(_line({"g": g, "t": int(t)}) for g, t in self.last_seen.items())
+        return lines, compact_text
+
+    def write(self, payload: tuple) -> None:
+        """写入 drain 的结果（可在 I/O 线程中调用）
+
+        Args:
+            payload: drain 的返回值
+        """
+        lines, compact_text = payload
+        if compact_text is not None:
+            self.bytes_written += atomic_write_text(self.path, compact_text)
+            self.lines = compact_text.count("\n")
+            return
+        data = "".join(lines).encode("utf-8")
+        with self.path.open("ab") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self.lines += len(lines)
+        self.bytes_written += len(data)
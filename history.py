@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件历史归档
+
+每一次结束的APQ（满员发车、匹配成队、取消、超时）追加一条记录到历史归档，
+保存在数据目录的 history/ 下：
+- 按月分段：history/YYYY-MM.jsonl.gz，每行一条紧凑 JSON
+- 每条记录单独压缩成一个 gzip 成员追加到段尾，文件只追加、不重写；
+  多成员 gzip 可以被标准的 gzip 模块当作一个连续的流读取
+- 按时间范围扫描时只打开范围内的月份，逐行解压，不把整个文件读进内存；
+  段内记录按追加顺序（即时间顺序）排列，超过范围终点即停止
+- 进程崩溃可能在段尾留下写了一半的 gzip 成员，每个段在本进程第一次追加前
+  截掉这部分，保证之后追加的记录仍然可读
+"""
+
+import gzip           # 读取多成员 gzip
+import logging        # 日志
+import os             # 文件同步
+import time           # 时间戳
+import uuid           # 记录ID
+import zlib           # 校验段尾
+from collections import deque  # 保留最近的记录
+from pathlib import Path    # 路径处理
+from typing import Any, Dict, Iterator, List, Optional, Tuple  # 类型提示
+
+from . import codec   # JSON 编解码
+
+# 归档记录的结局类型
+OUTCOMES = ("completed", "matched", "cancelled", "expired")
+
+# 检查段尾时每次读取的字节数：单条记录压缩后只有几百字节，
+# 块不宜过大，否则每个成员结束时复制的 unused_data 也随之变大
+_SCAN_CHUNK = 4096
+
+
+def segment_key(ts: float) -> str:
+    """时间戳所属的月份段（本地时间）
+
+    Args:
+        ts: Unix 时间戳
+    Returns:
+        str: YYYY-MM
+    """
+    return time.strftime("%Y-%m", time.localtime(ts))
+
+
+def _month_range(start: str, end: str) -> Iterator[str]:
+    """依次产生 start 到 end（含）之间的月份段"""
+    year, month = int(start[:4]), int(start[5:7])
+    while f"{year:04d}-{month:02d}" <= end:
+        yield f"{year:04d}-{month:02d}"
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def _valid_length(path: Path) -> int:
+    """段文件中完整 gzip 成员的总长度（之后的字节是写了一半的成员）
+
+    按小块顺序读取并送入解码器，不把整个文件读进内存；一个成员结束时，
+    解码器多读的部分（unused_data，不超过一块）直接作为下一个成员的输入，
+    每个字节只被读取和解压一次，总耗时与文件大小成正比
+
+    Args:
+        path: 段文件路径
+    Returns:
+        int: 可读部分的字节数
+    """
+    offset = 0    # 已确认完整的成员的总长度
+    fed = 0       # 已送入当前成员解码器的字节数
+    decoder = zlib.decompressobj(wbits=31)  # 31: 只接受 gzip 格式
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_SCAN_CHUNK), b""):
+            while chunk:
+                try:
+                    decoder.decompress(chunk)
+                except zlib.error:
+                    return offset
+                if not decoder.eof:
+                    fed += len(chunk)
+                    break
+                # 当前成员完整，剩余字节属于下一个成员
+                rest = decoder.unused_data
+                offset += fed + len(chunk) - len(rest)
+                fed = 0
+                decoder = zlib.decompressobj(wbits=31)
+                chunk = rest
+    return offset
+
+
+class HistoryArchive:
+    """按月分段、只追加的压缩历史归档"""
+
+    def __init__(self, directory: Path, log: Optional[logging.Logger] = None):
+        """初始化归档
+
+        Args:
+            directory: 归档目录（history/）
+            log: 日志记录器
+        """
+        self.directory = directory
+        self.log = log or logging.getLogger(__name__)
+        self._checked: set = set()  # 本进程已检查过段尾的月份段
+        self.bytes_written = 0      # 累计写入的压缩字节数
+
+    def segment_path(self, key: str) -> Path:
+        """月份段的文件路径
+
+        Args:
+            key: YYYY-MM
+        Returns:
+            Path: 段文件路径
+        """
+        return self.directory / f"{key}.jsonl.gz"
+
+    @staticmethod
+    def make_record(outcome: str, session_id: str, members: List[Dict[str, Any]],
+                    captain: Optional[str] = None, started_at: Optional[int] = None,
+                    ts: Optional[int] = None) -> Dict[str, Any]:
+        """构建一条归档记录（在事件循环线程上调用，复制成员信息）
+
+        Args:
+            outcome: 结局，取值见 OUTCOMES
+            session_id: 会话ID
+            members: 队伍成员
+            captain: 队长QQ号，匹配成队时没有队长
+            started_at: 召集开始时间
+            ts: 结束时间，默认取当前时间
+        Returns:
+            Dict[str, Any]: 归档记录
+        """
+        return {
+            "id": uuid.uuid4().hex[:12],  # 同一秒内结束的多场也能区分
+            "ts": int(time.time()) if ts is None else ts,
+            "outcome": outcome,
+            "session": session_id,
+            "started_at": started_at,
+            "captain": captain,
+            "members": [
+                {k: p.get(k) for k in ("qq_number", "nickname", "character_id", "gender", "job")}
+                for p in members
+            ],
+        }
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录到所属月份段（在 I/O 线程中调用）
+
+        Args:
+            record: make_record 的结果
+        """
+        key = segment_key(record["ts"])
+        path = self.segment_path(key)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if key not in self._checked:
+            self._repair(path)
+            self._checked.add(key)
+        blob = gzip.compress(codec.dumps(record) + b"\n", mtime=0)
+        # 一条记录一次写入，崩溃时最多留下一个不完整的成员
+        with open(path, "ab") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        self.bytes_written += len(blob)
+
+    def _repair(self, path: Path) -> None:
+        """截掉段尾写了一半的 gzip 成员
+
+        Args:
+            path: 段文件路径
+        """
+        if not path.exists():
+            return
+        valid = _valid_length(path)
+        size = path.stat().st_size
+        if valid < size:
+            self.log.warning("apq: history segment %s has %d trailing corrupt bytes, truncating",
+                             path.name, size - valid)
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+
+    def segments(self) -> List[str]:
+        """已有的月份段（按时间排序）
+
+        Returns:
+            List[str]: YYYY-MM 列表
+        """
+        if not self.directory.exists():
+            return []
+        return sorted(p.name[:7] for p in self.directory.glob("*.jsonl.gz"))
+
+    def scan(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """按时间顺序流式读取 [start, end] 范围内的记录
+
+        Args:
+            start: 起始时间戳（含），默认不限
+            end: 结束时间戳（含），默认不限
+        Yields:
+            Dict[str, Any]: 归档记录
+        """
+        keys = self.segments()
+        if not keys:
+            return
+        first = segment_key(start) if start is not None else keys[0]
+        last = segment_key(end) if end is not None else keys[-1]
+        for key in _month_range(max(first, keys[0]), min(last, keys[-1])):
+            path = self.segment_path(key)
+            if not path.exists():
+                continue
+            for record in self._read_segment(path):
+                if start is not None and record["ts"] < start:
+                    continue
+                if end is not None and record["ts"] > end:
+                    return
+                yield record
+
+    def _read_segment(self, path: Path) -> Iterator[Dict[str, Any]]:
+        """逐行解压读取一个段，遇到不完整的段尾时停止
+
+        Args:
+            path: 段文件路径
+        Yields:
+            Dict[str, Any]: 归档记录
+        """
+        try:
+            with gzip.open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        yield codec.loads(line)
+        except (EOFError, OSError, zlib.error, ValueError) as exc:
+            self.log.warning("apq: history segment %s is truncated: %s", path.name, exc)
+
+    def recent(self, since: float, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """读取 since 之后最近的若干条记录
+
+        Args:
+            since: 起始时间戳
+            limit: 最多返回的条数
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: (最近的记录（新的在前）, 范围内的记录总数)
+        """
+        window: "deque[Dict[str, Any]]" = deque(maxlen=max(1, limit))
+        total = 0
+        for record in self.scan(start=since):
+            total += 1
+            window.append(record)
+        return list(reversed(window)), total
@@ -15,17 +15,76 @@ MapleRoyals APQ 组队插件
 版本：1.0.0
 """
 
-import json           # JSON数据处理
+import asyncio        # 异步任务，用于后台刷盘
+import math           # 限流等待时间取整
 import traceback      # 异常堆栈跟踪
-import re             # 正则表达式，用于命令解析
+import time           # 时间戳，用于日志记录
+from collections import Counter  # 出勤计数
+from concurrent.futures import ThreadPoolExecutor  # 文件I/O线程池
 from pathlib import Path    # 路径处理
-from typing import Dict, List, Optional, Any, Tuple  # 类型提示
+from types import MappingProxyType  # 只读字典视图
+from typing import Callable, Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Any, Tuple  # 类型提示
 
 # AstrBot框架核心模块
 from astrbot.api import AstrBotConfig, logger      # 配置和日志模块
 from astrbot.api.event import AstrMessageEvent, filter  # 事件处理和过滤器
 from astrbot.api.star import Context, Star, StarTools, register  # 插件核心框架
 
+from . import codec   # JSON 编解码
+from .groups import GroupRegistry  # 群聊登记
+from .history import HistoryArchive  # 历史归档
+from .matchmaking import CompositionRules, MatchQueue, Waitlist  # 匹配队列、候补名单与队伍组成规则
+from .metrics import Metrics, instrument  # 运行指标
+from .migrations import SCHEMA_VERSION  # 状态版本
+from .models import Player, Session  # 玩家与会话模型
+from .outbox import Outbox  # 广播发件箱
+from .parsing import PARSE_GENDER, PARSE_USAGE, Role, parse_role_args  # 角色参数解析
+from .ratelimit import TokenBucketLimiter, rate_limited  # 命令限流
+from .stats import AttendanceStats  # 出勤统计
+from .storage import (  # 持久化存储层
+    DEFAULT_SESSION,
+    JournalStore,
+    SnapshotStore,
+    SQLiteStore,
+    StorageBackend,
+    atomic_write_text,
+    encode_snapshot,
+)
+from .timers import TimerHeap  # 召集/报名过期定时器
+
+
+class BroadcastResult(NamedTuple):
+    """一次广播的汇总结果"""
+    total: int                      # 目标群聊数
+    succeeded: Tuple[str, ...]      # 发送成功的群聊
+    failed: Dict[str, str]          # 发送失败的群聊 -> 错误描述
+
+
+class RosterView(NamedTuple):
+    """会话的不可变只读视图
+
+    每次变更后重新发布，只读命令直接读取当前视图而无需获取会话锁
+    """
+    status: str                                  # 活动状态
+    captain: Mapping[str, Any]                   # 队长信息（只读）
+    members: Tuple[Mapping[str, Any], ...]       # 成员列表（只读）
+    members_by_qq: Mapping[str, Mapping[str, Any]]  # QQ号 -> 成员（只读）
+    waitlist: Tuple[Mapping[str, Any], ...] = ()  # 候补名单（只读）
+    version: int = 0                             # 视图版本，每次发布递增，用作渲染缓存的键
+    br_count: int = 0                            # 成员中的 br 人数（增量维护）
+    gr_count: int = 0                            # 成员中的 gr 人数（增量维护）
+
+
+class RosterText(NamedTuple):
+    """按视图版本缓存的名单文本"""
+    version: int     # 生成时的视图版本
+    members: str     # 编号的成员列表
+    status: str      # /查询APQ 的正文（不含匹配队列人数）
+
+
+# 尚无会话时使用的空视图
+EMPTY_VIEW = RosterView("idle", MappingProxyType({}), (), MappingProxyType({}))
+
 
 @register(
     "astrbot_plugin_mapleroyalsapq",  # 插件唯一标识符
@@ -43,6 +102,10 @@ class APQPlugin(Star):
 
     # 类常量定义
     TEAM_SIZE = 6  # APQ 每队最多6人
+    # 权限等级：普通用户 < 会话管理员（moderator_ids）< 管理员（admin_ids 超级管理员或群管理员）
+    ROLE_MEMBER = 0
+    ROLE_MODERATOR = 1
+    ROLE_ADMIN = 2
 
     def __init__(self, context: Context, config: AstrBotConfig):
         """插件初始化方法
@@ -53,61 +116,523 @@ class APQPlugin(Star):
         """
         super().__init__(context)  # 调用父类初始化
         self.config = config       # 保存配置对象
+        # 运行指标：每条命令的调用/异常次数和耗时分布，刷盘和广播的耗时分布
+        self.metrics = Metrics()
+        # 调试日志：记录命令参数解析等热路径细节，默认关闭
+        self.debug_log = bool(self.config.get("debug_log", False))
+        # 命令限流：按QQ号和按群聊的令牌桶，在处理器做任何事情之前检查，超级管理员不受限制
+        # 速率为每分钟的命令数（0 表示不限流），桶数超过上限时淘汰最久未使用的
+        max_buckets = int(self.config.get("rate_limit_max_buckets", 10000) or 10000)
+        self.user_limiter = TokenBucketLimiter(
+            rate=float(self.config.get("rate_limit_user_per_minute", 20) or 0) / 60,
+            burst=float(self.config.get("rate_limit_user_burst", 5) or 1),
+            capacity=max_buckets,
+        )
+        self.group_limiter = TokenBucketLimiter(
+            rate=float(self.config.get("rate_limit_group_per_minute", 120) or 0) / 60,
+            burst=float(self.config.get("rate_limit_group_burst", 30) or 1),
+            capacity=max_buckets,
+        )
+        # 权限表：超级管理员和会话管理员的QQ号集合，只在这里构建一次；
+        # AstrBot 重新加载配置时会重新创建插件实例，之后的权限检查不再读取配置列表
+        self._admin_ids: FrozenSet[str] = self._id_set("admin_ids")
+        self._moderator_ids: FrozenSet[str] = self._id_set("moderator_ids")
 
         # 设置数据存储目录
         # 使用 StarTools 获取插件专用的数据目录
         self.data_dir = StarTools.get_data_dir("mapleroyalsapq")
         self.data_dir.mkdir(parents=True, exist_ok=True)  # 创建目录（如果不存在）
         self.database_path = self.data_dir / "database.json"  # 数据库文件路径
+        self.journal_path = self.data_dir / "database.journal"  # 追加日志文件路径
+        self.sqlite_path = self.data_dir / "database.sqlite3"   # SQLite 数据库路径
+
+        # 存储模式：snapshot(每次变更重写整个文件) / journal(追加日志 + 定期压缩) / sqlite(WAL模式数据库)
+        self.storage_mode = str(self.config.get("storage_mode", "snapshot") or "snapshot")
+        # 保留的历史快照份数，最新快照损坏时依次回退
+        self.snapshot_keep = max(0, int(self.config.get("snapshot_keep", 3) or 0))
+        # JSON 编解码：auto 时按已安装的库选择 orjson > msgspec > 标准库 json，数据文件为紧凑格式
+        self.json_backend = codec.select(str(self.config.get("json_backend", "auto") or "auto"))
+        logger.info(f"apq: JSON 编解码使用 {self.json_backend}")
+        self._store: StorageBackend = self._create_store()
+
+        # 延迟合并刷盘：变更先标记为脏，每个窗口最多写一次盘
+        self.flush_interval_ms = max(0, int(self.config.get("flush_interval_ms", 200) or 0))
+        self._pending_records: List[Dict[str, Any]] = []   # 尚未落盘的变更记录
+        self._flush_task: Optional[asyncio.Task] = None     # 待执行的刷盘任务
+        # 单线程执行器：保证多次刷盘按提交顺序执行
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="apq-io")
+        # 持久化统计：变更次数 / 实际刷盘次数 / 被合并到已有刷盘中的变更次数
+        self.persist_stats: Dict[str, int] = {"mutations": 0, "flushes": 0, "coalesced": 0}
 
         # 初始化状态数据结构
         # 这是插件的核心数据结构，用于存储所有APQ活动状态
+        # 每个群聊一个独立的会话（私聊使用 DEFAULT_SESSION），各自拥有队长、名单和生命周期
         self.state: Dict[str, Any] = {
-            "status": "idle",      # 活动状态：idle(空闲)/recruiting(召集中)
-            "captain": {},         # 队长信息
-            "members": [],         # 参与者信息列表（包含队长，最多6人）
-            "tracked_groups": [],  # 记录使用APQ命令的群聊ID列表（去重）
+            "sessions": {},        # 会话ID -> Session（持久化为 {"status", "captain", "members", "waitlist", "created_at"}）
+            "queues": {},          # 会话ID -> 匹配队列中的 Player 列表（按入队顺序）
+            "tracked_groups": [],  # 旧版记录的群聊ID列表，只在首次启动时迁移到 groups.jsonl
         }
+
+        # 匹配队列：群里没有召集中的APQ时，加入的玩家排队，能组成符合规则的队伍时自动成队
+        self.matchmaking_enabled = bool(self.config.get("matchmaking_enabled", True))
+        # 队伍组成规则：每队 br/gr 人数上下限和同一职业人数上限（0 表示不限），
+        # 匹配队列成队、加入和更换角色时都会检查，避免出现全 br 或全 gr 的队伍
+        # 配置项可能存在但为空（null 或空字符串），此时使用默认值；0 是有效的人数限制，不能用 or 回退
+        def party_limit(key: str, default: int) -> int:
+            value = self.config.get(key)
+            return default if value is None or value == "" else int(value)
+
+        self.composition = CompositionRules(
+            team_size=self.TEAM_SIZE,
+            min_br=party_limit("party_min_br", 1),
+            max_br=party_limit("party_max_br", self.TEAM_SIZE - 1),
+            min_gr=party_limit("party_min_gr", 1),
+            max_gr=party_limit("party_max_gr", self.TEAM_SIZE - 1),
+            max_per_job=int(self.config.get("party_max_per_job", 0) or 0),
+        )
+        if not self.composition.splits():
+            logger.warning("apq: 队伍组成规则的 br/gr 人数限制无法同时满足，已忽略")
+            self.composition = CompositionRules(team_size=self.TEAM_SIZE, max_per_job=self.composition.max_per_job)
+
+        # 广播并发度与单群发送超时
+        self.broadcast_concurrency = max(1, int(self.config.get("broadcast_concurrency", 8) or 1))
+        self.broadcast_timeout = float(self.config.get("broadcast_timeout_seconds", 10) or 10)
+        self._background_tasks: set = set()  # 后台任务（如广播），保留引用防止被回收
+
+        # 广播发件箱：发送失败的投递持久化到 outbox.json，后台按指数退避重试
+        self.outbox = Outbox(
+            self.data_dir / "outbox.json",
+            max_attempts=int(self.config.get("outbox_max_attempts", 8) or 8),
+            base_delay=float(self.config.get("outbox_base_delay_seconds", 5) or 5),
+            max_delay=float(self.config.get("outbox_max_delay_seconds", 600) or 600),
+        )
+        self._outbox_task: Optional[asyncio.Task] = None   # 发件箱重试任务
+        self._outbox_wakeup: Optional[asyncio.Event] = None  # 有新投递时唤醒重试任务
+        try:
+            self.outbox.load()
+        except Exception as exc:
+            logger.error("apq: load outbox failed: %s", exc)
+            logger.error(traceback.format_exc())
+
+        # 并发控制：每个会话一把锁，所有变更命令持锁执行；只读命令读取不可变视图
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._views: Dict[str, RosterView] = {}  # 会话ID -> 只读视图
+        self._touched_sessions: set = set()       # 本次变更涉及的会话，变更后重新发布视图
+        self._view_version = 0                    # 视图版本计数器，只在发布视图（即变更）时递增
+        self._roster_text: Dict[str, RosterText] = {}  # 会话ID -> 名单文本缓存，重复查询直接返回
+        self._gender_counts: Dict[str, Counter] = {}    # 会话ID -> 成员的 br/gr 人数（增量维护）
+
+        # 跨会话的成员索引（由所有变更路径同步维护）：
+        # QQ号 -> 成员，规范化角色ID -> 成员（都包含排队中的玩家），
+        # QQ号 -> 所在会话ID，QQ号 -> 排队所在的会话ID
+        self._members_by_qq: Dict[str, Player] = {}
+        self._members_by_char: Dict[str, Player] = {}
+        self._member_session: Dict[str, str] = {}
+        self._queue_session: Dict[str, str] = {}
+        self._matchers: Dict[str, MatchQueue] = {}  # 会话ID -> 匹配队列
+        # 候补名单：QQ号 -> 候补所在的会话ID，会话ID -> 候补名单
+        self._waitlist_session: Dict[str, str] = {}
+        self._waitlists: Dict[str, Waitlist] = {}
+        self._vacated: set = set()  # 有成员离开（或更换角色）的会话，等待候补转正
+
+        # 过期：会话创建后超过 session_ttl_minutes 仍未满员则自动取消，
+        # 非队长的报名（成员、候补、排队）超过 member_timeout_minutes 仍未成队则自动移除，0 表示不过期
+        self.session_ttl = max(0, int(self.config.get("session_ttl_minutes", 120) or 0)) * 60
+        self.member_timeout = max(0, int(self.config.get("member_timeout_minutes", 0) or 0)) * 60
+        # 过期通知发到所有记录的群聊（默认只通知会话所在的群）
+        self.expiry_broadcast = bool(self.config.get("expiry_broadcast", False))
+        # 所有定时器共用一个堆，由单个后台任务驱动
+        self._timers = TimerHeap()
+        self._expiry_task: Optional[asyncio.Task] = None    # 过期处理任务
+        self._expiry_wakeup: Optional[asyncio.Event] = None  # 有更早的定时器时唤醒过期任务
+        # 旧数据没有时间戳，按本次启动时间计算过期，避免升级后立即过期
+        self._started_at = int(time.time())
+
+        # 历史归档：每一次结束的APQ（发车、成队、取消、超时）追加到 history/YYYY-MM.jsonl.gz
+        self.history_enabled = bool(self.config.get("history_enabled", True))
+        self.history = HistoryArchive(self.data_dir / "history", log=logger)
+        # 出勤统计：每场结束时增量更新，保存在 stats.json，缺失或损坏时由历史归档重建
+        self.stats = AttendanceStats(
+            self.data_dir / "stats.json",
+            retention_days=int(self.config.get("stats_retention_days", 90) or 90),
+        )
+        self._load_stats()
+
+        # 定期把指标以 Prometheus 文本格式写入 metrics.prom，0 表示不导出
+        self.metrics_path = self.data_dir / "metrics.prom"
+        self.metrics_export_interval = float(self.config.get("metrics_export_interval_seconds", 60) or 0)
+        self._metrics_task: Optional[asyncio.Task] = None
         self._load_database()  # 从文件加载历史数据
 
+        # 群聊登记：满员广播的目标群聊及最后活跃时间，保存在 groups.jsonl（只追加，不重写数据库）
+        # 超过 group_ttl_days 天没有使用APQ命令的群不再作为广播目标，0 表示不移除
+        self.group_ttl = max(0.0, float(self.config.get("group_ttl_days", 30) or 0)) * 86400
+        self.groups = GroupRegistry(self.data_dir / "groups.jsonl", log=logger)
+        self._load_groups()
+
+    def _create_store(self) -> StorageBackend:
+        """根据 storage_mode 创建存储后端
+
+        Returns:
+            StorageBackend: 存储后端实例，未知模式回退为快照存储
+        """
+        if self.storage_mode == "journal":
+            return JournalStore(
+                self.database_path,
+                self.journal_path,
+                compact_threshold=int(self.config.get("journal_compact_threshold", 200) or 200),
+                keep=self.snapshot_keep,
+                log=logger,
+            )
+        if self.storage_mode == "sqlite":
+            # 首次启动时会把已有的 database.json 一次性迁移进数据库
+            return SQLiteStore(self.sqlite_path, legacy_json_path=self.database_path, log=logger)
+        if self.storage_mode != "snapshot":
+            logger.warning(f"apq: 未知的存储模式 {self.storage_mode}，使用 snapshot")
+            self.storage_mode = "snapshot"
+        return SnapshotStore(self.database_path, keep=self.snapshot_keep, log=logger)
+
     def _load_database(self) -> None:
-        """从 database.json 加载数据
+        """从存储后端加载数据
         
         在插件启动时调用，用于恢复上次运行时的数据状态
-        如果文件不存在或格式错误，则使用默认的空状态
+        快照格式错误或无法迁移时回退到历史快照，都不可用时使用默认的空状态
+        旧版本的快照由存储层升级到当前版本并校验，升级后立即写回
+        日志模式下还会重放快照之后的变更，并把日志压缩回快照
         """
-        # 检查数据库文件是否存在
-        if not self.database_path.exists():
-            return  # 文件不存在，使用默认空状态
-
         try:
-            # 读取并解析JSON文件
-            data = json.loads(self.database_path.read_text(encoding="utf-8"))
-            # 确保数据是字典格式
-            if isinstance(data, dict):
-                self.state.update(data)  # 更新状态数据
+            data, records = self._store.load()
+            if data is not None:
+                # 存储层返回的是已迁移并校验过的状态，各区段整体替换，不与默认状态合并；
+                # 持久化格式的字典边取出边转换为内存模型（队长改为引用成员对象）
+                sessions, queues = data["sessions"], data["queues"]
+                self.state["sessions"] = {sid: Session.from_dict(sessions.pop(sid)) for sid in list(sessions)}
+                self.state["queues"] = {sid: [Player.from_dict(p) for p in queues.pop(sid)] for sid in list(queues)}
+                self.state["tracked_groups"] = data["tracked_groups"]
+            self._rebuild_indexes()
+            # 按写入顺序重放每一条变更
+            for record in records:
+                self._apply_op(record["op"], record)
+            # 启动时把已重放的日志折叠回快照，避免日志无限增长；旧版本的快照同时写回为当前版本
+            if records or self._store.upgraded_from is not None:
+                self._store.checkpoint(self.state)
+            if records:
+                logger.info(f"apq: 已重放 {len(records)} 条日志记录")
+            if self._store.upgraded_from is not None:
+                logger.info(f"apq: 数据已从版本 {self._store.upgraded_from} 升级到 {SCHEMA_VERSION}")
+            self._touched_sessions.clear()
+            self._vacated.clear()
+            for sid in self.state["sessions"]:
+                self._publish_view(sid)
         except Exception as exc:
             # 记录加载错误
             logger.error("apq: load database failed: %s", exc)
             logger.error(traceback.format_exc())
 
     def _save_database(self) -> None:
-        """将当前状态保存到 database.json
-        
-        每次状态变更后调用，确保数据持久化
-        使用UTF-8编码和格式化输出，便于人工查看
+        """将当前状态保存到存储后端
+
+        同步执行一次刷盘（合并写入所有待持久化的变更）
+        仅在没有运行中的事件循环时使用，正常情况下由 _schedule_flush 在后台完成
         """
+        job = self._collect_flush()
+        if job is not None:
+            job()
+
+    def _commit(self, op: str, **data: Any) -> None:
+        """应用一次状态变更并安排持久化
+
+        所有修改 self.state 的路径都通过此方法，保证实时修改和日志重放走同一套逻辑
+        变更只在内存中生效并标记为脏，实际写盘由后台任务合并完成
+
+        Args:
+            op: 变更类型（create/join/quit/replace/delete/reset/reset_all/track_group/
+                enqueue/match/clear_queue/waitlist/promote/expire_session/expire_member）
+            **data: 变更参数，涉及会话的变更带有 session 字段
+        """
+        self._apply_op(op, data)
+        # 只重新发布本次变更涉及的会话视图
+        for sid in self._touched_sessions:
+            self._publish_view(sid)
+        self._touched_sessions.clear()
+        self._pending_records.append({"op": op, "ts": int(time.time()), **data})
+        self.persist_stats["mutations"] += 1
+        self._schedule_flush()
+
+    def _session_lock(self, session_id: str = DEFAULT_SESSION) -> asyncio.Lock:
+        """获取会话锁（按需创建）
+
+        Args:
+            session_id: 会话ID
+        Returns:
+            asyncio.Lock: 该会话的锁
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+
+    def _publish_view(self, session_id: str) -> None:
+        """根据当前状态发布某个会话的只读视图
+
+        视图中的字典都是副本，之后的变更不会影响已经发布的视图
+
+        Args:
+            session_id: 会话ID
+        """
+        session = self.state["sessions"].get(session_id)
+        if session is None:
+            self._views.pop(session_id, None)
+            self._roster_text.pop(session_id, None)
+            return
+        members = tuple(MappingProxyType(p.to_dict()) for p in session.members)
+        counts = self._gender_counts.get(session_id, {})
+        self._view_version += 1
+        self._views[session_id] = RosterView(
+            status=session.status,
+            captain=MappingProxyType(session.captain.to_dict() if session.captain is not None else {}),
+            members=members,
+            members_by_qq=MappingProxyType({p.get("qq_number"): p for p in members}),
+            waitlist=tuple(MappingProxyType(p.to_dict()) for p in session.waitlist),
+            version=self._view_version,
+            br_count=counts.get("br", 0),
+            gr_count=counts.get("gr", 0),
+        )
+
+    def _get_view(self, session_id: Optional[str]) -> RosterView:
+        """获取会话的只读视图（无需加锁）
+
+        Args:
+            session_id: 会话ID
+        Returns:
+            RosterView: 会话视图，会话不存在时返回空视图
+        """
+        if session_id is None:
+            return EMPTY_VIEW
+        return self._views.get(session_id, EMPTY_VIEW)
+
+    def _schedule_flush(self) -> None:
+        """安排一次延迟刷盘，同一窗口内的多次变更合并为一次写入"""
         try:
-            # 将状态数据序列化为JSON格式并写入文件
-            self.database_path.write_text(
-                json.dumps(self.state, ensure_ascii=False, indent=2),  # ensure_ascii=False保持中文字符，indent=2格式化输出
-                encoding="utf-8",  # 使用UTF-8编码
-            )
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有运行中的事件循环（例如初始化阶段），直接同步写入
+            self._save_database()
+            return
+
+        if self._flush_task is not None and not self._flush_task.done():
+            # 已有待执行的刷盘，本次变更随它一起写入
+            self.persist_stats["coalesced"] += 1
+            return
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        """等待合并窗口结束后执行刷盘"""
+        await asyncio.sleep(self.flush_interval_ms / 1000)
+        # 窗口在收集待写内容时结束：写入进行中提交的变更要安排新的刷盘，不能算作已合并
+        self._flush_task = None
+        await self._flush()
+
+    async def _flush(self) -> None:
+        """在线程池中执行一次刷盘，不阻塞事件循环"""
+        job = self._collect_flush()
+        if job is None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io_executor, job)
+
+    def _collect_flush(self) -> Optional[Callable[[], None]]:
+        """在事件循环线程上收集待写入的内容
+
+        序列化在这里完成，保证写入的是某一时刻一致的状态；返回的函数只做文件I/O
+
+        Returns:
+            Optional[Callable[[], None]]: 可在线程池中执行的写入函数，没有待写内容时返回None
+        """
+        records, self._pending_records = self._pending_records, []
+        if not records:
+            return None
+        self.persist_stats["flushes"] += 1
+        payload = self._store.prepare(records, self.state)
+        return lambda: self._write_payload(payload)
+
+    def _write_payload(self, payload: Any) -> None:
+        """执行存储后端的写入（在线程池中执行）
+
+        Args:
+            payload: 存储后端 prepare 返回的载荷
+        """
+        start = time.perf_counter()
+        try:
+            self._store.write(payload)
+            self.metrics.observe("save_database", time.perf_counter() - start)
         except Exception as exc:
             # 记录保存错误
             logger.error("apq: save database failed: %s", exc)
             logger.error(traceback.format_exc())
 
+    async def terminate(self):
+        """插件卸载时调用，等待进行中的广播并保证最后一次刷盘"""
+        if self._background_tasks:
+            await asyncio.wait(set(self._background_tasks), timeout=self.broadcast_timeout)
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._flush()
+        if self._outbox_task is not None:
+            self._outbox_task.cancel()
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+        # 先等 I/O 线程中排队的写入完成，最后的同步写入不会与它们争用同一个临时文件
+        self._io_executor.shutdown(wait=True)
+        if self.metrics_export_interval > 0:
+            self._write_metrics(self._render_metrics())
+        self._write_outbox(self.outbox.encode())
+        self._store.close()
+        logger.info(
+            "apq: 持久化统计 变更 %d 次，刷盘 %d 次，合并 %d 次",
+            self.persist_stats["mutations"],
+            self.persist_stats["flushes"],
+            self.persist_stats["coalesced"],
+        )
+
+    def _apply_op(self, op: str, data: Dict[str, Any]) -> None:
+        """将一条变更应用到内存状态
+
+        Args:
+            op: 变更类型
+            data: 变更参数
+        """
+        handler = getattr(self, f"_op_{op}", None)
+        if handler is None:
+            logger.warning(f"apq: 未知的变更类型 {op}，已忽略")
+            return
+        handler(data)
+
+    def _op_create(self, data: Dict[str, Any]) -> None:
+        """创建APQ：设置队长并作为第一个成员加入"""
+        sid = data.get("session", DEFAULT_SESSION)
+        player = Player.from_dict(data["player"])
+        # 创建者之前在其他会话中的报名记录先移除
+        self._remove_user_from_all(player.qq_number)
+        self._drop_session(sid)
+        # 队长引用成员列表中的同一个对象，更换角色时两者自动一致；创建时间用于召集超时
+        session = self.state["sessions"][sid] = Session("recruiting", captain=player, created_at=player.joined_at)
+        self._arm_session_timer(sid, session)
+        self._add_member(sid, player)
+
+    def _op_join(self, data: Dict[str, Any]) -> None:
+        """加入APQ：移除该QQ之前的报名记录后追加"""
+        sid = data.get("session", DEFAULT_SESSION)
+        player = Player.from_dict(data["player"])
+        self._remove_user_from_all(player.qq_number)
+        self._add_member(sid, player)
+
+    def _op_waitlist(self, data: Dict[str, Any]) -> None:
+        """进入候补：移除该QQ之前的报名记录后排到候补队尾"""
+        sid = data.get("session", DEFAULT_SESSION)
+        player = Player.from_dict(data["player"])
+        self._remove_user_from_all(player.qq_number)
+        self.state["sessions"][sid].waitlist.append(player)
+        self._index_waitlisted(sid, player)
+        self._touched_sessions.add(sid)
+
+    def _op_promote(self, data: Dict[str, Any]) -> None:
+        """候补转正（或新会话从匹配队列拉人）：从候补名单或匹配队列移到成员列表末尾"""
+        sid = data.get("session", DEFAULT_SESSION)
+        player = self._members_by_qq.get(data["qq_number"])
+        if player is None:
+            return
+        self._remove_user_from_all(data["qq_number"])
+        self._add_member(sid, player)
+
+    def _op_quit(self, data: Dict[str, Any]) -> None:
+        """退出APQ：移除该QQ的报名记录"""
+        self._remove_user_from_all(data["qq_number"])
+
+    def _op_delete(self, data: Dict[str, Any]) -> None:
+        """管理员删除角色：与退出相同，只是来源不同"""
+        self._remove_user_from_all(data["qq_number"])
+
+    def _op_replace(self, data: Dict[str, Any]) -> None:
+        """更换角色：更新成员信息（队长引用同一个对象，无需单独同步）"""
+        uid = data["qq_number"]
+        fields = {k: data[k] for k in ("character_id", "gender", "job")}
+        player = self._members_by_qq.get(uid)
+        if player is None:
+            return
+        # 角色ID可能变化，先移除旧的角色ID索引
+        self._members_by_char.pop(self._normalize_char_id(player.character_id or ""), None)
+        old_gender = player.gender
+        player.update(fields)
+        self._members_by_char[self._normalize_char_id(player.character_id)] = player
+        if uid in self._queue_session:
+            # 排队中的玩家：性别或职业可能变化，移到匹配队列中对应的桶
+            self._matchers[self._queue_session[uid]].reindex(uid)
+            return
+        if uid in self._waitlist_session:
+            # 候补玩家：移到候补名单中对应的桶，换角色后可能满足规则
+            sid = self._waitlist_session[uid]
+            self._waitlists[sid].reindex(uid)
+        else:
+            sid = self._member_session[uid]
+            counts = self._gender_counts[sid]
+            counts[old_gender] -= 1
+            counts[player.gender] += 1
+        # 队伍组成变化，候补可能可以转正
+        self._vacated.add(sid)
+        self._touched_sessions.add(sid)
+
+    def _op_reset(self, data: Dict[str, Any]) -> None:
+        """重置单个会话：清空该会话的队长和名单，其他会话不受影响"""
+        if "session" not in data:
+            # 旧版日志中的 reset 不带会话，语义为全部重置
+            self._op_reset_all(data)
+            return
+        self._drop_session(data["session"])
+
+    def _op_reset_all(self, data: Dict[str, Any]) -> None:
+        """全部重置：清空所有会话和匹配队列（包括清空tracked_groups）"""
+        self._touched_sessions.update(self.state["sessions"])
+        self.state = {"sessions": {}, "queues": {}, "tracked_groups": []}
+        self._rebuild_indexes()
+
+    def _op_expire_session(self, data: Dict[str, Any]) -> None:
+        """召集超时：与重置单个会话相同，只是来源不同"""
+        self._drop_session(data["session"])
+
+    def _op_expire_member(self, data: Dict[str, Any]) -> None:
+        """报名超时：与退出相同，只是来源不同"""
+        self._remove_user_from_all(data["qq_number"])
+
+    def _op_enqueue(self, data: Dict[str, Any]) -> None:
+        """进入匹配队列：移除该QQ之前的报名记录后排到队尾"""
+        sid = data.get("session", DEFAULT_SESSION)
+        player = Player.from_dict(data["player"])
+        self._remove_user_from_all(player.qq_number)
+        self.state["queues"].setdefault(sid, []).append(player)
+        self._index_queued(sid, player)
+
+    def _op_match(self, data: Dict[str, Any]) -> None:
+        """成队：把匹配到的玩家移出队列"""
+        for uid in data["qq_numbers"]:
+            self._remove_user_from_all(uid)
+
+    def _op_clear_queue(self, data: Dict[str, Any]) -> None:
+        """清空一个群的匹配队列"""
+        for p in list(self.state["queues"].get(data["session"], [])):
+            self._remove_user_from_all(p.qq_number)
+
+    def _op_track_group(self, data: Dict[str, Any]) -> None:
+        """记录群聊ID（去重）
+
+        群聊登记已移到 groups.jsonl，这里只用于重放旧版日志，结果在首次启动时迁移
+        """
+        tracked_groups = self.state.setdefault("tracked_groups", [])
+        if data["group_id"] not in tracked_groups:
+            tracked_groups.append(data["group_id"])
+
     def _get_sender_id(self, event: AstrMessageEvent) -> str:
         """获取消息发送者的唯一ID（QQ号）
         
@@ -161,166 +686,1151 @@ class APQPlugin(Star):
         Args:
             event: 消息事件对象
         """
+        # 每条命令的入口都会经过这里，顺带恢复插件重启前未完成的广播重试和过期定时器
+        self._ensure_outbox_worker()
+        self._ensure_expiry_worker()
+        self._ensure_metrics_exporter()
+
         group_id = self._get_group_id(event)
         if not group_id:
             return  # 不是群聊，不记录
 
-        # 获取已记录的群聊列表，去重后保存
-        tracked_groups = self.state.get("tracked_groups", [])
-        if group_id not in tracked_groups:
-            tracked_groups.append(group_id)
-            self.state["tracked_groups"] = tracked_groups
-            self._save_database()
+        # 登记并刷新活跃时间（O(1)），只有新群或活跃时间需要落盘时才追加一行
+        if self.groups.touch(group_id, time.time()):
             logger.info(f"apq: 新增记录群聊ID: {group_id}")
+        if self.groups.dirty:
+            self._save_groups()
+
+    def _check_rate_limit(self, event: AstrMessageEvent, command: str) -> Tuple[bool, Any]:
+        """检查命令限流（由 rate_limited 在处理器执行之前调用）
+
+        先按QQ号、再按群聊取令牌，群聊被拒绝时退回已取的个人令牌；超级管理员不受限制
+        连续被拒绝时只回复第一次，之后静默丢弃，直到再次放行
+
+        Args:
+            event: 消息事件对象
+            command: 命令处理器名
+        Returns:
+            Tuple[bool, Any]: (是否拒绝, 拒绝时的回复，静默丢弃时为None)
+        """
+        if not (self.user_limiter.enabled or self.group_limiter.enabled):
+            return False, None
+        uid = self._get_sender_id(event)
+        if self._is_super_admin(uid):
+            return False, None
+        now = time.monotonic()
+
+        if self.user_limiter.enabled:
+            wait = self.user_limiter.acquire(uid, now)
+            if wait:
+                self.metrics.reject(command, "user")
+                if self.user_limiter.should_notify(uid):
+                    return True, event.plain_result(f"\n操作过于频繁，请 {math.ceil(wait)} 秒后再试。")
+                return True, None
+
+        group_id = self._get_group_id(event)
+        if group_id and self.group_limiter.enabled:
+            wait = self.group_limiter.acquire(group_id, now)
+            if wait:
+                self.user_limiter.refund(uid)
+                self.metrics.reject(command, "group")
+                if self.group_limiter.should_notify(group_id):
+                    return True, event.plain_result(f"\n本群APQ命令过于频繁，请 {math.ceil(wait)} 秒后再试。")
+                return True, None
+        return False, None
+
+    async def _broadcast_to_all_groups(self, message: str, groups: Optional[List[str]] = None) -> BroadcastResult:
+        """广播消息到所有记录的群聊
+
+        并发发送到各群聊，同时进行的发送数量不超过 broadcast_concurrency，
+        单个群聊超过 broadcast_timeout_seconds 未完成视为失败，慢群不会拖慢其他群
+
+        Args:
+            message: 要发送的消息内容
+            groups: 目标群聊列表，默认使用当前记录的群聊
+        Returns:
+            BroadcastResult: 汇总的成功/失败结果
+        """
+        tracked_groups = list(groups if groups is not None else self._broadcast_groups())
+        if not tracked_groups:
+            logger.warning("apq: 没有记录的群聊ID，无法广播")
+            return BroadcastResult(0, (), {})
+
+        semaphore = asyncio.Semaphore(self.broadcast_concurrency)
+
+        async def send_one(group_id: str) -> Optional[str]:
+            async with semaphore:
+                return await self._send_to_group(group_id, message)
+
+        start = time.perf_counter()
+        errors = await asyncio.gather(*(send_one(g) for g in tracked_groups))
+        self.metrics.observe("broadcast", time.perf_counter() - start)
+
+        succeeded = tuple(g for g, err in zip(tracked_groups, errors) if err is None)
+        failed = {g: err for g, err in zip(tracked_groups, errors) if err is not None}
+        for group_id, err in failed.items():
+            logger.error(f"apq: 广播消息到群聊 {group_id} 失败: {err}")
+            # 失败的投递进入发件箱，稍后重试
+            self.outbox.add(group_id, message, err)
+        if failed:
+            self._save_outbox()
+            self._ensure_outbox_worker()
+        logger.info(f"apq: 广播完成，成功 {len(succeeded)}/{len(tracked_groups)} 个群聊")
+        return BroadcastResult(len(tracked_groups), succeeded, failed)
+
+    async def _send_to_group(self, group_id: str, message: str) -> Optional[str]:
+        """发送消息到单个群聊
+
+        Args:
+            group_id: 目标群聊
+            message: 消息内容
+        Returns:
+            Optional[str]: 成功返回None，失败返回错误描述
+        """
+        try:
+            await asyncio.wait_for(
+                self.context.send_message(group_id, message),
+                timeout=self.broadcast_timeout,
+            )
+            return None
+        except asyncio.TimeoutError:
+            return f"超时({self.broadcast_timeout}s)"
+        except Exception as e:
+            return str(e) or type(e).__name__
+
+    def _load_groups(self) -> None:
+        """加载群聊登记，文件不存在时由数据库中旧版的 tracked_groups 迁移"""
+        try:
+            if not self.groups.load():
+                self.groups.seed(self.state.get("tracked_groups", []), time.time())
+                if self.groups.dirty:
+                    self._write_groups(self.groups.drain())
+                    logger.info(f"apq: 已迁移 {len(self.groups)} 个记录的群聊ID")
+        except Exception as exc:
+            logger.error("apq: load groups failed: %s", exc)
+            logger.error(traceback.format_exc())
+
+    def _save_groups(self) -> None:
+        """持久化群聊登记的变更（在 I/O 线程中追加，没有事件循环时同步写入）"""
+        payload = self.groups.drain()
+        if payload is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_groups(payload)
+            return
+        loop.run_in_executor(self._io_executor, self._write_groups, payload)
+
+    def _write_groups(self, payload: tuple) -> None:
+        """写入 groups.jsonl
+
+        Args:
+            payload: GroupRegistry.drain 的返回值
+        """
+        try:
+            self.groups.write(payload)
+        except Exception as exc:
+            logger.error("apq: save groups failed: %s", exc)
+            logger.error(traceback.format_exc())
+
+    def _broadcast_groups(self) -> List[str]:
+        """满员广播的目标群聊（先移除超过 group_ttl_days 未使用的群）
+
+        Returns:
+            List[str]: 按登记顺序排列的群聊ID
+        """
+        evicted = self.groups.evict(time.time(), self.group_ttl)
+        if evicted:
+            logger.info(f"apq: {len(evicted)} 个群聊长时间未使用，不再广播: {', '.join(evicted)}")
+            self._save_groups()
+        return list(self.groups)
+
+    def _save_outbox(self) -> None:
+        """持久化发件箱（在 I/O 线程中写入，没有事件循环时同步写入）"""
+        text = self.outbox.encode()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_outbox(text)
+            return
+        loop.run_in_executor(self._io_executor, self._write_outbox, text)
+
+    def _write_outbox(self, text: bytes) -> None:
+        """写入 outbox.json
+
+        Args:
+            text: 已编码的发件箱内容
+        """
+        try:
+            self.outbox.write(text)
+        except Exception as exc:
+            logger.error("apq: save outbox failed: %s", exc)
+            logger.error(traceback.format_exc())
+
+    def _ensure_outbox_worker(self) -> None:
+        """发件箱非空时确保重试任务在运行（插件重启后由第一条命令触发恢复）"""
+        if not self.outbox.depth:
+            return
+        if self._outbox_task is not None and not self._outbox_task.done():
+            # 唤醒正在等待的任务，重新计算最早的重试时间
+            self._outbox_wakeup.set()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._outbox_wakeup = asyncio.Event()
+        self._outbox_task = loop.create_task(self._outbox_worker())
+
+    async def _outbox_worker(self) -> None:
+        """发件箱重试循环：等到最早的投递到期，并发重试所有到期投递，直到发件箱清空"""
+        while self.outbox.depth:
+            delay = self.outbox.next_due_in()
+            if delay:
+                self._outbox_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._outbox_wakeup.wait(), timeout=delay)
+                    continue  # 被新投递唤醒，重新计算等待时间
+                except asyncio.TimeoutError:
+                    pass
+
+            due = self.outbox.due()
+            if not due:
+                continue
+            semaphore = asyncio.Semaphore(self.broadcast_concurrency)
+
+            async def retry_one(entry: Dict[str, Any]) -> Optional[str]:
+                async with semaphore:
+                    return await self._send_to_group(entry["group_id"], entry["message"])
+
+            errors = await asyncio.gather(*(retry_one(e) for e in due))
+            for entry, err in zip(due, errors):
+                if err is None:
+                    self.outbox.mark_success(entry["id"])
+                    logger.info(f"apq: 重试广播到群聊 {entry['group_id']} 成功")
+                elif self.outbox.mark_failure(entry["id"], err):
+                    logger.error(f"apq: 广播到群聊 {entry['group_id']} 重试 {entry['attempts']} 次仍失败，已放弃: {err}")
+            self._save_outbox()
+
+    def _arm_session_timer(self, session_id: str, session: Session) -> None:
+        """为召集中的会话安排召集超时
+
+        Args:
+            session_id: 会话ID
+            session: 会话
+        """
+        if not self.session_ttl or session.status != "recruiting":
+            return
+        created_at = session.created_at
+        # 定时器键带上创建时间：会话被重建后，旧定时器到期时不会误取消新会话
+        self._arm_timer((created_at or self._started_at) + self.session_ttl, ("session", session_id, created_at))
+
+    def _arm_member_timer(self, player: Player) -> None:
+        """为一次报名（成员、候补或排队）安排报名超时
+
+        Args:
+            player: 玩家
+        """
+        if not self.member_timeout:
+            return
+        joined_at = player.joined_at
+        # 定时器键带上报名时间：重新报名后，旧定时器到期时不会误移除新的报名
+        self._arm_timer((joined_at or self._started_at) + self.member_timeout,
+                        ("member", player.qq_number, joined_at))
+
+    def _arm_timer(self, deadline: float, key: tuple) -> None:
+        """把定时器放入堆中，必要时唤醒或启动过期任务
+
+        Args:
+            deadline: 到期时间戳
+            key: 定时器键
+        """
+        if self._timers.schedule(deadline, key) and self._expiry_wakeup is not None:
+            # 新定时器比过期任务正在等待的更早到期
+            self._expiry_wakeup.set()
+        self._ensure_expiry_worker()
+
+    def _ensure_expiry_worker(self) -> None:
+        """有定时器时确保过期任务在运行（没有事件循环时由第一条命令触发启动）"""
+        if not len(self._timers):
+            return
+        if self._expiry_task is not None and not self._expiry_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._expiry_wakeup = asyncio.Event()
+        self._expiry_task = loop.create_task(self._expiry_worker())
+
+    async def _expiry_worker(self) -> None:
+        """过期循环：等到最早的定时器到期，处理所有到期的定时器，直到没有定时器"""
+        while len(self._timers):
+            delay = self._timers.next_deadline() - time.time()
+            if delay > 0:
+                self._expiry_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._expiry_wakeup.wait(), timeout=delay)
+                    continue  # 有更早的定时器，重新计算等待时间
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self._expire(self._timers.pop_due(time.time()))
+            except Exception as exc:
+                logger.error("apq: expire failed: %s", exc)
+                logger.error(traceback.format_exc())
+
+    def _ensure_metrics_exporter(self) -> None:
+        """确保指标导出任务在运行（由第一条命令触发启动）"""
+        if self.metrics_export_interval <= 0:
+            return
+        if self._metrics_task is not None and not self._metrics_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._metrics_task = loop.create_task(self._metrics_exporter())
+
+    async def _metrics_exporter(self) -> None:
+        """指标导出循环：每隔 metrics_export_interval_seconds 在 I/O 线程中写一次 metrics.prom"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.metrics_export_interval)
+            await loop.run_in_executor(self._io_executor, self._write_metrics, self._render_metrics())
+
+    def _render_metrics(self) -> str:
+        """在事件循环线程上生成 Prometheus 文本（附带持久化、发件箱等即时值）
+
+        Returns:
+            str: exposition format 文本
+        """
+        return self.metrics.render_prometheus({
+            "apq_persist_mutations": ("State mutations since start.", self.persist_stats["mutations"]),
+            "apq_persist_flushes": ("Disk flushes since start.", self.persist_stats["flushes"]),
+            "apq_persist_coalesced": ("Mutations coalesced into an existing flush.", self.persist_stats["coalesced"]),
+            "apq_outbox_depth": ("Broadcast deliveries waiting for retry.", self.outbox.depth),
+            "apq_sessions_recruiting": ("Sessions currently recruiting.", sum(
+                1 for sess in self.state["sessions"].values() if sess.status == "recruiting")),
+            "apq_queued_players": ("Players waiting in matchmaking queues.", len(self._queue_session)),
+            "apq_pending_timers": ("Scheduled expiry timers.", len(self._timers)),
+            "apq_tracked_groups": ("Groups registered as broadcast targets.", len(self.groups)),
+            "apq_rate_limit_user_buckets": ("Per-user rate limit buckets in memory.", len(self.user_limiter)),
+            "apq_rate_limit_group_buckets": ("Per-group rate limit buckets in memory.", len(self.group_limiter)),
+        })
+
+    def _write_metrics(self, text: str) -> None:
+        """写入 metrics.prom
+
+        Args:
+            text: Prometheus 文本
+        """
+        try:
+            atomic_write_text(self.metrics_path, text)
+        except Exception as exc:
+            logger.error("apq: export metrics failed: %s", exc)
+            logger.error(traceback.format_exc())
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """在后台运行协程，并保留任务引用直到完成
+
+        Args:
+            coro: 要运行的协程
+        Returns:
+            asyncio.Task: 创建的任务
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def _id_set(self, key: str) -> FrozenSet[str]:
+        """把配置中的QQ号列表转换为集合
+
+        Args:
+            key: 配置项名称（admin_ids / moderator_ids）
+        Returns:
+            FrozenSet[str]: 统一为字符串并去掉首尾空白的QQ号
+        """
+        return frozenset(str(x).strip() for x in self.config.get(key, []) or [])
+
+    def _role_of(self, user_id: str) -> int:
+        """查询用户在权限表中的等级（两次集合查找，O(1)）
+
+        Args:
+            user_id: 用户QQ号字符串
+        Returns:
+            int: ROLE_MEMBER / ROLE_MODERATOR / ROLE_ADMIN，同时出现在两个列表中的ID取较高的等级
+        """
+        if user_id in self._admin_ids:
+            return self.ROLE_ADMIN
+        if user_id in self._moderator_ids:
+            return self.ROLE_MODERATOR
+        return self.ROLE_MEMBER
+
+    def _is_super_admin(self, user_id: str) -> bool:
+        """检查用户是否为超级管理员
+        
+        通过配置文件中的 admin_ids 判断用户权限
+        
+        Args:
+            user_id: 用户QQ号字符串
+        Returns:
+            bool: True表示是超级管理员
+        """
+        return user_id in self._admin_ids
+
+    def _is_group_admin(self, event: AstrMessageEvent) -> bool:
+        """检查消息发送者是否为群组管理员
+        
+        通过多种方式检测用户在群内的管理权限
+        支持不同平台的消息对象结构
+        
+        Args:
+            event: 消息事件对象
+        Returns:
+            bool: True表示具有群管理权限
+        """
+        # 获取消息对象和发送者信息
+        msg = getattr(event, "message_obj", None)
+        sender = getattr(msg, "sender", None) if msg else None
+
+        # 如果无法获取发送者信息，返回False
+        if sender is None:
+            return False
+
+        # 检查直接的管理员属性
+        if getattr(sender, "is_owner", False) or getattr(sender, "is_admin", False):
+            return True
+
+        # 检查角色属性
+        role = getattr(sender, "role", "")
+        if isinstance(role, str) and role.lower() in {"owner", "admin"}:
+            return True
+
+        # 检查权限属性
+        permission = getattr(sender, "permission", "")
+        if isinstance(permission, str) and permission.lower() in {"owner", "admin"}:
+            return True
+
+        return False
+
+    def _has_admin_rights(self, event: AstrMessageEvent) -> bool:
+        """检查用户是否具有管理员权限
+        
+        综合检查超级管理员和群管理员权限
+        
+        Args:
+            event: 消息事件对象
+        Returns:
+            bool: True表示具有管理员权限
+        """
+        return self._permission_level(event) >= self.ROLE_ADMIN
+
+    def _can_moderate(self, event: AstrMessageEvent) -> bool:
+        """检查用户是否可以管理会话（删除角色、重置本群APQ）
+
+        管理员和 moderator_ids 中的会话管理员都可以
+
+        Args:
+            event: 消息事件对象
+        Returns:
+            bool: True表示具有会话管理权限
+        """
+        return self._permission_level(event) >= self.ROLE_MODERATOR
+
+    def _permission_level(self, event: AstrMessageEvent) -> int:
+        """获取用户的权限等级
+
+        先查权限表（O(1)），不是管理员时再检查群管理权限
+
+        Args:
+            event: 消息事件对象
+        Returns:
+            int: ROLE_MEMBER / ROLE_MODERATOR / ROLE_ADMIN
+        """
+        uid = self._get_sender_id(event)  # 获取用户QQ号
+        level = self._role_of(uid)
+        # 群主、群管理员拥有与超级管理员相同的权限
+        if level < self.ROLE_ADMIN and self._is_group_admin(event):
+            return self.ROLE_ADMIN
+        return level
+
+    @staticmethod
+    def _normalize_char_id(char_id: str) -> str:
+        """规范化角色ID，用作索引键
+
+        游戏内角色名不区分大小写，统一去空格并转为小写后比较
+
+        Args:
+            char_id: 角色ID
+        Returns:
+            str: 规范化后的角色ID
+        """
+        return char_id.strip().casefold()
+
+    def _rebuild_indexes(self) -> None:
+        """根据所有会话的 members 重建 QQ号/角色ID/所在会话 索引
+
+        加载数据或整体替换状态后调用，其余变更路径增量维护索引；过期定时器随之重新安排
+        """
+        self._timers.clear()
+        self._members_by_qq = {}
+        self._members_by_char = {}
+        self._member_session = {}
+        self._queue_session = {}
+        self._matchers = {}
+        self._waitlist_session = {}
+        self._waitlists = {}
+        self._gender_counts = {}
+        for sid, session in self.state.get("sessions", {}).items():
+            self._arm_session_timer(sid, session)
+            for p in session.members:
+                self._index_member(sid, p)
+            for p in session.waitlist:
+                self._index_waitlisted(sid, p)
+        self.state.setdefault("queues", {})
+        for sid, queue in self.state["queues"].items():
+            for p in queue:
+                self._index_queued(sid, p)
+
+    def _index_member(self, session_id: str, player: Player) -> None:
+        """把成员写入索引
+
+        Args:
+            session_id: 所在会话ID
+            player: 玩家
+        """
+        self._members_by_qq[player.qq_number] = player
+        self._members_by_char[self._normalize_char_id(player.character_id or "")] = player
+        self._member_session[player.qq_number] = session_id
+        self._gender_counts.setdefault(session_id, Counter())[player.gender] += 1
+        # 队长的报名随会话一起过期
+        session = self.state["sessions"].get(session_id)
+        if session is None or session.captain_qq != player.qq_number:
+            self._arm_member_timer(player)
+
+    def _index_queued(self, session_id: str, player: Player) -> None:
+        """把排队中的玩家写入索引和匹配队列
+
+        Args:
+            session_id: 排队所在的会话ID
+            player: 玩家
+        """
+        self._members_by_qq[player.qq_number] = player
+        self._members_by_char[self._normalize_char_id(player.character_id or "")] = player
+        self._queue_session[player.qq_number] = session_id
+        self._arm_member_timer(player)
+        matcher = self._matchers.get(session_id)
+        if matcher is None:
+            matcher = self._matchers[session_id] = MatchQueue(self.composition)
+        matcher.add(player)
+
+    def _index_waitlisted(self, session_id: str, player: Player) -> None:
+        """把候补玩家写入索引和候补名单
+
+        Args:
+            session_id: 候补所在的会话ID
+            player: 玩家
+        """
+        self._members_by_qq[player.qq_number] = player
+        self._members_by_char[self._normalize_char_id(player.character_id or "")] = player
+        self._waitlist_session[player.qq_number] = session_id
+        self._arm_member_timer(player)
+        waitlist = self._waitlists.get(session_id)
+        if waitlist is None:
+            waitlist = self._waitlists[session_id] = Waitlist(self.composition)
+        waitlist.add(player)
+
+    def _add_member(self, session_id: str, player: Player) -> None:
+        """追加成员到会话并更新索引
+
+        Args:
+            session_id: 会话ID
+            player: 玩家
+        """
+        session = self.state["sessions"][session_id]
+        session.members.append(player)
+        if session.captain_qq == player.qq_number:
+            # 队长重新报名（或由候补转正）时换成了新的成员对象，队长要指向它，否则仍是旧角色
+            session.captain = player
+        self._index_member(session_id, player)
+        self._touched_sessions.add(session_id)
+
+    def _drop_session(self, session_id: str) -> None:
+        """删除整个会话并清除其成员的索引
+
+        Args:
+            session_id: 会话ID
+        """
+        session = self.state["sessions"].pop(session_id, None)
+        if session is None:
+            return
+        for p in session.members + session.waitlist:
+            uid = p.qq_number
+            self._members_by_qq.pop(uid, None)
+            self._member_session.pop(uid, None)
+            self._waitlist_session.pop(uid, None)
+            self._members_by_char.pop(self._normalize_char_id(p.character_id or ""), None)
+        self._waitlists.pop(session_id, None)
+        self._gender_counts.pop(session_id, None)
+        self._touched_sessions.add(session_id)
+
+    def _remove_user_from_all(self, user_id: str) -> None:
+        """从所有会话的 members、候补名单和匹配队列中移除用户
+
+        当用户重新报名、退出、成队或被管理员删除时调用
+        通过索引定位成员所在会话（或队列），只移除这一条记录并同步更新索引
+
+        Args:
+            user_id: 要移除的用户QQ号
+        """
+        player = self._members_by_qq.pop(user_id, None)
+        if player is None:
+            return
+        self._members_by_char.pop(self._normalize_char_id(player.character_id or ""), None)
+        sid = self._member_session.pop(user_id, None)
+        if sid is not None:
+            self._discard(self.state["sessions"][sid].members, player)
+            self._gender_counts[sid][player.gender] -= 1
+            self._touched_sessions.add(sid)
+            # 空出了名额，候补可能可以转正
+            self._vacated.add(sid)
+            return
+        sid = self._waitlist_session.pop(user_id, None)
+        if sid is not None:
+            self._waitlists[sid].remove(user_id)
+            self._discard(self.state["sessions"][sid].waitlist, player)
+            self._touched_sessions.add(sid)
+            return
+        # 不在会话和候补中，则在匹配队列中
+        sid = self._queue_session.pop(user_id)
+        self._matchers[sid].remove(user_id)
+        queue = self.state["queues"][sid]
+        self._discard(queue, player)
+        if not queue:
+            # 队列已空，释放该群的队列
+            del self.state["queues"][sid]
+            del self._matchers[sid]
+
+    @staticmethod
+    def _discard(players: List[Player], player: Player) -> None:
+        """从列表中移除指定的玩家（按身份比较，只移除索引指向的那一条）
+
+        Args:
+            players: 成员列表或队列
+            player: 要移除的玩家数据字典
+        """
+        for idx, p in enumerate(players):
+            if p is player:
+                del players[idx]
+                break
+
+    def _session_id(self, event: AstrMessageEvent) -> str:
+        """由消息来源确定会话ID
+
+        群聊消息使用群聊ID，私聊等无法确定群聊时使用默认会话
+
+        Args:
+            event: 消息事件对象
+        Returns:
+            str: 会话ID
+        """
+        return self._get_group_id(event) or DEFAULT_SESSION
+
+    def _get_session(self, session_id: Optional[str]) -> Optional[Session]:
+        """获取会话数据
+
+        Args:
+            session_id: 会话ID
+        Returns:
+            Optional[Session]: 会话，不存在时返回None
+        """
+        if session_id is None:
+            return None
+        return self.state["sessions"].get(session_id)
+
+    def _session_of(self, user_id: str) -> Optional[str]:
+        """查找用户当前所在的会话
+
+        Args:
+            user_id: 用户QQ号
+        Returns:
+            Optional[str]: 会话ID，未报名时返回None
+        """
+        return self._member_session.get(user_id)
+
+    def _locate(self, user_id: str) -> Optional[str]:
+        """查找用户报名所在的会话（成员、候补或匹配队列）
+
+        Args:
+            user_id: 用户QQ号
+        Returns:
+            Optional[str]: 会话ID，未报名时返回None
+        """
+        return (self._member_session.get(user_id)
+                or self._waitlist_session.get(user_id)
+                or self._queue_session.get(user_id))
+
+    def _waitlist_of(self, user_id: str) -> Optional[str]:
+        """查找用户候补所在的会话
+
+        Args:
+            user_id: 用户QQ号
+        Returns:
+            Optional[str]: 会话ID，不在候补名单中时返回None
+        """
+        return self._waitlist_session.get(user_id)
+
+    def _queue_of(self, user_id: str) -> Optional[str]:
+        """查找用户排队所在的会话
+
+        Args:
+            user_id: 用户QQ号
+        Returns:
+            Optional[str]: 会话ID，不在匹配队列中时返回None
+        """
+        return self._queue_session.get(user_id)
+
+    def _is_captain_elsewhere(self, user_id: str, session_id: str) -> bool:
+        """用户是否是其他会话的队长
+
+        队长转去别的会话会让原会话失去队长，因此需要先取消原会话
+
+        Args:
+            user_id: 用户QQ号
+            session_id: 当前操作的会话ID
+        Returns:
+            bool: True表示是其他会话的队长
+        """
+        other = self._session_of(user_id)
+        if other is None or other == session_id:
+            return False
+        return self.state["sessions"][other].captain_qq == user_id
+
+    def _find_user_in_members(self, user_id: str) -> bool:
+        """查找用户是否在成员列表中（通过QQ号）
+
+        Args:
+            user_id: 用户QQ号
+        Returns:
+            bool: True表示用户在成员列表中
+        """
+        return user_id in self._members_by_qq
+
+    def _find_player_by_qq(self, user_id: str) -> Optional[Player]:
+        """通过QQ号查找玩家
+
+        Args:
+            user_id: 用户QQ号
+        Returns:
+            Optional[Player]: 找到的玩家，未找到返回 None
+        """
+        return self._members_by_qq.get(user_id)
+
+    def _find_player_by_character_id(self, char_id: str) -> Optional[Player]:
+        """通过角色ID查找玩家
+
+        Args:
+            char_id: 角色ID
+        Returns:
+            Optional[Player]: 找到的玩家，未找到返回 None
+        """
+        return self._members_by_char.get(self._normalize_char_id(char_id))
+
+    def _is_character_id_taken(self, char_id: str, exclude_user_id: str = None) -> bool:
+        """检查角色ID是否已被使用
+
+        Args:
+            char_id: 角色ID
+            exclude_user_id: 要排除的用户ID（用于更换角色时不和自己比较）
+        Returns:
+            bool: True表示角色ID已被使用
+        """
+        player = self._find_player_by_character_id(char_id)
+        if player is None:
+            return False
+        # 如果角色ID相同，且不是当前用户（用于更换角色场景）
+        return exclude_user_id is None or player.get("qq_number") != exclude_user_id
+
+    def _try_match(self, session_id: str) -> Optional[str]:
+        """在本群的匹配队列中尝试成队，成队时把队员移出队列
+
+        需要在持有会话锁时调用
+
+        Args:
+            session_id: 会话ID
+        Returns:
+            Optional[str]: 成队时返回最终名单消息，否则返回None
+        """
+        matcher = self._matchers.get(session_id)
+        party = matcher.match() if matcher is not None else None
+        if party is None:
+            return None
+        # 凑够一队：把挑中的玩家移出队列，直接发车
+        joined = [p.joined_at for p in party if p.joined_at]
+        self._archive_run(session_id, "matched", party, started_at=min(joined) if joined else None)
+        self._commit("match", session=session_id, qq_numbers=[p.qq_number for p in party])
+        return self._format_final_roster("=== APQ 匹配成功 ===", party, "匹配队列已成队，请队员尽快集合！")
+
+    def _finish_session(self, session_id: str, notices: List[Tuple[List[str], str]]) -> str:
+        """满员发车：生成最终名单，剩余候补转入本群匹配队列，然后重置会话
+
+        需要在持有会话锁时调用
+
+        Args:
+            session_id: 会话ID
+            notices: 锁释放后要发送的 (目标群聊, 消息)，会追加最终名单的广播
+        Returns:
+            str: 最终名单消息
+        """
+        session = self.state["sessions"][session_id]
+        leftover = list(session.waitlist)
+        footer = "APQ活动已结束，数据已清空，准备下一场活动！"
+        if leftover and not self.matchmaking_enabled:
+            footer += f"\n{len(leftover)} 名候补玩家请重新报名"
+        view = self._get_view(session_id)
+        final_message = self._final_roster_text(
+            "=== APQ 集结完成 ===", self._render_roster(session_id, view).members,
+            len(view.members), view.br_count, view.gr_count, footer)
+        notices.append((self._broadcast_groups(), final_message))
+
+        # 剩余候补按原顺序转入本群的匹配队列，不必重新报名
+        if self.matchmaking_enabled:
+            for p in leftover:
+                self._commit("enqueue", session=session_id, player=p.to_dict())
+
+        # 在锁内立即重置本群的会话（其他群的会话和tracked_groups不受影响）
+        # 广播期间到达的加入请求只会看到新的空闲状态，而不会写入已满的名单
+        self._archive_session(session_id, "completed")
+        self._commit("reset", session=session_id)
+
+        if leftover and self.matchmaking_enabled:
+            matched = self._try_match(session_id)
+            if matched is not None:
+                notices.append((self._broadcast_groups(), matched))
+        return final_message
+
+    def _absorb_queue(self, session_id: str, notices: List[Tuple[List[str], str]]) -> None:
+        """新会话创建后，把本群匹配队列中的玩家按入队顺序拉进会话，满员则直接发车
+
+        只拉入加入后仍满足组成规则的玩家，其余留在匹配队列中，需要在持有会话锁时调用
+
+        Args:
+            session_id: 刚创建的会话ID
+            notices: 锁释放后要发送的 (目标群聊, 消息)，会追加加入通知
+        """
+        matcher = self._matchers.get(session_id)
+        if matcher is None:
+            return
+        session = self.state["sessions"][session_id]
+        pulled: List[Player] = []
+        while True:
+            player = matcher.next_eligible(session.members)
+            if player is None:
+                break
+            # 与候补转正相同：从队列移到成员列表末尾，保留原来的报名时间
+            self._commit("promote", session=session_id, qq_number=player.qq_number)
+            pulled.append(player)
+            if len(session.members) >= self.TEAM_SIZE:
+                break
+        if not pulled:
+            return
+        if session_id != DEFAULT_SESSION:
+            lines = [f"\n匹配队列中的 {len(pulled)} 人已加入本群新创建的APQ（{len(session.members)}/{self.TEAM_SIZE}）："]
+            lines.extend(f"- {p.nickname or ''} 的角色 {p.character_id or ''}" for p in pulled)
+            notices.append(([session_id], "\n".join(lines)))
+        if len(session.members) >= self.TEAM_SIZE:
+            self._finish_session(session_id, notices)
+
+    def _backfill(self, notices: List[Tuple[List[str], str]]) -> None:
+        """为空出名额的会话按候补顺序转正，转正后满员则直接发车
+
+        每个会话只检查候补名单各桶的队首，代价与候补人数无关；需要在持有会话锁时调用
+
+        Args:
+            notices: 锁释放后要发送的 (目标群聊, 消息)，会追加转正通知
+        """
+        while self._vacated:
+            sid = self._vacated.pop()
+            session = self._get_session(sid)
+            waitlist = self._waitlists.get(sid)
+            if session is None or not waitlist or session.status == "idle":
+                continue
+            while True:
+                player = waitlist.next_eligible(session.members)
+                if player is None:
+                    break
+                self._commit("promote", session=sid, qq_number=player.qq_number)
+                members = session.members
+                # 通知本群：被转正的玩家不必再重复报名
+                if sid != DEFAULT_SESSION:
+                    notices.append(([sid], f"\n候补转正：{player.nickname or ''} 的角色 {player.character_id or ''} "
+                                           f"已加入APQ（{len(members)}/{self.TEAM_SIZE}）"))
+                if len(members) >= self.TEAM_SIZE:
+                    self._finish_session(sid, notices)
+                    break
+
+    async def _expire(self, keys: List[tuple]) -> None:
+        """处理到期的定时器：按会话分组，持锁确认定时器仍然有效后持久化过期变更
+
+        定时器不会被取消，会话已发车/取消、玩家已退出或重新报名时，到期的定时器直接丢弃
 
-    async def _broadcast_to_all_groups(self, message: str) -> None:
-        """广播消息到所有记录的群聊
+        Args:
+            keys: 到期的定时器键
+        """
+        by_session: Dict[str, List[tuple]] = {}
+        for key in keys:
+            sid = key[1] if key[0] == "session" else self._locate(key[1])
+            if sid is not None:
+                by_session.setdefault(sid, []).append(key)
+
+        notices: List[Tuple[List[str], str]] = []
+        for sid, session_keys in by_session.items():
+            async with self._session_lock(sid):
+                expired: List[Player] = []
+                for kind, target, stamp in session_keys:
+                    if kind == "session":
+                        self._expire_session(sid, stamp, notices)
+                    else:
+                        player = self._expire_member(sid, target, stamp)
+                        if player is not None:
+                            expired.append(player)
+                if expired:
+                    lines = [f"【报名超时】以下报名超过 {self.member_timeout // 60} 分钟未成队，已自动移除："]
+                    lines.extend(f"- {p.get('nickname', '')} 的角色 {p.get('character_id', '')}" for p in expired)
+                    notices.append((self._expiry_targets(sid), "\n" + "\n".join(lines)))
+                    logger.info(f"apq: 会话 {sid} 中 {len(expired)} 个报名超时，已移除")
+                # 移除的成员空出了名额，候补可能可以转正
+                self._backfill(notices)
+
+        self._announce(notices)
+
+    def _expire_session(self, session_id: str, created_at: Optional[int],
+                        notices: List[Tuple[List[str], str]]) -> None:
+        """召集超时：会话仍是当初创建的那一个且仍在召集时自动取消
+
+        需要在持有会话锁时调用
 
         Args:
-            message: 要发送的消息内容
+            session_id: 会话ID
+            created_at: 定时器记录的会话创建时间
+            notices: 锁释放后要发送的 (目标群聊, 消息)，会追加取消通知
         """
-        tracked_groups = self.state.get("tracked_groups", [])
-        if not tracked_groups:
-            logger.warning("apq: 没有记录的群聊ID，无法广播")
+        session = self._get_session(session_id)
+        if session is None or session.status != "recruiting" or session.created_at != created_at:
             return
+        captain = session.captain
+        count = len(session.members)
+        self._archive_session(session_id, "expired")
+        self._commit("expire_session", session=session_id)
+        notices.append((self._expiry_targets(session_id),
+                        f"\n【APQ召集超时】队长 {captain.nickname if captain is not None else ''} 创建的APQ召集超过 "
+                        f"{self.session_ttl // 60} 分钟仍未满员（{count}/{self.TEAM_SIZE}），已自动取消"))
+        logger.info(f"apq: 会话 {session_id} 召集超时，已自动取消")
 
-        success_count = 0
-        for group_id in tracked_groups:
-            try:
-                await self.context.send_message(group_id, message)
-                success_count += 1
-                logger.info(f"apq: 广播消息到群聊 {group_id} 成功")
-            except Exception as e:
-                logger.error(f"apq: 广播消息到群聊 {group_id} 失败: {e}")
+    def _expire_member(self, session_id: str, user_id: str, joined_at: Optional[int]) -> Optional[Player]:
+        """报名超时：报名仍是当初那一次、且不是队长时自动移除
 
-        logger.info(f"apq: 广播完成，成功 {success_count}/{len(tracked_groups)} 个群聊")
+        需要在持有会话锁时调用
 
-    def _is_super_admin(self, user_id: str) -> bool:
-        """检查用户是否为超级管理员
-        
-        通过配置文件中的 admin_ids 判断用户权限
-        
         Args:
-            user_id: 用户QQ号字符串
+            session_id: 报名所在的会话ID
+            user_id: 玩家QQ号
+            joined_at: 定时器记录的报名时间
         Returns:
-            bool: True表示是超级管理员
+            Optional[Player]: 被移除的玩家，定时器已失效时返回None
         """
-        # 从配置中获取管理员ID列表，如果不存在则返回空列表
-        admin_ids = self.config.get("admin_ids", []) or []
-        # 将所有ID转换为字符串格式统一比较
-        admin_ids = [str(x) for x in admin_ids]
-        return user_id in admin_ids
+        player = self._members_by_qq.get(user_id)
+        if player is None or player.joined_at != joined_at or self._locate(user_id) != session_id:
+            return None
+        session = self._get_session(session_id)
+        if session is not None and session.captain_qq == user_id:
+            return None
+        self._commit("expire_member", session=session_id, qq_number=user_id)
+        return player
+
+    def _expiry_targets(self, session_id: str) -> List[str]:
+        """过期通知的目标群聊
 
-    def _is_group_admin(self, event: AstrMessageEvent) -> bool:
-        """检查消息发送者是否为群组管理员
-        
-        通过多种方式检测用户在群内的管理权限
-        支持不同平台的消息对象结构
-        
         Args:
-            event: 消息事件对象
+            session_id: 会话ID
         Returns:
-            bool: True表示具有群管理权限
+            List[str]: 开启 expiry_broadcast 时为所有记录的群聊，否则只有会话所在的群
         """
-        # 获取消息对象和发送者信息
-        msg = getattr(event, "message_obj", None)
-        sender = getattr(msg, "sender", None) if msg else None
+        if self.expiry_broadcast:
+            return self._broadcast_groups()
+        return [session_id] if session_id != DEFAULT_SESSION else []
 
-        # 如果无法获取发送者信息，返回False
-        if sender is None:
-            return False
+    def _archive_session(self, session_id: str, outcome: str) -> None:
+        """把即将结束的会话写入历史归档（在提交重置之前调用）
 
-        # 检查直接的管理员属性
-        if getattr(sender, "is_owner", False) or getattr(sender, "is_admin", False):
-            return True
+        Args:
+            session_id: 会话ID
+            outcome: 结局（completed/cancelled/expired）
+        """
+        session = self._get_session(session_id)
+        if session is None or session.status != "recruiting":
+            return
+        self._archive_run(session_id, outcome, session.members,
+                          captain=session.captain_qq, started_at=session.created_at)
 
-        # 检查角色属性
-        role = getattr(sender, "role", "")
-        if isinstance(role, str) and role.lower() in {"owner", "admin"}:
-            return True
+    def _archive_run(self, session_id: str, outcome: str, members: List[Dict[str, Any]],
+                     captain: Optional[str] = None, started_at: Optional[int] = None) -> None:
+        """更新出勤统计，并在 I/O 线程中追加历史记录、保存统计（没有事件循环时同步写入）
 
-        # 检查权限属性
-        permission = getattr(sender, "permission", "")
-        if isinstance(permission, str) and permission.lower() in {"owner", "admin"}:
-            return True
+        Args:
+            session_id: 会话ID
+            outcome: 结局
+            members: 队伍成员
+            captain: 队长QQ号
+            started_at: 召集开始时间
+        """
+        # 在事件循环线程上复制成员信息并更新计数，之后的变更不会影响写入的内容
+        record = self.history.make_record(outcome, session_id, members, captain=captain, started_at=started_at)
+        self.stats.apply(record)
+        stats_text = self.stats.encode()
+        if not self.history_enabled:
+            record = None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_run(record, stats_text)
+            return
+        loop.run_in_executor(self._io_executor, self._write_run, record, stats_text)
 
-        return False
+    def _write_run(self, record: Optional[Dict[str, Any]], stats_text: bytes) -> None:
+        """写入一条历史记录（先于统计写入，统计落后时启动时可以由归档补上）
 
-    def _has_admin_rights(self, event: AstrMessageEvent) -> bool:
-        """检查用户是否具有管理员权限
-        
-        综合检查超级管理员和群管理员权限
-        
         Args:
-            event: 消息事件对象
-        Returns:
-            bool: True表示具有管理员权限
+            record: 归档记录，关闭归档时为None
+            stats_text: 已编码的出勤统计
         """
-        uid = self._get_sender_id(event)  # 获取用户QQ号
-        # 用户具有任一管理员权限即可
-        return self._is_super_admin(uid) or self._is_group_admin(event)
+        if record is not None:
+            try:
+                self.history.append(record)
+            except Exception as exc:
+                logger.error("apq: append history failed: %s", exc)
+                logger.error(traceback.format_exc())
+        self._write_stats(stats_text)
 
-    def _remove_user_from_all(self, user_id: str) -> None:
-        """从 members 中移除用户
+    def _write_stats(self, text: bytes) -> None:
+        """写入 stats.json
+
+        Args:
+            text: 已编码的出勤统计
+        """
+        try:
+            self.stats.write(text)
+        except Exception as exc:
+            logger.error("apq: save stats failed: %s", exc)
+            logger.error(traceback.format_exc())
+
+    def _load_stats(self) -> None:
+        """加载出勤统计：文件不可用时由历史归档重建，否则补上归档中更新的记录"""
+        try:
+            if self.stats.load():
+                applied = sum(1 for r in self.history.scan(start=self.stats.last_ts) if self.stats.apply(r))
+                if applied:
+                    logger.info(f"apq: 出勤统计已从历史归档补记 {applied} 场")
+            else:
+                applied = self.stats.rebuild(self.history.scan())
+                logger.info(f"apq: 出勤统计已由历史归档重建，共 {applied} 场")
+            if applied:
+                self._write_stats(self.stats.encode())
+        except Exception as exc:
+            logger.error("apq: load stats failed: %s", exc)
+            logger.error(traceback.format_exc())
 
-        当用户重新报名或被管理员删除时调用
-        确保用户数据的一致性
+    def _announce(self, notices: List[Tuple[List[str], str]]) -> None:
+        """在后台发送锁内产生的通知（发送失败的进入发件箱重试）
 
         Args:
-            user_id: 要移除的用户QQ号
+            notices: (目标群聊, 消息) 列表
         """
-        # 从成员列表中移除用户
-        self.state["members"] = [p for p in self.state.get("members", []) if p.get("qq_number") != user_id]
+        for groups, message in notices:
+            if groups:
+                self._spawn(self._broadcast_to_all_groups(message, groups))
 
-    def _find_user_in_members(self, user_id: str) -> bool:
-        """查找用户是否在成员列表中（通过QQ号）
+    def _format_final_roster(self, title: str, members: List[Dict[str, Any]], footer: str) -> str:
+        """构建成队后的最终名单消息（回复和广播共用）
 
         Args:
-            user_id: 用户QQ号
+            title: 标题行
+            members: 队伍成员
+            footer: 结尾提示
         Returns:
-            bool: True表示用户在成员列表中
+            str: 最终名单消息
         """
-        for p in self.state.get("members", []):
-            if p.get("qq_number") == user_id:
-                return True
-        return False
+        counts = Counter(p.get("gender") for p in members)
+        return self._final_roster_text(title, self._format_player_lines(members), len(members),
+                                       counts["br"], counts["gr"], footer)
 
-    def _find_player_by_character_id(self, char_id: str) -> Optional[Dict[str, Any]]:
-        """通过角色ID查找玩家
+    @staticmethod
+    def _final_roster_text(title: str, member_text: str, total: int, br_count: int, gr_count: int,
+                           footer: str) -> str:
+        """拼接最终名单消息
 
         Args:
-            char_id: 角色ID
+            title: 标题行
+            member_text: 编号的成员列表
+            total: 总人数
+            br_count: br 人数
+            gr_count: gr 人数
+            footer: 结尾提示
         Returns:
-            Optional[Dict[str, Any]]: 找到的玩家数据，未找到返回 None
+            str: 最终名单消息
         """
-        char_id = char_id.strip()  # 清理空格
+        return (f"{title}\n\n{member_text}\n\n【统计】总人数：{total}，br：{br_count}，gr：{gr_count}"
+                f"\n\n{footer}")
+
+    def _format_player_lines(self, players) -> str:
+        """编号的玩家列表，每行一人
 
-        # 在成员列表中查找
-        for p in self.state.get("members", []):
-            if p.get("character_id") == char_id:
-                return p
+        Args:
+            players: 玩家列表
+        Returns:
+            str: 多行文本
+        """
+        return "\n".join(f"{idx}. {self._format_player_info(p)}" for idx, p in enumerate(players, 1))
 
-        return None  # 未找到
+    def _render_roster(self, session_id: str, view: RosterView) -> RosterText:
+        """获取会话的名单文本，视图版本未变时直接返回缓存
 
-    def _is_character_id_taken(self, char_id: str, exclude_user_id: str = None) -> bool:
-        """检查角色ID是否已被使用
+        视图只在变更时重新发布（版本递增），刷屏的 /查询APQ 不会重复拼接名单
 
         Args:
-            char_id: 角色ID
-            exclude_user_id: 要排除的用户ID（用于更换角色时不和自己比较）
+            session_id: 会话ID
+            view: 该会话当前的只读视图
         Returns:
-            bool: True表示角色ID已被使用
+            RosterText: 名单文本
         """
-        char_id = char_id.strip()  # 清理空格
+        cached = self._roster_text.get(session_id)
+        if cached is not None and cached.version == view.version:
+            return cached
 
-        # 在成员列表中查找
-        for p in self.state.get("members", []):
-            # 如果角色ID相同，且不是当前用户（用于更换角色场景）
-            if p.get("character_id") == char_id:
-                if exclude_user_id is None or p.get("qq_number") != exclude_user_id:
-                    return True
-
-        return False
+        members = self._format_player_lines(view.members)
+        lines = ["=== APQ 组队状态 ==="]
+        # 显示队长信息
+        if view.captain:
+            lines.append(f"\n【队长】")
+            lines.append(f"  - {self._format_player_info(view.captain)}")
+        # 显示成员列表
+        if view.members:
+            lines.append(f"\n【成员】({len(view.members)}/{self.TEAM_SIZE}人)")
+            lines.append(members)
+        # 统计信息（br/gr 人数随变更增量维护）
+        lines.append(f"\n【统计】总人数：{len(view.members)}，br：{view.br_count}，gr：{view.gr_count}")
+        # 显示候补名单
+        if view.waitlist:
+            lines.append(f"\n【候补】({len(view.waitlist)}人)")
+            lines.append(self._format_player_lines(view.waitlist))
+
+        rendered = RosterText(view.version, members, "\n".join(lines))
+        if view.version:
+            self._roster_text[session_id] = rendered
+        return rendered
 
     def _format_player_info(self, player: Dict[str, Any]) -> str:
         """格式化玩家信息显示
@@ -329,7 +1839,7 @@ class APQPlugin(Star):
         格式：[角色ID] 性别 职业 (QQ: QQ号)
 
         Args:
-            player: 玩家数据字典
+            player: 玩家
         Returns:
             str: 格式化后的玩家信息字符串
         """
@@ -342,81 +1852,30 @@ class APQPlugin(Star):
         # 返回格式化字符串（直接使用 br/gr）
         return f"[{char_id}] {gender} {job} (QQ: {qq})"
 
-    def _parse_gender(self, gender: str) -> Optional[str]:
-        """解析性别参数，支持中文和英文
-        
-        APQ游戏中只有两种性别：br(新娘) 和 gr(新郎)
-        支持多种输入格式的兼容
-        
-        Args:
-            gender: 性别参数字符串
-        Returns:
-            Optional[str]: 解析后的标准性别代码("br"/"gr")或None
-        """
-        gender = gender.strip().lower()  # 清理空格并转小写
-        
-        # 新娘相关输入映射到"br"
-        if gender in ("br", "新娘"):
-            return "br"
-        # 新郎相关输入映射到"gr"
-        elif gender in ("gr", "新郎"):
-            return "gr"
-        
-        # 无效输入返回None
-        return None
-
-    def _validate_and_parse_join_command(self, content: str) -> Optional[Tuple[str, str, str]]:
-        """
-        验证并解析加入命令，严格验证格式防止信息错位
+    def _parse_role(self, event: AstrMessageEvent, char_id: str, gender: str,
+                    job: str) -> Tuple[Optional[Role], Optional[str]]:
+        """解析 <角色ID> <br/gr/新郎/新娘> <职业>（创建、加入、更换角色共用）
 
-        严格的格式验证确保数据准确性，避免因格式错误导致的信息错位
+        优先解析完整的消息文本，兼容全角空格、含空格的职业和性别别名
 
         Args:
-            content: 完整的命令字符串
+            event: 消息事件对象
+            char_id: 框架传入的角色ID参数
+            gender: 框架传入的性别参数
+            job: 框架传入的职业参数
         Returns:
-            Optional[Tuple[str, str, str]]: (角色ID, 性别, 职业) 或 None
-
-        格式要求: /加入APQ <角色ID> <br/gr/新郎/新娘> <职业>
-        示例: /加入APQ dingzhen br 刀飞
+            Tuple[Optional[Role], Optional[str]]: (角色信息, None) 或 (None, PARSE_USAGE/PARSE_GENDER)
         """
-        # 注意：AstrBot框架的@filter.command装饰器已经移除了命令前缀
-        # 这里只需要清理空格即可
-        content = content.strip()
-
-        # 使用正则表达式严格匹配格式
-        # 模式说明：
-        # ^\s*        - 开头可能有空格
-        # (\S+)       - 第一组：非空白字符（角色ID），至少一个字符
-        # \s+         - 必须有空格分隔
-        # (br|gr|新郎|新娘) - 第二组：性别参数
-        # \s+         - 必须有空格分隔
-        # (\S+(?:\s+\S+)*) - 第三组：职业（可包含空格，由多个非空白字符组成）
-        # \s*$        - 结尾可能有空格
-        pattern = r'^\s*(\S+)\s+(br|gr|新郎|新娘)\s+(\S+(?:\s+\S+)*)\s*$'
-        match = re.match(pattern, content, re.IGNORECASE)  # 忽略大小写匹配
-
-        # 添加调试日志
-        logger.info(f"apq: 解析加入命令 - 原始内容: {repr(content)}")
-        logger.info(f"apq: 正则匹配结果: {match}")
-
-        # 格式不匹配返回None
-        if not match:
-            return None
-
-        # 提取各组匹配内容
-        char_id = match.group(1).strip()      # 角色ID
-        gender_raw = match.group(2).strip()   # 性别原始输入
-        job = match.group(3).strip()          # 职业
-
-        logger.info(f"apq: 解析结果 - char_id={repr(char_id)}, gender={repr(gender_raw)}, job={repr(job)}")
-
-        # 验证职业不为空
-        if not job:
-            return None
-
-        return (char_id, gender_raw, job)
+        message = getattr(event, "message_str", "") or ""
+        role, error = parse_role_args(message, (char_id, gender, job))
+        if self.debug_log:
+            # 只在开启 debug_log 时记录，参数延迟格式化
+            logger.debug("apq: 解析角色参数 %r -> %r (%s)", message, role, error)
+        return role, error
 
     @filter.command("创建APQ")
+    @rate_limited
+    @instrument
     async def create_apq(self, event: AstrMessageEvent, char_id: str = "", gender: str = "", job: str = ""):
         """创建新的 APQ 组队会话并自动加入
 
@@ -431,58 +1890,72 @@ class APQPlugin(Star):
         # 记录群聊ID
         self._track_group_id(event)
 
-        # 清理输入参数
-        char_id = char_id.strip()
-        gender_raw = gender.strip()
-        job = job.strip()
+        # 解析参数（兼容全角空格、含空格的职业和性别别名）
+        role, error = self._parse_role(event, char_id, gender, job)
 
         # 验证必需参数
-        if not char_id or not gender_raw or not job:
+        if error == PARSE_USAGE:
             return event.plain_result("\n用法：/创建APQ <角色ID> <br/gr/新郎/新娘> <职业>\n示例：/创建APQ dingzhen gr 拳手")
 
-        # 解析性别参数为标准格式
-        gender = self._parse_gender(gender_raw)
-        if not gender:
+        # 性别参数必须能解析为标准格式
+        if error == PARSE_GENDER:
             return event.plain_result("\n性别参数错误，必须是 br/新娘 或 gr/新郎")
+        char_id, gender, job = role
 
         # 获取用户基本信息
         uid = self._get_sender_id(event)    # QQ号
         name = self._get_sender_name(event) # 昵称
 
-        # 检查是否已有进行中的APQ
-        # 确保同一时间只有一个APQ活动进行
-        if self.state.get("status") == "recruiting":
-            members = self.state.get("members", [])
-            if members:  # 如果有活动数据
-                # 检查角色ID是否已被使用
-                if self._is_character_id_taken(char_id):
-                    return event.plain_result(f"\n有同名角色 [{char_id}] 已经参加，请使用其他角色名")
-                return event.plain_result("\n目前已有APQ在召集，请等满员发车后再创建新的")
-
-        # 设置活动状态为召集中
-        self.state["status"] = "recruiting"
-
-        # 创建玩家信息对象
-        # 包含完整的玩家数据，用于后续处理和显示
-        player_info = {
-            "qq_number": uid,        # 用户QQ号（唯一标识）
-            "nickname": name,        # 用户昵称
-            "character_id": char_id, # 游戏角色ID
-            "gender": gender,        # 性别（br/gr）
-            "job": job,             # 职业
-        }
-
-        # 设置队长信息
-        self.state["captain"] = player_info.copy()  # 使用副本避免共享引用
-
-        # 将创建者加入成员列表（作为第一个成员）
-        self.state["members"] = [player_info.copy()]  # 使用副本避免共享引用
-        self._save_database()  # 保存到数据库
+        # 会话按群聊划分，不同群聊可以同时召集各自的APQ
+        sid = self._session_id(event)
+
+        # 持有会话锁，保证检查与变更之间不会插入其他变更
+        async with self._session_lock(sid):
+            # 检查本群是否已有进行中的APQ
+            # 确保每个群聊同一时间只有一个APQ活动进行
+            session = self._get_session(sid)
+            if session is not None and session.status == "recruiting":
+                if session.members:  # 如果有活动数据
+                    # 检查角色ID是否已被使用
+                    if self._is_character_id_taken(char_id):
+                        return event.plain_result(f"\n有同名角色 [{char_id}] 已经参加，请使用其他角色名")
+                    return event.plain_result("\n本群目前已有APQ在召集，请等满员发车后再创建新的")
+
+            # 角色ID在所有会话中唯一
+            if self._is_character_id_taken(char_id, exclude_user_id=uid):
+                return event.plain_result(f"\n有同名角色 [{char_id}] 已经参加，请使用其他角色名")
+
+            # 队长不能同时在其他群召集
+            if self._is_captain_elsewhere(uid, sid):
+                return event.plain_result("\n你已是其他群APQ的队长，请先使用 /取消APQ 取消原活动")
+
+            # 创建玩家信息对象
+            # 包含完整的玩家数据，用于后续处理和显示
+            player_info = {
+                "qq_number": uid,        # 用户QQ号（唯一标识）
+                "nickname": name,        # 用户昵称
+                "character_id": char_id, # 游戏角色ID
+                "gender": gender,        # 性别（br/gr）
+                "job": job,             # 职业
+                "joined_at": int(time.time()),  # 报名时间（同时是会话的创建时间）
+            }
+
+            # 设置活动状态为召集中，创建者成为队长并作为第一个成员加入
+            self._commit("create", session=sid, player=player_info)
+
+            # 本群匹配队列中排队的玩家先加入新会话；创建者之前所在的会话可能空出了名额
+            notices: List[Tuple[List[str], str]] = []
+            self._absorb_queue(sid, notices)
+            self._backfill(notices)
+
+        self._announce(notices)
 
         # 返回成功消息（使用 br/gr）
         return event.plain_result(f"\nAPQ组队已创建！你已成为队长并加入：角色 {char_id}，{gender} {job}\n等待其他人加入...")
 
     @filter.command("加入APQ")
+    @rate_limited
+    @instrument
     async def join_apq(self, event: AstrMessageEvent, char_id: str = "", gender: str = "", job: str = ""):
         """
         加入 APQ 组队
@@ -500,86 +1973,106 @@ class APQPlugin(Star):
         # 记录群聊ID
         self._track_group_id(event)
 
-        # 清理输入参数
-        char_id = char_id.strip()
-        gender_raw = gender.strip()
-        job = job.strip()
+        # 解析参数（兼容全角空格、含空格的职业和性别别名）
+        role, error = self._parse_role(event, char_id, gender, job)
 
         # 验证必需参数
-        if not char_id or not gender_raw or not job:
+        if error == PARSE_USAGE:
             return event.plain_result("\n用法：/加入APQ <角色ID> <br/gr/新郎/新娘> <职业>\n示例：/加入APQ 12345 br 刀飞")
 
-        # 解析性别参数为标准格式
-        gender = self._parse_gender(gender_raw)
-        if not gender:
+        # 性别参数必须能解析为标准格式
+        if error == PARSE_GENDER:
             return event.plain_result("\n性别参数错误，必须是 br/新娘 或 gr/新郎")
-
-        # 检查是否有APQ进行中
-        if self.state.get("status") == "idle":
-            return event.plain_result("\n目前没有进行中的APQ活动，请先创建APQ")
+        char_id, gender, job = role
 
         # 获取用户基本信息
         uid = self._get_sender_id(event)    # QQ号
         name = self._get_sender_name(event) # 昵称
 
-        # 检查角色ID是否已被使用
-        if self._is_character_id_taken(char_id, exclude_user_id=uid):
-            return event.plain_result(f"\n有同名角色 [{char_id}] 已经参加，请使用其他角色名")
-
-        # 创建玩家信息对象
-        player_info = {
-            "qq_number": uid,        # 用户QQ号
-            "nickname": name,        # 用户昵称
-            "character_id": char_id, # 角色ID
-            "gender": gender,        # 性别
-            "job": job,             # 职业
-        }
-
-        # 移除用户之前的报名记录
-        # 防止重复报名，确保数据一致性
-        self._remove_user_from_all(uid)
-
-        # 加入成员列表
-        self.state.setdefault("members", []).append(player_info)
-        self._save_database()  # 保存数据
-
-        # 检查是否达到6人，如果达到则自动完成并重置
-        members = self.state.get("members", [])
-        if len(members) >= self.TEAM_SIZE:
-            # 构建最终名单消息
-            lines = ["=== APQ 集结完成 ===\n"]
-            for idx, p in enumerate(members, 1):
-                lines.append(f"{idx}. {self._format_player_info(p)}")
-
-            # 计算统计信息
-            br_count = sum(1 for p in members if p.get("gender") == "br")
-            gr_count = sum(1 for p in members if p.get("gender") == "gr")
-            lines.append(f"\n【统计】总人数：{len(members)}，br：{br_count}，gr：{gr_count}")
-
-            final_message = "\n".join(lines) + "\n\nAPQ活动已结束，数据已清空，准备下一场活动！"
-
-            # 广播消息到所有记录的群聊
-            tracked_groups = self.state.get("tracked_groups", [])
-            if tracked_groups:
-                await self._broadcast_to_all_groups(final_message)
-
-            # 重置database.json的数据（包括清空tracked_groups）
-            self.state = {"status": "idle", "captain": {}, "members": [], "tracked_groups": []}
-            self._save_database()
-
-            # 返回完成消息
-            return event.plain_result("\n" + final_message)
-
-        # 返回成功消息和当前所有已参与的成员信息（使用 br/gr）
-
-        # 构建当前成员列表
-        lines = [f"已加入APQ！角色：{char_id}，{gender} {job}\n\n当前成员 ({len(members)}/{self.TEAM_SIZE})："]
-        for idx, p in enumerate(members, 1):
-            lines.append(f"{idx}. {self._format_player_info(p)}")
-
-        return event.plain_result("\n" + "\n".join(lines))
+        # 加入本群的会话
+        sid = self._session_id(event)
+
+        # 持有会话锁完成 检查 -> 加入 -> 满员重置，避免并发加入写入即将被清空的名单
+        async with self._session_lock(sid):
+            # 检查本群是否有APQ进行中，没有时进入匹配队列
+            session = self._get_session(sid)
+            recruiting = session is not None and session.status != "idle"
+            if not recruiting and not self.matchmaking_enabled:
+                return event.plain_result("\n本群目前没有进行中的APQ活动，请先创建APQ")
+
+            # 检查角色ID是否已被使用
+            if self._is_character_id_taken(char_id, exclude_user_id=uid):
+                return event.plain_result(f"\n有同名角色 [{char_id}] 已经参加，请使用其他角色名")
+
+            # 队长转到其他群会让原活动失去队长
+            if self._is_captain_elsewhere(uid, sid):
+                return event.plain_result("\n你已是其他群APQ的队长，请先使用 /取消APQ 取消原活动")
+
+            # 创建玩家信息对象
+            player_info = {
+                "qq_number": uid,        # 用户QQ号
+                "nickname": name,        # 用户昵称
+                "character_id": char_id, # 角色ID
+                "gender": gender,        # 性别
+                "job": job,             # 职业
+                "joined_at": int(time.time()),  # 报名时间，用于报名超时
+            }
+
+            notices: List[Tuple[List[str], str]] = []  # 锁释放后再发送的 (目标群聊, 消息)
+            if not recruiting:
+                # 进入本群的匹配队列（会先移除用户之前的报名记录），每次入队做一次增量匹配
+                self._commit("enqueue", session=sid, player=player_info)
+                final_message = self._try_match(sid)
+                if final_message is None:
+                    reply = (f"本群目前没有召集中的APQ，已进入匹配队列：角色 {char_id}，{gender} {job}\n"
+                             f"当前排队 {len(self._matchers[sid])} 人，能组成符合规则的{self.TEAM_SIZE}人队伍时自动成队")
+                else:
+                    reply = final_message
+                    notices.append((self._broadcast_groups(), final_message))
+            else:
+                # 检查加入后队伍是否仍能满足组成规则（br/gr 人数、职业上限）
+                others = [p for p in session.members if p.qq_number != uid]
+                reason = self.composition.admits(others, player_info)
+                if reason and self._session_of(uid) == sid:
+                    # 已是本队成员：保留原报名，不要挪进候补
+                    return event.plain_result(f"\n无法加入：{reason}，请更换角色后再试")
+
+                if reason and self._waitlist_of(uid) == sid:
+                    # 已在本队候补：保留原来的候补位置，不要排到队尾
+                    return event.plain_result(f"\n暂时无法加入：{reason}\n"
+                                              f"你已在候补（第{self._waitlists[sid].position(uid)}位），满足规则时自动转正；"
+                                              f"如需修改角色请使用 /更换APQ角色")
+
+                if reason:
+                    # 不满足组成规则：进入本会话的候补名单，有人退出或更换角色后按顺序自动转正
+                    self._commit("waitlist", session=sid, player=player_info)
+                    reply = (f"暂时无法加入：{reason}\n"
+                             f"已进入候补（第{self._waitlists[sid].position(uid)}位），满足规则时自动转正")
+                else:
+                    # 加入成员列表（会先移除用户之前的报名记录，防止重复报名）
+                    self._commit("join", session=sid, player=player_info)
+
+                    members = session.members
+                    if len(members) < self.TEAM_SIZE:
+                        # 未满6人：返回成功消息和当前所有已参与的成员信息（使用 br/gr，名单文本按视图版本缓存）
+                        roster = self._render_roster(sid, self._get_view(sid))
+                        reply = (f"已加入APQ！角色：{char_id}，{gender} {job}\n\n"
+                                 f"当前成员 ({len(members)}/{self.TEAM_SIZE})：\n{roster.members}")
+                    else:
+                        # 达到6人：构建最终名单消息并重置本群会话
+                        reply = self._finish_session(sid, notices)
+
+            # 用户之前所在的会话可能空出了名额
+            self._backfill(notices)
+
+        # 广播消息到所有记录的群聊（后台并发发送，不等待慢群，立即回复当前用户）
+        self._announce(notices)
+
+        return event.plain_result("\n" + reply)
 
     @filter.command("查询APQ")
+    @rate_limited
+    @instrument
     async def query_apq(self, event: AstrMessageEvent):
         """查询当前 APQ 组队状态
 
@@ -592,39 +2085,32 @@ class APQPlugin(Star):
         # 记录群聊ID
         self._track_group_id(event)
 
-        # 获取当前状态数据
-        captain = self.state.get("captain", {})
-        members = self.state.get("members", [])
+        # 获取本群会话的只读视图（无需加锁）
+        sid = self._session_id(event)
+        view = self._get_view(sid)
+        captain = view.captain
+        members = view.members
+        matcher = self._matchers.get(sid)
+        queued = len(matcher) if matcher is not None else 0
 
         # 检查是否有活动进行中
         if not captain and not members:
+            if queued:
+                return event.plain_result(
+                    f"\n当前没有APQ组队。\n【匹配队列】{queued}人排队中，能组成符合规则的队伍时自动成队，使用 /加入APQ 排队")
             return event.plain_result("\n当前没有APQ组队，使用 /创建APQ 创建新的组队。")
 
-        # 构建显示内容
-        lines = ["=== APQ 组队状态 ==="]
-
-        # 显示队长信息
-        if captain:
-            lines.append(f"\n【队长】")
-            lines.append(f"  - {self._format_player_info(captain)}")
-
-        # 显示成员列表
-        if members:
-            lines.append(f"\n【成员】({len(members)}/{self.TEAM_SIZE}人)")
-            for idx, p in enumerate(members, 1):
-                lines.append(f"{idx}. {self._format_player_info(p)}")
-
-        # 计算统计信息
-        br_count = sum(1 for p in members if p.get("gender") == "br")
-        gr_count = sum(1 for p in members if p.get("gender") == "gr")
-
-        # 添加统计信息
-        lines.append(f"\n【统计】总人数：{len(members)}，br：{br_count}，gr：{gr_count}")
+        # 名单部分按视图版本缓存，只有匹配队列人数需要现算
+        text = self._render_roster(sid, view).status
+        if queued:
+            text += f"\n\n【匹配队列】{queued}人排队中"
 
         # 返回格式化结果
-        return event.plain_result("\n" + "\n".join(lines))
+        return event.plain_result("\n" + text)
 
     @filter.command("我的APQ")
+    @rate_limited
+    @instrument
     async def my_apq(self, event: AstrMessageEvent):
         """查询自己的 APQ 报名状态
 
@@ -640,21 +2126,46 @@ class APQPlugin(Star):
         # 获取用户QQ号
         uid = self._get_sender_id(event)
 
-        # 在成员列表中查找
-        members = self.state.get("members", [])
-        for idx, p in enumerate(members, 1):
-            if p.get("qq_number") == uid:
-                char_id = p.get("character_id", "?")
-                gender = p.get("gender", "?")
-                job = p.get("job", "?")
-                is_captain = p.get("qq_number") == self.state.get("captain", {}).get("qq_number")
-                role = "队长" if is_captain else "队员"
-                return event.plain_result(f"\n你在APQ中（{role}）\n角色ID：{char_id}\n性别：{gender}\n职业：{job}\n当前人数：{len(members)}/{self.TEAM_SIZE}")
+        # 在用户所在会话的只读视图中查找（无需加锁）
+        view = self._get_view(self._session_of(uid))
+        members = view.members
+        p = view.members_by_qq.get(uid)
+        if p is not None:
+            char_id = p.get("character_id", "?")
+            gender = p.get("gender", "?")
+            job = p.get("job", "?")
+            is_captain = p.get("qq_number") == view.captain.get("qq_number")
+            role = "队长" if is_captain else "队员"
+            return event.plain_result(f"\n你在APQ中（{role}）\n角色ID：{char_id}\n性别：{gender}\n职业：{job}\n当前人数：{len(members)}/{self.TEAM_SIZE}")
+
+        # 在候补名单中查找
+        wsid = self._waitlist_of(uid)
+        if wsid is not None:
+            waitlist = self._waitlists[wsid]
+            p = self._members_by_qq[uid]
+            return event.plain_result(
+                f"\n你在APQ候补中（第{waitlist.position(uid)}位，共{len(waitlist)}人）\n"
+                f"角色ID：{p.get('character_id', '?')}\n性别：{p.get('gender', '?')}\n职业：{p.get('job', '?')}\n"
+                f"有人退出或更换角色后满足组成规则时自动转正"
+            )
+
+        # 在匹配队列中查找
+        qsid = self._queue_of(uid)
+        if qsid is not None:
+            matcher = self._matchers[qsid]
+            p = self._members_by_qq[uid]
+            return event.plain_result(
+                f"\n你在匹配队列中（第{matcher.position(uid)}位，共{len(matcher)}人）\n"
+                f"角色ID：{p.get('character_id', '?')}\n性别：{p.get('gender', '?')}\n职业：{p.get('job', '?')}\n"
+                f"能组成符合规则的{self.TEAM_SIZE}人队伍时自动成队"
+            )
 
         # 未找到报名记录
         return event.plain_result("\n你还没有加入APQ组队。\n使用 /加入APQ <角色ID> <br/gr/新郎/新娘> <职业> 来加入组队")
 
     @filter.command("取消APQ")
+    @rate_limited
+    @instrument
     async def cancel_apq(self, event: AstrMessageEvent):
         """创建者取消自己的 APQ 活动，直接清空database.json的数据
 
@@ -670,25 +2181,31 @@ class APQPlugin(Star):
         # 获取用户ID
         uid = self._get_sender_id(event)
 
-        # 获取队长信息
-        captain = self.state.get("captain", {})
+        # 队长取消的是自己所在的会话（可能不是当前群聊）
+        sid = self._session_of(uid) or self._session_id(event)
+
+        # 持有会话锁，保证检查与变更之间不会插入其他变更
+        async with self._session_lock(sid):
+            # 获取队长信息
+            session = self._get_session(sid)
 
-        # 检查是否有APQ进行中
-        if not captain and not self.state.get("members"):
-            return event.plain_result("\n当前没有APQ组队。")
+            # 检查是否有APQ进行中
+            if session is None or (session.captain is None and not session.members):
+                return event.plain_result("\n当前没有APQ组队。")
 
-        # 验证是否是队长（创建者）
-        if captain.get("qq_number") != uid:
-            return event.plain_result("\n只有APQ创建者才能取消活动。")
+            # 验证是否是队长（创建者）
+            if session.captain_qq != uid:
+                return event.plain_result("\n只有APQ创建者才能取消活动。")
 
-        # 清空database.json的数据
-        # 直接重置为初始状态（包括清空tracked_groups）
-        self.state = {"status": "idle", "captain": {}, "members": [], "tracked_groups": []}
-        self._save_database()  # 保存清空后的状态
+            # 只清空该会话的数据，其他群的会话不受影响
+            self._archive_session(sid, "cancelled")
+            self._commit("reset", session=sid)
 
-        return event.plain_result("\nAPQ活动已取消，数据已清空。")
+            return event.plain_result("\nAPQ活动已取消，数据已清空。")
 
     @filter.command("退出APQ")
+    @rate_limited
+    @instrument
     async def quit_apq(self, event: AstrMessageEvent):
         """退出 APQ 组队
 
@@ -704,29 +2221,49 @@ class APQPlugin(Star):
         # 获取用户ID
         uid = self._get_sender_id(event)
 
-        # 获取队长信息
-        captain = self.state.get("captain", {})
+        # 退出的是用户所在的会话（或候补、排队所在的群）
+        sid = self._locate(uid) or self._session_id(event)
+
+        # 持有会话锁，保证检查与变更之间不会插入其他变更
+        async with self._session_lock(sid):
+            # 排队中的玩家直接出队
+            if self._queue_of(uid) == sid:
+                self._commit("quit", session=sid, qq_number=uid)
+                return event.plain_result("\n已退出匹配队列。")
+
+            # 候补玩家直接移出候补名单
+            if self._waitlist_of(uid) == sid:
+                self._commit("quit", session=sid, qq_number=uid)
+                return event.plain_result("\n已退出候补。")
+
+            # 获取队长信息
+            session = self._get_session(sid)
+
+            # 检查是否有APQ进行中
+            if session is None or session.status == "idle" or not session.members:
+                return event.plain_result("\n当前没有APQ组队。")
 
-        # 检查是否有APQ进行中
-        if self.state.get("status") == "idle" or not self.state.get("members"):
-            return event.plain_result("\n当前没有APQ组队。")
+            # 验证是否是队长
+            if session.captain_qq == uid:
+                return event.plain_result("\n你是APQ创建者（队长），如需取消活动请使用 /取消APQ")
 
-        # 验证是否是队长
-        if captain.get("qq_number") == uid:
-            return event.plain_result("\n你是APQ创建者（队长），如需取消活动请使用 /取消APQ")
+            # 检查用户是否在成员列表中
+            is_member = self._find_user_in_members(uid)
+            if not is_member:
+                return event.plain_result("\n你还没有加入APQ组队。")
 
-        # 检查用户是否在成员列表中
-        is_member = self._find_user_in_members(uid)
-        if not is_member:
-            return event.plain_result("\n你还没有加入APQ组队。")
+            # 移除用户，空出的名额按候补顺序转正
+            self._commit("quit", session=sid, qq_number=uid)
+            notices: List[Tuple[List[str], str]] = []
+            self._backfill(notices)
 
-        # 移除用户
-        self._remove_user_from_all(uid)
-        self._save_database()  # 保存更新后的状态
+        self._announce(notices)
 
         return event.plain_result("\n已退出APQ组队。")
 
     @filter.command("更换APQ角色")
+    @rate_limited
+    @instrument
     async def replace_apq(self, event: AstrMessageEvent, char_id: str = "", gender: str = "", job: str = ""):
         """更换角色信息
 
@@ -741,59 +2278,74 @@ class APQPlugin(Star):
         # 记录群聊ID
         self._track_group_id(event)
 
-        # 清理输入参数
-        char_id = char_id.strip()
-        gender_raw = gender.strip()
-        job = job.strip()
+        # 解析参数（兼容全角空格、含空格的职业和性别别名）
+        role, error = self._parse_role(event, char_id, gender, job)
 
         # 验证必需参数
-        if not char_id or not gender_raw or not job:
+        if error == PARSE_USAGE:
             return event.plain_result("\n用法：/更换APQ角色 <角色ID> <br/gr/新郎/新娘> <职业>\n示例：/更换APQ角色 dingzhen2 gr 拳手")
 
-        # 解析性别参数为标准格式
-        gender = self._parse_gender(gender_raw)
-        if not gender:
+        # 性别参数必须能解析为标准格式
+        if error == PARSE_GENDER:
             return event.plain_result("\n性别参数错误，必须是 br/新娘 或 gr/新郎")
+        char_id, gender, job = role
 
         # 获取用户ID
         uid = self._get_sender_id(event)
 
-        # 检查是否是队长
-        is_captain = self.state.get("captain", {}).get("qq_number") == uid
+        # 修改的是用户所在会话（或候补、匹配队列）中的记录
+        sid = self._locate(uid) or self._session_id(event)
 
-        # 在成员列表中查找用户记录
-        found = False  # 标记是否找到用户记录
-        for p in self.state.get("members", []):
+        # 持有会话锁，保证检查与变更之间不会插入其他变更
+        async with self._session_lock(sid):
             # 普通用户只能修改自己的信息
-            if p.get("qq_number") == uid:
-                p["character_id"] = char_id  # 更新角色ID
-                p["gender"] = gender         # 更新性别
-                p["job"] = job              # 更新职业
-                found = True
-                break
-
-        # 如果是队长，同时更新队长信息
-        if is_captain and found:
-            self.state["captain"]["character_id"] = char_id
-            self.state["captain"]["gender"] = gender
-            self.state["captain"]["job"] = job
-
-        # 如果未找到用户记录
-        if not found:
-            return event.plain_result("\n你还没有加入APQ组队。")
-
-        self._save_database()  # 保存更新后的数据
+            if not self._find_user_in_members(uid):
+                return event.plain_result("\n你还没有加入APQ组队。")
+
+            # 新角色ID不能与其他成员重复（角色ID索引要求唯一）
+            if self._is_character_id_taken(char_id, exclude_user_id=uid):
+                return event.plain_result(f"\n有同名角色 [{char_id}] 已经参加，请使用其他角色名")
+
+            # 会话成员更换后，队伍仍需能满足组成规则
+            session_sid = self._session_of(uid)
+            if session_sid is not None:
+                others = [p for p in self.state["sessions"][session_sid].members if p.qq_number != uid]
+                reason = self.composition.admits(others, {"gender": gender, "job": job})
+                if reason:
+                    return event.plain_result(f"\n无法更换：{reason}")
+
+            # 更新成员信息（队长引用同一个成员对象，随之更新）
+            self._commit("replace", session=sid, qq_number=uid, character_id=char_id, gender=gender, job=job)
+
+            notices: List[Tuple[List[str], str]] = []
+            final_message = None
+            if self._queue_of(uid) == sid:
+                # 排队中的玩家更换后可能恰好能组成队伍
+                final_message = self._try_match(sid)
+                if final_message is not None:
+                    notices.append((self._broadcast_groups(), final_message))
+            else:
+                # 队伍组成变化后，候补（包括自己）可能可以转正
+                self._backfill(notices)
+
+        self._announce(notices)
+
+        if final_message is not None:
+            return event.plain_result("\n" + final_message)
 
         # 返回成功消息（使用 br/gr）
         return event.plain_result(f"\n已更新角色信息：角色 {char_id}，{gender} {job}")
 
     @filter.command("删除APQ角色")
+    @rate_limited
+    @instrument
     async def delete_apq_char(self, event: AstrMessageEvent, identifier: str = ""):
-        """从APQ中删除指定角色（管理员）
+        """从APQ中删除指定角色（管理员、会话管理员）
 
         管理员专用命令，用于移除违规或不当报名的玩家
         支持通过QQ号或角色ID来查找并删除角色
         如果删除的角色是队长，则等同于重置APQ
+        群管理员和会话管理员只能删除本群会话、候补或匹配队列中的角色，超级管理员不受限制
 
         Args:
             event: 消息事件对象
@@ -802,8 +2354,8 @@ class APQPlugin(Star):
         # 记录群聊ID
         self._track_group_id(event)
 
-        # 检查管理员权限
-        if not self._has_admin_rights(event):
+        # 检查会话管理权限
+        if not self._can_moderate(event):
             return event.plain_result("\n仅管理员可删除角色。")
 
         # 清理输入参数
@@ -818,40 +2370,101 @@ class APQPlugin(Star):
 
         # 如果通过角色ID找不到，尝试通过QQ号查找
         if player is None:
-            for p in self.state.get("members", []):
-                if p.get("qq_number") == identifier:
-                    player = p
-                    break
+            player = self._find_player_by_qq(identifier)
 
         # 如果未找到玩家
         if player is None:
             return event.plain_result(f"\n未找到 {identifier} 对应的APQ记录（请检查角色ID或QQ号）。")
 
-        # 获取玩家的QQ号、角色ID和昵称
-        user_id = player.get("qq_number")
-        char_id = player.get("character_id", identifier)
-        player_name = player.get("nickname", user_id)
+        # 玩家可能在任意群的会话、候补或匹配队列中
+        target = player.get("qq_number")
+        sid = self._locate(target)
 
-        # 检查该玩家是否是队长
-        captain = self.state.get("captain", {})
-        if captain.get("qq_number") == user_id:
-            # 删除队长等同于重置APQ
-            self.state = {"status": "idle", "captain": {}, "members": [], "tracked_groups": []}
-            self._save_database()
-            return event.plain_result(f"\n已将队长 {char_id}({player_name}) 删除，APQ已重置。")
+        # 只有超级管理员可以跨群删除，其他人只能管理本群
+        if sid != self._session_id(event) and not self._is_super_admin(self._get_sender_id(event)):
+            return event.plain_result(f"\n{identifier} 不在本群的APQ中，只能删除本群的角色。")
+
+        # 持有会话锁，保证检查与变更之间不会插入其他变更
+        async with self._session_lock(sid):
+            # 等待锁期间玩家可能已经退出
+            if self._locate(target) != sid:
+                return event.plain_result(f"\n未找到 {identifier} 对应的APQ记录（请检查角色ID或QQ号）。")
+
+            # 获取玩家的QQ号、角色ID和昵称
+            user_id = player.get("qq_number")
+            char_id = player.get("character_id", identifier)
+            player_name = player.get("nickname", user_id)
 
-        # 从成员列表中移除玩家
-        self._remove_user_from_all(user_id)
-        self._save_database()  # 保存更新后的状态
+            # 检查该玩家是否是队长
+            session = self._get_session(sid)
+            if session is not None and session.captain_qq == user_id:
+                # 删除队长等同于重置该会话
+                self._archive_session(sid, "cancelled")
+                self._commit("reset", session=sid)
+                return event.plain_result(f"\n已将队长 {char_id}({player_name}) 删除，APQ已重置。")
+
+            # 从成员列表中移除玩家，空出的名额按候补顺序转正
+            self._commit("delete", session=sid, qq_number=user_id)
+            notices: List[Tuple[List[str], str]] = []
+            self._backfill(notices)
+
+        self._announce(notices)
 
         return event.plain_result(f"\n已将角色 {char_id}({player_name}) 从APQ中移除。")
 
     @filter.command("重置APQ")
-    async def reset_apq(self, event: AstrMessageEvent):
-        """重置 APQ 组队数据（管理员）
+    @rate_limited
+    @instrument
+    async def reset_apq(self, event: AstrMessageEvent, scope: str = ""):
+        """重置 APQ 组队数据（管理员、会话管理员）
+
+        管理员专用命令，默认只重置本群的APQ会话（会话管理员也可以）
+        带参数“全部”时重置所有群的会话和tracked_groups（仅限超级管理员）
+        慎用！会丢失当前活动数据
+
+        Args:
+            event: 消息事件对象
+            scope: 重置范围，“全部”表示所有会话
+        """
+        # 记录群聊ID
+        self._track_group_id(event)
+
+        # 检查会话管理权限
+        level = self._permission_level(event)
+        if level < self.ROLE_MODERATOR:
+            return event.plain_result("\n仅管理员可重置APQ。")
 
-        管理员专用命令，用于完全重置所有APQ数据
-        慎用！会丢失所有当前活动数据
+        # 全部重置：不涉及检查，直接同步提交
+        if scope.strip() in ("全部", "all"):
+            # 群管理员只管理自己的群，不能重置其他群的数据
+            if not self._is_super_admin(self._get_sender_id(event)):
+                return event.plain_result("\n仅超级管理员可重置所有群的APQ，其他管理员只能重置本群。")
+            # 完全重置状态数据（包括清空tracked_groups），召集中的会话记为取消
+            for sid in list(self.state["sessions"]):
+                self._archive_session(sid, "cancelled")
+            self._commit("reset_all")
+            self.groups.clear()
+            self._save_groups()
+            return event.plain_result("\n已重置所有群的APQ组队数据。")
+
+        sid = self._session_id(event)
+
+        # 持有会话锁，保证检查与变更之间不会插入其他变更
+        async with self._session_lock(sid):
+            # 只重置本群的会话和匹配队列
+            self._archive_session(sid, "cancelled")
+            self._commit("reset", session=sid)
+            self._commit("clear_queue", session=sid)
+
+            return event.plain_result("\n已重置本群的APQ组队数据。")
+
+    @filter.command("APQ存储状态")
+    @rate_limited
+    @instrument
+    async def storage_status_apq(self, event: AstrMessageEvent):
+        """查看持久化统计（管理员）
+
+        显示变更次数、实际刷盘次数以及被合并的变更次数，用于观察延迟刷盘节省的写入
 
         Args:
             event: 消息事件对象
@@ -861,15 +2474,235 @@ class APQPlugin(Star):
 
         # 检查管理员权限
         if not self._has_admin_rights(event):
-            return event.plain_result("\n仅管理员可重置APQ。")
+            return event.plain_result("\n仅管理员可查看存储状态。")
+
+        stats = self.persist_stats
+        lines = [
+            "=== APQ 存储状态 ===",
+            f"存储模式：{self.storage_mode}",
+            f"JSON编解码：{codec.backend()}",
+            f"合并窗口：{self.flush_interval_ms} ms",
+            f"变更次数：{stats['mutations']}",
+            f"刷盘次数：{stats['flushes']}",
+            f"合并次数：{stats['coalesced']}",
+            f"待写入变更：{len(self._pending_records)}",
+        ]
+        return event.plain_result("\n" + "\n".join(lines))
+
+    @filter.command("APQ导出")
+    @rate_limited
+    @instrument
+    async def export_apq(self, event: AstrMessageEvent):
+        """把当前数据导出为带缩进的 JSON 文件（管理员）
+
+        database.json 为紧凑格式，导出文件结构与之相同但缩进两格，便于人工查看；
+        SQLite 模式下也可以用它查看数据。文件保存在数据目录的 exports/ 下
+
+        Args:
+            event: 消息事件对象
+        """
+        # 记录群聊ID
+        self._track_group_id(event)
+
+        # 检查管理员权限
+        if not self._has_admin_rights(event):
+            return event.plain_result("\n仅管理员可导出数据。")
+
+        # 在事件循环线程上编码，得到某一时刻一致的内容，写文件交给 I/O 线程
+        data = encode_snapshot(self.state, pretty=True)
+        export_dir = self.data_dir / "exports"
+        path = export_dir / time.strftime("database-%Y%m%d-%H%M%S.json")
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._io_executor, self._write_export, path, data)
+        except Exception as exc:
+            logger.error("apq: export failed: %s", exc)
+            logger.error(traceback.format_exc())
+            return event.plain_result("\n导出失败，请查看日志。")
+        return event.plain_result(f"\n已导出到 {export_dir.name}/{path.name}（{len(data)} 字节）。")
 
-        # 完全重置状态数据（包括清空tracked_groups）
-        self.state = {"status": "idle", "captain": {}, "members": [], "tracked_groups": []}
-        self._save_database()  # 保存重置后的状态
+    @staticmethod
+    def _write_export(path: Path, data: bytes) -> None:
+        """写入导出文件（在 I/O 线程中调用）
 
-        return event.plain_result("\n已重置APQ组队数据。")
+        Args:
+            path: 导出文件路径
+            data: 已编码的内容
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(path, data)
+
+    @filter.command("APQ广播状态")
+    @rate_limited
+    @instrument
+    async def outbox_status_apq(self, event: AstrMessageEvent):
+        """查看广播发件箱状态（管理员）
+
+        显示待重试的投递数量、累计重试次数、重试成功和放弃的次数
+
+        Args:
+            event: 消息事件对象
+        """
+        # 记录群聊ID
+        self._track_group_id(event)
+
+        # 检查管理员权限
+        if not self._has_admin_rights(event):
+            return event.plain_result("\n仅管理员可查看广播状态。")
+
+        stats = self.outbox.stats
+        lines = [
+            "=== APQ 广播状态 ===",
+            f"待重试投递：{self.outbox.depth}",
+            f"累计重试次数：{stats['retries']}",
+            f"重试成功：{stats['delivered']}",
+            f"放弃投递：{stats['dropped']}",
+        ]
+        next_due = self.outbox.next_due_in()
+        if next_due is not None:
+            lines.append(f"下一次重试：{next_due:.0f} 秒后")
+        return event.plain_result("\n" + "\n".join(lines))
+
+    @filter.command("APQ性能")
+    @rate_limited
+    @instrument
+    async def metrics_apq(self, event: AstrMessageEvent):
+        """查看命令调用次数、异常次数和耗时分布（管理员）
+
+        Args:
+            event: 消息事件对象
+        """
+        # 记录群聊ID
+        self._track_group_id(event)
+
+        # 检查管理员权限
+        if not self._has_admin_rights(event):
+            return event.plain_result("\n仅管理员可查看性能统计。")
+
+        uptime = int(time.time() - self.metrics.started_at)
+        lines = [f"=== APQ 性能统计（运行 {uptime // 3600} 小时 {uptime % 3600 // 60} 分钟）==="]
+        lines.extend(self.metrics.summary() or ["暂无数据"])
+        if self.metrics_export_interval > 0:
+            lines.append(f"\n每 {self.metrics_export_interval:g} 秒导出到 {self.metrics_path.name}")
+        return event.plain_result("\n" + "\n".join(lines))
+
+    @filter.command("APQ历史")
+    @rate_limited
+    @instrument
+    async def history_apq(self, event: AstrMessageEvent, days: str = ""):
+        """查询最近结束的APQ
+
+        按时间范围流式扫描历史归档，只读取范围内的月份段，不把整个归档读进内存
+
+        Args:
+            event: 消息事件对象
+            days: 查询最近多少天，默认7天
+        """
+        # 记录群聊ID
+        self._track_group_id(event)
+
+        days = days.strip()
+        if days and not days.isdigit():
+            return event.plain_result("\n用法：/APQ历史 [天数]\n示例：/APQ历史 30")
+        span = int(days) if days else 7
+
+        # 在 I/O 线程中扫描，排在尚未写完的归档追加之后
+        since = time.time() - span * 86400
+        loop = asyncio.get_running_loop()
+        records, total = await loop.run_in_executor(self._io_executor, self.history.recent, since, 10)
+        if not total:
+            return event.plain_result(f"\n最近 {span} 天没有APQ记录。")
+
+        labels = {"completed": "发车", "matched": "匹配成队", "cancelled": "取消", "expired": "超时取消"}
+        lines = [f"=== 最近 {span} 天的APQ（共 {total} 场，显示最近 {len(records)} 场）==="]
+        for record in records:
+            members = record.get("members", [])
+            br = sum(1 for p in members if p.get("gender") == "br")
+            when = time.strftime("%m-%d %H:%M", time.localtime(record["ts"]))
+            names = "、".join(p.get("character_id", "") for p in members)
+            lines.append(f"{when} {labels.get(record.get('outcome'), record.get('outcome'))} "
+                         f"{len(members)}人（br {br} / gr {len(members) - br}）：{names}")
+        return event.plain_result("\n" + "\n".join(lines))
+
+    @filter.command("APQ统计")
+    @rate_limited
+    @instrument
+    async def stats_apq(self, event: AstrMessageEvent, arg: str = ""):
+        """查询出勤统计，或由历史归档重建统计（管理员）
+
+        统计在每场结束时增量更新，最近N天的合计按日期滚动维护，查询不扫描历史
+
+        Args:
+            event: 消息事件对象
+            arg: 天数（默认30），或“重建”
+        """
+        # 记录群聊ID
+        self._track_group_id(event)
+
+        arg = arg.strip()
+        if arg in ("重建", "rebuild"):
+            if not self._has_admin_rights(event):
+                return event.plain_result("\n仅管理员可重建统计。")
+            return event.plain_result("\n" + await self._rebuild_stats())
+        if arg and not arg.isdigit():
+            return event.plain_result("\n用法：/APQ统计 [天数]\n示例：/APQ统计 7")
+        span = max(1, int(arg)) if arg else 30
+        if span > self.stats.retention_days:
+            span = self.stats.retention_days
+
+        stats = self.stats
+        window = stats.window(span)
+        br, gr = window["gender"].get("br", 0), window["gender"].get("gr", 0)
+        lines = [
+            f"=== APQ 出勤统计（最近 {span} 天）===",
+            f"出发场数：{window['runs']}",
+            f"br / gr 人次：{br} / {gr}" + (f"（br 占 {br * 100 // (br + gr)}%）" if br + gr else ""),
+        ]
+        top_players = stats.top(window["qq"], 5)
+        if top_players:
+            lines.append("\n【出勤排行】")
+            for idx, (qq, count) in enumerate(top_players, 1):
+                lines.append(f"{idx}. {stats.names.get(qq, qq)} {count} 场")
+        top_jobs = stats.top(window["job"], 5)
+        if top_jobs:
+            lines.append("\n【职业分布】")
+            lines.append("、".join(f"{stats.job_names.get(job, job)} {count}" for job, count in top_jobs))
+
+        outcomes = stats.outcomes
+        lines.append(f"\n累计：发车 {outcomes.get('completed', 0)} 场，匹配成队 {outcomes.get('matched', 0)} 场，"
+                     f"取消 {outcomes.get('cancelled', 0)} 场，超时 {outcomes.get('expired', 0)} 场")
+
+        # 发送者自己的出勤
+        uid = self._get_sender_id(event)
+        if stats.by_qq.get(uid):
+            chars = "、".join(f"{c}×{n}" for c, n in stats.top(stats.qq_chars.get(uid, Counter()), 5))
+            lines.append(f"你的出勤：最近 {span} 天 {window['qq'].get(uid, 0)} 场，累计 {stats.by_qq[uid]} 场（{chars}）")
+        return event.plain_result("\n" + "\n".join(lines))
+
+    async def _rebuild_stats(self) -> str:
+        """在 I/O 线程中由历史归档重建出勤统计
+
+        重建期间结束的场次先计入旧的统计，替换后再从归档补记
+
+        Returns:
+            str: 回复消息
+        """
+        loop = asyncio.get_running_loop()
+        fresh = AttendanceStats(self.stats.path, retention_days=self.stats.retention_days)
+        count = await loop.run_in_executor(self._io_executor, fresh.rebuild, self.history.scan())
+        self.stats = fresh
+        # 排在重建之后的归档写入已经完成，补上这些记录
+        late = await loop.run_in_executor(
+            self._io_executor, lambda: list(self.history.scan(start=fresh.last_ts)))
+        count += sum(1 for r in late if fresh.apply(r))
+        text = fresh.encode()
+        await loop.run_in_executor(self._io_executor, self._write_stats, text)
+        logger.info(f"apq: 出勤统计已由历史归档重建，共 {count} 场")
+        return f"出勤统计已由历史归档重建，共 {count} 场。"
 
     @filter.command("APQ命令使用帮助")
+    @rate_limited
+    @instrument
     async def help_apq(self, event: AstrMessageEvent):
         """显示APQ插件的帮助信息
 
@@ -904,19 +2737,40 @@ class APQPlugin(Star):
 /取消APQ
   取消当前APQ活动（仅限创建者）
 
+/APQ历史 [天数]
+  查询最近结束的APQ（默认最近7天）
+
+/APQ统计 [天数]
+  查询最近N天（默认30天）的出勤排行、职业分布和自己的出勤
+
 【参数说明】
 - 角色ID: 游戏内角色唯一标识
-- br/新娘: 表示新娘
-- gr/新郎: 表示新郎
-- 职业: 角色职业名称（没伤害就填小号）
+- br/新娘: 表示新娘（也可以用 娘/女/bride）
+- gr/新郎: 表示新郎（也可以用 郎/男/groom）
+- 职业: 角色职业名称（没伤害就填小号，可以包含空格）
 
 【规则】
 - 每队最多 6 人参与
-- 同时只能有一个APQ活动处于召集中
-- 第6个人加入后自动完成集结并重置数据"""
+- 每个群聊同时只能有一个APQ活动处于召集中，不同群聊互不影响
+- 第6个人加入后自动完成集结并重置本群数据
+- 每队需满足 br/gr 人数和职业上限等组成规则，暂时不满足的进入候补，有空位时自动转正
+- 本群没有APQ时，/加入APQ 进入匹配队列，能组成符合规则的队伍时自动成队；有人创建APQ时排队的玩家自动加入
+- 召集长时间未满员会自动取消，报名长时间未成队可能被自动移除（时长由配置决定）
+- 同一用户或同一群的命令过于频繁时会被暂时拒绝，稍后再试即可"""
+
+        # 如果是管理员，追加管理员命令部分；会话管理员只显示可用的命令
+        level = self._permission_level(event)
+        if level == self.ROLE_MODERATOR:
+            help_text += """
+
+【会话管理员命令】
+/删除APQ角色 <角色ID或QQ号>
+  从APQ中移除指定角色（支持角色ID或QQ号）
+  如果删除的是队长，则等同于重置APQ
 
-        # 如果是管理员，追加管理员命令部分
-        if self._has_admin_rights(event):
+/重置APQ
+  重置本群的APQ数据"""
+        elif level >= self.ROLE_ADMIN:
             admin_text = """
 
 【管理员命令】
@@ -924,8 +2778,23 @@ class APQPlugin(Star):
   从APQ中移除指定角色（支持角色ID或QQ号）
   如果删除的是队长，则等同于重置APQ
 
-/重置APQ
-  完全重置APQ数据"""
+/重置APQ [全部]
+  重置本群的APQ数据，带“全部”时重置所有群的数据（仅限超级管理员）
+
+/APQ存储状态
+  查看持久化统计（变更/刷盘/合并次数）
+
+/APQ导出
+  把当前数据导出为带缩进的 JSON 文件，便于人工查看
+
+/APQ广播状态
+  查看广播发件箱（待重试/重试次数）
+
+/APQ统计 重建
+  由历史归档重建出勤统计
+
+/APQ性能
+  查看各命令的调用次数、异常次数和耗时（含刷盘和广播耗时）"""
             help_text += admin_text
 
         return event.plain_result("\n" + help_text)
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件匹配队列、候补名单与队伍组成规则
+
+群里没有正在召集的APQ时，/加入APQ 的玩家进入本群的匹配队列，
+队列中能组成一支满足组成规则的队伍时立即成队，不再需要等待队长创建会话：
+- 组成规则：每队 br / gr 人数的上下限，以及同一职业的人数上限
+- 队列按 性别 -> 职业 分桶，每个桶内按入队顺序排列
+- 每次入队只做一次增量匹配：对每种可行的 br/gr 人数分配，
+  用小顶堆按入队顺序合并各桶的前几名，找到能凑齐队伍的最短前缀后在其中精确挑选，
+  每个桶最多取 min(该性别人数, 职业上限) 名，代价只与队伍人数和职业种类数有关，与排队人数无关
+
+召集中的APQ因组成规则拒绝的玩家进入该会话的候补名单（同样分桶），
+有人退出或更换角色后，只需检查各桶的队首即可找到下一位可以转正的玩家
+"""
+
+import heapq          # 多路归并各桶队首
+from collections import OrderedDict  # 保持入队顺序的字典
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional  # 类型提示
+
+GENDERS = ("br", "gr")
+
+
+def job_key(job: str) -> str:
+    """职业的比较键（忽略首尾空白和大小写）"""
+    return (job or "").strip().casefold()
+
+
+class CompositionRules(NamedTuple):
+    """队伍组成规则"""
+    team_size: int = 6
+    min_br: int = 0
+    max_br: int = 6
+    min_gr: int = 0
+    max_gr: int = 6
+    max_per_job: int = 0  # 同一职业的人数上限，0 表示不限
+
+    @property
+    def job_cap(self) -> int:
+        """实际生效的职业上限"""
+        return self.max_per_job if self.max_per_job > 0 else self.team_size
+
+    def splits(self) -> List[int]:
+        """所有可行的 br 人数（gr 人数为 team_size 减去 br 人数）
+
+        Returns:
+            List[int]: 可行的 br 人数，规则自相矛盾时为空
+        """
+        low = max(self.min_br, self.team_size - self.max_gr, 0)
+        high = min(self.max_br, self.team_size - self.min_gr, self.team_size)
+        return list(range(low, high + 1))
+
+    def can_fill(self, need: Dict[str, int], available: Dict[tuple, int], used: Dict[str, int]) -> bool:
+        """检查能否从候选玩家中补齐各性别还差的人数，且不超过职业上限
+
+        候选玩家只按 (性别, 职业键) 计数。按性别 -> 职业 -> 队伍建流网络，
+        只有两种性别时最小割只有三种形态，因此补齐的充要条件是：
+        br 能补齐、gr 能补齐、两者合计也能补齐（每个职业最多贡献剩余的职业名额）
+
+        Args:
+            need: 性别 -> 还差的人数
+            available: (性别, 职业键) -> 候选人数
+            used: 职业键 -> 已占用的名额
+        Returns:
+            bool: 能补齐时返回True
+        """
+        cap = self.job_cap
+        free: Dict[str, int] = {}
+        per_gender = {g: 0 for g in GENDERS}
+        for (gender, job), count in available.items():
+            room = cap - used.get(job, 0)
+            per_gender[gender] += min(room, count)
+            free[job] = min(room, free.get(job, 0) + count)
+        return (all(per_gender[g] >= need.get(g, 0) for g in GENDERS)
+                and sum(free.values()) >= sum(need.values()))
+
+    def admits(self, members: List[Dict[str, Any]], player: Dict[str, Any]) -> Optional[str]:
+        """检查把玩家加入现有名单后，队伍是否仍然可能满足组成规则
+
+        Args:
+            members: 现有成员（不含该玩家）
+            player: 要加入的玩家
+        Returns:
+            Optional[str]: 不满足时返回原因，满足时返回None
+        """
+        roster = list(members) + [player]
+        br = sum(1 for p in roster if p.get("gender") == "br")
+        gr = sum(1 for p in roster if p.get("gender") == "gr")
+        if br > self.max_br:
+            return f"每队最多 {self.max_br} 名 br"
+        if gr > self.max_gr:
+            return f"每队最多 {self.max_gr} 名 gr"
+        key = job_key(player.get("job", ""))
+        if sum(1 for p in roster if job_key(p.get("job", "")) == key) > self.job_cap:
+            return f"每队同一职业最多 {self.job_cap} 人"
+        need_br = max(0, self.min_br - br)
+        need_gr = max(0, self.min_gr - gr)
+        if need_br + need_gr > self.team_size - len(roster):
+            return f"剩余名额需要留给 br（至少还需 {need_br} 名）和 gr（至少还需 {need_gr} 名）"
+        return None
+
+
+class BucketQueue:
+    """按 性别 -> 职业 分桶、保留入队顺序的玩家队列
+
+    队列中的玩家字典与插件状态中的是同一批对象；
+    原地修改性别或职业后需要调用 reindex 把玩家移到新的桶
+    """
+
+    def __init__(self, rules: CompositionRules):
+        """初始化队列
+
+        Args:
+            rules: 队伍组成规则
+        """
+        self.rules = rules
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # QQ号 -> 玩家（按入队顺序）
+        self._seq: Dict[str, int] = {}                  # QQ号 -> 入队序号
+        self._slot: Dict[str, tuple] = {}               # QQ号 -> 所在的桶 (性别, 职业键)
+        # 性别 -> 职业键 -> 桶（QQ号 -> 入队序号，按序号递增）
+        self._buckets: Dict[str, Dict[str, "OrderedDict[str, int]"]] = {g: {} for g in GENDERS}
+        self._counts: Dict[str, int] = {g: 0 for g in GENDERS}  # 各性别排队人数
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.entries.values())
+
+    def __contains__(self, qq_number: str) -> bool:
+        return qq_number in self.entries
+
+    def add(self, player: Dict[str, Any]) -> None:
+        """玩家入队（已在队列中的玩家会移到队尾）
+
+        Args:
+            player: 玩家数据字典
+        """
+        qq_number = player.get("qq_number")
+        self.remove(qq_number)
+        self._next_seq += 1
+        self.entries[qq_number] = player
+        self._seq[qq_number] = self._next_seq
+        self._bucket_in(qq_number, player)
+
+    def remove(self, qq_number: str) -> Optional[Dict[str, Any]]:
+        """玩家出队
+
+        Args:
+            qq_number: 玩家QQ号
+        Returns:
+            Optional[Dict[str, Any]]: 被移除的玩家，不在队列中时返回None
+        """
+        player = self.entries.pop(qq_number, None)
+        if player is None:
+            return None
+        self._bucket_out(qq_number)
+        del self._seq[qq_number]
+        return player
+
+    def reindex(self, qq_number: str) -> None:
+        """玩家的性别或职业被原地修改后，移到对应的桶（保留入队顺序）
+
+        Args:
+            qq_number: 玩家QQ号
+        """
+        player = self.entries.get(qq_number)
+        if player is None:
+            return
+        self._bucket_out(qq_number)
+        self._bucket_in(qq_number, player)
+        gender, job = self._slot[qq_number]
+        if gender is None:
+            return
+        # 桶内需按入队序号有序，追加到末尾破坏顺序时重新排序（更换角色很少发生）
+        bucket = self._buckets[gender][job]
+        seqs = list(bucket.values())
+        if len(seqs) > 1 and seqs[-2] > seqs[-1]:
+            self._buckets[gender][job] = OrderedDict(sorted(bucket.items(), key=lambda kv: kv[1]))
+
+    def _bucket_in(self, qq_number: str, player: Dict[str, Any]) -> None:
+        gender = player.get("gender")
+        if gender not in self._buckets:
+            # 无法识别的性别不参与匹配
+            self._slot[qq_number] = (None, None)
+            return
+        job = job_key(player.get("job", ""))
+        self._buckets[gender].setdefault(job, OrderedDict())[qq_number] = self._seq[qq_number]
+        self._counts[gender] += 1
+        self._slot[qq_number] = (gender, job)
+
+    def _bucket_out(self, qq_number: str) -> None:
+        gender, job = self._slot.pop(qq_number, (None, None))
+        if gender is None:
+            return
+        bucket = self._buckets[gender][job]
+        del bucket[qq_number]
+        if not bucket:
+            del self._buckets[gender][job]
+        self._counts[gender] -= 1
+
+    def position(self, qq_number: str) -> Optional[int]:
+        """查询玩家在队列中的位置（从1开始）
+
+        Args:
+            qq_number: 玩家QQ号
+        Returns:
+            Optional[int]: 位置，不在队列中时返回None
+        """
+        for idx, key in enumerate(self.entries, 1):
+            if key == qq_number:
+                return idx
+        return None
+
+    def next_eligible(self, members: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """找出最早入队、且加入现有名单后仍满足组成规则的玩家（候补转正、新会话从匹配队列拉人）
+
+        同一个桶内的玩家性别和职业都相同，能否加入只取决于桶，
+        因此只需按入队顺序检查各桶的队首，代价与候补人数无关
+
+        Args:
+            members: 会话现有成员
+        Returns:
+            Optional[Dict[str, Any]]: 可以加入的玩家，没有时返回None
+        """
+        if len(members) >= self.rules.team_size:
+            return None
+        heap = self._heads()
+        while heap:
+            seq, qq_number, gender, job, it = heapq.heappop(heap)
+            player = self.entries[qq_number]
+            if self.rules.admits(members, player) is None:
+                return player
+        return None
+
+    def _heads(self, genders=GENDERS) -> List[tuple]:
+        """各桶的队首，按入队顺序排列的小顶堆
+
+        Args:
+            genders: 参与的性别
+        Returns:
+            List[tuple]: (入队序号, QQ号, 性别, 职业键, 桶内迭代器)
+        """
+        heap = []
+        for gender in genders:
+            for job, bucket in self._buckets[gender].items():
+                it = iter(bucket.items())
+                qq_number, seq = next(it)
+                heap.append((seq, qq_number, gender, job, it))
+        heapq.heapify(heap)
+        return heap
+
+
+class MatchQueue(BucketQueue):
+    """单个群聊的匹配队列"""
+
+    def match(self) -> Optional[List[Dict[str, Any]]]:
+        """尝试组成一支满足组成规则的队伍（只挑选，不出队）
+
+        对每种可行的 br/gr 人数分配精确求解，取最后入队者最早的那支队伍，
+        尽量让先排队的玩家先成队。由调用方确认后再把挑中的玩家出队，
+        便于把成队作为一条变更记录持久化
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: 队伍成员（按入队顺序），无法成队时返回None
+        """
+        size = self.rules.team_size
+        if len(self.entries) < size:
+            return None
+        best: Optional[List[str]] = None
+        best_last = 0
+        for n_br in self.rules.splits():
+            quota = {"br": n_br, "gr": size - n_br}
+            if self._counts["br"] < quota["br"] or self._counts["gr"] < quota["gr"]:
+                continue
+            picked = self._select(quota)
+            if picked is None:
+                continue
+            last = self._seq[picked[-1]]
+            if best is None or last < best_last:
+                best, best_last = picked, last
+        if best is None:
+            return None
+        return [self.entries[qq] for qq in best]
+
+    def _select(self, quota: Dict[str, int]) -> Optional[List[str]]:
+        """按给定的人数分配挑选最后入队者最早的队伍
+
+        贪心地按入队顺序挑人会漏解：先挑中的玩家可能占掉后面玩家唯一可用的职业名额。
+        这里分两步精确求解：
+        1. 按入队顺序逐个加入候选，直到候选中能凑齐队伍（CompositionRules.can_fill），
+           得到最短前缀，队伍的最后一名只能是前缀的最后一名
+        2. 在前缀内按入队顺序逐个决定：选入后剩余候选仍能补齐才选入，否则跳过
+
+        同一个桶内的玩家可以互换，每个桶只需要前 min(该性别人数, 职业上限) 名作为候选
+
+        Args:
+            quota: 性别 -> 需要的人数
+        Returns:
+            Optional[List[str]]: 挑中的QQ号（按入队顺序），凑不齐时返回None
+        """
+        rules = self.rules
+        cap = rules.job_cap
+        heap = self._heads([g for g, n in quota.items() if n > 0])
+        prefix: List[tuple] = []            # (QQ号, 性别, 职业键)，按入队顺序
+        available: Dict[tuple, int] = {}    # (性别, 职业键) -> 前缀中的人数
+        while True:
+            if not heap:
+                return None
+            seq, qq_number, gender, job, it = heapq.heappop(heap)
+            prefix.append((qq_number, gender, job))
+            slot = (gender, job)
+            available[slot] = available.get(slot, 0) + 1
+            if available[slot] < min(quota[gender], cap):
+                nxt = next(it, None)
+                if nxt is not None:
+                    heapq.heappush(heap, (nxt[1], nxt[0], gender, job, it))
+            if len(prefix) >= rules.team_size and rules.can_fill(quota, available, {}):
+                break
+
+        need = dict(quota)
+        used: Dict[str, int] = {}
+        picked: List[str] = []
+        for qq_number, gender, job in prefix:
+            available[gender, job] -= 1
+            if need[gender] <= 0 or used.get(job, 0) >= cap:
+                continue
+            need[gender] -= 1
+            used[job] = used.get(job, 0) + 1
+            if rules.can_fill(need, available, used):
+                picked.append(qq_number)
+                continue
+            # 选入后无法补齐：这名玩家不在任何可行的队伍中
+            need[gender] += 1
+            used[job] -= 1
+        return picked
+
+
+class Waitlist(BucketQueue):
+    """单个会话的候补名单"""
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件运行指标
+
+记录每条命令的调用次数、异常次数和耗时分布，被限流拒绝的次数，以及刷盘、广播等内部操作的耗时分布：
+- 耗时使用固定分桶的直方图，记录一次只是几次整数加法，不保存原始样本
+- 命令处理器用 instrument 装饰器包装，不改变处理器的签名（AstrBot 按签名解析命令参数）
+- 可以导出为 Prometheus 文本格式（exposition format），由插件定期写入数据目录
+
+刷盘在 I/O 线程中计时，因此记录和读取都持有同一把锁
+"""
+
+import bisect         # 查找分桶
+import functools      # 保留被包装函数的签名
+import threading      # I/O 线程与事件循环线程共享指标
+import time           # 计时
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple  # 类型提示
+
+# 直方图分桶上界（秒），最后还有一个 +Inf 桶
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """固定分桶的耗时直方图"""
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """初始化直方图
+
+        Args:
+            bounds: 递增的分桶上界（秒）
+        """
+        self.bounds = bounds
+        self.counts: List[int] = [0] * (len(bounds) + 1)  # 各桶（非累计）计数，最后一个是 +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        """记录一次耗时
+
+        Args:
+            seconds: 耗时（秒）
+        """
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """估算分位数（取所在分桶的上界，落在 +Inf 桶时取最大的有限上界）
+
+        Args:
+            q: 0~1 之间的分位
+        Returns:
+            float: 耗时上界（秒），没有样本时返回0
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[min(idx, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+    def cumulative(self) -> Iterable[Tuple[str, int]]:
+        """Prometheus 格式的累计分桶
+
+        Yields:
+            Tuple[str, int]: (le 标签值, 累计计数)
+        """
+        running = 0
+        for bound, n in zip(self.bounds, self.counts):
+            running += n
+            yield f"{bound:g}", running
+        yield "+Inf", self.count
+
+
+class CommandStats:
+    """单条命令的指标"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+
+class Metrics:
+    """插件的指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands: Dict[str, CommandStats] = {}     # 命令处理器名 -> 指标
+        self.operations: Dict[str, Histogram] = {}      # 内部操作名 -> 耗时直方图
+        self.rejections: Dict[Tuple[str, str], int] = {}  # (命令处理器名, 限流范围 user/group) -> 拒绝次数
+        self.started_at = time.time()
+
+    def observe_command(self, name: str, seconds: float, failed: bool = False) -> None:
+        """记录一次命令调用
+
+        Args:
+            name: 命令处理器名
+            seconds: 耗时（秒）
+            failed: 是否抛出了异常
+        """
+        with self._lock:
+            stats = self.commands.get(name)
+            if stats is None:
+                stats = self.commands[name] = CommandStats()
+            stats.calls += 1
+            if failed:
+                stats.errors += 1
+            stats.latency.observe(seconds)
+
+    def reject(self, name: str, scope: str) -> None:
+        """记录一次被限流拒绝的命令（不计入命令的调用次数和耗时）
+
+        Args:
+            name: 命令处理器名
+            scope: 触发的限流范围（user / group）
+        """
+        with self._lock:
+            key = (name, scope)
+            self.rejections[key] = self.rejections.get(key, 0) + 1
+
+    def observe(self, operation: str, seconds: float) -> None:
+        """记录一次内部操作（刷盘、广播等）的耗时
+
+        Args:
+            operation: 操作名
+            seconds: 耗时（秒）
+        """
+        with self._lock:
+            hist = self.operations.get(operation)
+            if hist is None:
+                hist = self.operations[operation] = Histogram()
+            hist.observe(seconds)
+
+    def summary(self) -> List[str]:
+        """生成可读的指标摘要
+
+        Returns:
+            List[str]: 每行一条命令或操作
+        """
+        lines = []
+        with self._lock:
+            for name, stats in sorted(self.commands.items()):
+                h = stats.latency
+                lines.append(f"{name}: {stats.calls} 次，异常 {stats.errors} 次，"
+                             f"平均 {h.total / h.count * 1000:.1f}ms，"
+                             f"p50≤{h.quantile(0.5) * 1000:g}ms，p99≤{h.quantile(0.99) * 1000:g}ms")
+            for name, h in sorted(self.operations.items()):
+                lines.append(f"[{name}] {h.count} 次，平均 {h.total / h.count * 1000:.1f}ms，"
+                             f"p50≤{h.quantile(0.5) * 1000:g}ms，p99≤{h.quantile(0.99) * 1000:g}ms")
+            for (name, scope), count in sorted(self.rejections.items()):
+                lines.append(f"{name}: 被限流拒绝 {count} 次（{'按用户' if scope == 'user' else '按群聊'}）")
+        return lines
+
+    def render_prometheus(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """导出为 Prometheus 文本格式
+
+        Args:
+            gauges: 额外的即时值，指标名 -> (说明, 数值)
+        Returns:
+            str: exposition format 文本
+        """
+        out: List[str] = []
+        with self._lock:
+            commands = sorted(self.commands.items())
+            out += ["# HELP apq_command_calls_total Number of command invocations.",
+                    "# TYPE apq_command_calls_total counter"]
+            out += [f'apq_command_calls_total{{command="{n}"}} {s.calls}' for n, s in commands]
+            out += ["# HELP apq_command_errors_total Number of command invocations that raised.",
+                    "# TYPE apq_command_errors_total counter"]
+            out += [f'apq_command_errors_total{{command="{n}"}} {s.errors}' for n, s in commands]
+            out += ["# HELP apq_command_duration_seconds Command handler latency.",
+                    "# TYPE apq_command_duration_seconds histogram"]
+            for n, s in commands:
+                out += _histogram_lines("apq_command_duration_seconds", f'command="{n}"', s.latency)
+            out += ["# HELP apq_operation_duration_seconds Latency of internal operations (disk flush, broadcast).",
+                    "# TYPE apq_operation_duration_seconds histogram"]
+            for n, h in sorted(self.operations.items()):
+                out += _histogram_lines("apq_operation_duration_seconds", f'operation="{n}"', h)
+            out += ["# HELP apq_rate_limited_total Number of commands rejected by the rate limiter.",
+                    "# TYPE apq_rate_limited_total counter"]
+            out += [f'apq_rate_limited_total{{command="{n}",scope="{scope}"}} {count}'
+                    for (n, scope), count in sorted(self.rejections.items())]
+        for name, (help_text, value) in sorted((gauges or {}).items()):
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value:g}"]
+        return "\n".join(out) + "\n"
+
+
+def _histogram_lines(name: str, labels: str, hist: Histogram) -> List[str]:
+    """一个直方图的 Prometheus 行"""
+    lines = [f'{name}_bucket{{{labels},le="{le}"}} {n}' for le, n in hist.cumulative()]
+    lines.append(f"{name}_sum{{{labels}}} {hist.total:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {hist.count}")
+    return lines
+
+
+def instrument(func: Callable) -> Callable:
+    """包装命令处理器，记录调用次数、异常次数和耗时
+
+    处理器所在的对象需要有 metrics 属性（Metrics 实例）
+
+    Args:
+        func: 异步命令处理器
+    Returns:
+        Callable: 包装后的处理器（保留原签名）
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(self, *args: Any, **kwargs: Any):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await func(self, *args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.metrics.observe_command(name, time.perf_counter() - start, failed)
+
+    return wrapper
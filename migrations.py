@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件持久化状态的版本与迁移
+
+database.json（日志模式的快照、/APQ导出 的文件同样）顶层带有 version 字段，与 stats.json 的做法一致：
+{"version": 2, "sessions": {...}, "queues": {...}, "tracked_groups": [...]}
+
+历史版本：
+- 0: 旧版单会话结构 {"status", "captain", "members", "tracked_groups"}，没有 version 字段
+- 1: 按会话组织的结构 {"sessions", "queues", "tracked_groups"}，没有 version 字段；
+     较早写入的会话可能缺少 waitlist / created_at，队长可能为 null
+- 2: 当前版本，带 version 字段，每个会话的字段齐全
+
+加载时按版本逐步升级（0 -> 1 -> 2 -> ...）：
+- 状态被拆成 (区段, 会话ID, 值) 条目，每个升级步骤是一个处理条目流的生成器，多步串联成流水线；
+  条目边产生边从原字典中取出，迁移过程中不会同时保留整份旧状态和整份新状态
+- 流水线末端逐条校验后组装成新的状态，任何一条不合法都抛出 SchemaError，
+  调用方拿不到迁移了一半的数据（加载快照时会回退到更早的历史快照）
+- 比当前版本新的文件（由更新版本的插件写入）拒绝加载，而不是按当前结构猜测合并
+- 未知的顶层字段丢弃并记录警告
+
+增加版本时：SCHEMA_VERSION 加一，在 MIGRATIONS 中登记从上一版本升级的步骤，并更新 _check_* 校验
+"""
+
+import logging        # 日志
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple  # 类型提示
+
+# 当前写入的状态版本
+SCHEMA_VERSION = 2
+
+# 私聊等无法确定群聊时使用的会话ID，旧版单会话数据也迁移到这个会话
+DEFAULT_SESSION = "default"
+
+# 会话的活动状态
+SESSION_STATUSES = ("idle", "recruiting")
+
+# 迁移流水线中的条目：(区段, 会话ID, 值)，tracked_groups 区段的会话ID为None
+Entry = Tuple[str, Optional[str], Any]
+
+
+class SchemaError(ValueError):
+    """状态的版本不受支持，或迁移后的内容没有通过校验"""
+
+
+def upgrade_legacy_state(data: Dict[str, Any]) -> Dict[str, Any]:
+    """把旧版单会话状态（版本0）转换为按会话组织的结构（版本1）
+
+    旧版结构为 {"status", "captain", "members", "tracked_groups"}，
+    转换后原来的会话放在 DEFAULT_SESSION 下；已是新结构的数据原样返回
+
+    Args:
+        data: 从快照或数据库读出的状态
+    Returns:
+        Dict[str, Any]: 按会话组织的状态
+    """
+    if "sessions" in data:
+        return data
+    sessions: Dict[str, Any] = {}
+    if data.get("captain") or data.get("members"):
+        sessions[DEFAULT_SESSION] = {
+            "status": data.get("status", "idle"),
+            "captain": data.get("captain", {}),
+            "members": data.get("members", []),
+        }
+    return {"sessions": sessions, "queues": {}, "tracked_groups": data.get("tracked_groups", [])}
+
+
+def detect_version(data: Dict[str, Any]) -> int:
+    """识别状态的版本
+
+    Args:
+        data: 从快照读出的状态
+    Returns:
+        int: 版本号，没有 version 字段时按结构判断为 0 或 1
+    Raises:
+        SchemaError: version 字段不是非负整数
+    """
+    version = data.get("version")
+    if version is None:
+        return 1 if "sessions" in data else 0
+    if type(version) is not int or version < 0:
+        raise SchemaError(f"invalid state version {version!r}")
+    return version
+
+
+def _entries(data: Dict[str, Any]) -> Iterator[Entry]:
+    """把版本1及以后的状态拆成条目，边产生边从原字典中取出
+
+    Args:
+        data: 状态字典（会被清空）
+    Yields:
+        Entry: (区段, 会话ID, 值)
+    """
+    for section in ("sessions", "queues"):
+        items = data.pop(section, None) or {}
+        if not isinstance(items, dict):
+            raise SchemaError(f"{section} is not an object")
+        for key in list(items):
+            yield section, key, items.pop(key)
+    yield "tracked_groups", None, data.pop("tracked_groups", None) or []
+
+
+def _v1_to_v2(entries: Iterator[Entry]) -> Iterator[Entry]:
+    """版本1 -> 2：补齐较早写入的会话缺少的字段"""
+    for section, key, value in entries:
+        if section == "sessions" and isinstance(value, dict):
+            value.setdefault("status", "idle")
+            if value.get("captain") is None:
+                value["captain"] = {}
+            value.setdefault("members", [])
+            value.setdefault("waitlist", [])
+            value.setdefault("created_at", None)
+        yield section, key, value
+
+
+# 升级步骤：版本 n -> 操作条目流的函数，结果为版本 n+1
+# 版本0 -> 1 改变的是整体结构（只有一个会话），由 upgrade_legacy_state 在拆分之前完成
+MIGRATIONS: Dict[int, Callable[[Iterator[Entry]], Iterator[Entry]]] = {
+    1: _v1_to_v2,
+}
+
+
+def _is_time(value: Any) -> bool:
+    return value is None or (type(value) in (int, float))
+
+
+def _check_player(player: Any, where: str) -> None:
+    """校验一名玩家（当前版本的持久化格式）"""
+    if not isinstance(player, dict):
+        raise SchemaError(f"{where}: player is not an object")
+    qq_number = player.get("qq_number")
+    if not isinstance(qq_number, str) or not qq_number:
+        raise SchemaError(f"{where}: invalid qq_number {qq_number!r}")
+    for field in ("nickname", "character_id", "gender", "job"):
+        if player.get(field) is not None and not isinstance(player[field], str):
+            raise SchemaError(f"{where}: {field} of {qq_number} is not a string")
+    if not _is_time(player.get("joined_at")):
+        raise SchemaError(f"{where}: joined_at of {qq_number} is not a timestamp")
+
+
+def _check_players(players: Any, where: str) -> None:
+    """校验玩家列表"""
+    if not isinstance(players, list):
+        raise SchemaError(f"{where}: not a list")
+    for player in players:
+        _check_player(player, where)
+
+
+def _check_session(session: Any, where: str) -> None:
+    """校验一个会话（当前版本的持久化格式）"""
+    if not isinstance(session, dict):
+        raise SchemaError(f"{where}: session is not an object")
+    if session.get("status") not in SESSION_STATUSES:
+        raise SchemaError(f"{where}: invalid status {session.get('status')!r}")
+    if session.get("captain"):
+        _check_player(session["captain"], f"{where}.captain")
+    elif session.get("captain") != {}:
+        raise SchemaError(f"{where}: captain is not an object")
+    _check_players(session.get("members"), f"{where}.members")
+    _check_players(session.get("waitlist"), f"{where}.waitlist")
+    if not _is_time(session.get("created_at")):
+        raise SchemaError(f"{where}: created_at is not a timestamp")
+
+
+def _assemble(entries: Iterator[Entry]) -> Dict[str, Any]:
+    """逐条校验流水线的输出并组装成新的状态
+
+    Args:
+        entries: 当前版本的条目流
+    Returns:
+        Dict[str, Any]: {"sessions", "queues", "tracked_groups"}
+    Raises:
+        SchemaError: 任何一条没有通过校验
+    """
+    state: Dict[str, Any] = {"sessions": {}, "queues": {}, "tracked_groups": []}
+    for section, key, value in entries:
+        if section == "sessions":
+            _check_session(value, f"sessions[{key}]")
+            state["sessions"][key] = value
+        elif section == "queues":
+            _check_players(value, f"queues[{key}]")
+            state["queues"][key] = value
+        else:
+            if not isinstance(value, list) or not all(isinstance(g, str) for g in value):
+                raise SchemaError("tracked_groups is not a list of group ids")
+            state["tracked_groups"] = value
+    return state
+
+
+def migrate(data: Any, log: Optional[logging.Logger] = None) -> Tuple[Dict[str, Any], int]:
+    """把任意受支持版本的状态升级到当前版本并校验
+
+    输入的字典在迁移过程中被逐步取空，之后不应再使用
+
+    Args:
+        data: 从快照或数据库读出的状态
+        log: 日志记录器
+    Returns:
+        Tuple[Dict[str, Any], int]: (当前版本的状态（不含 version 字段）, 原来的版本)
+    Raises:
+        SchemaError: 版本不受支持或内容没有通过校验
+    """
+    log = log or logging.getLogger(__name__)
+    if not isinstance(data, dict):
+        raise SchemaError("state is not an object")
+    version = detect_version(data)
+    if version > SCHEMA_VERSION:
+        raise SchemaError(f"state version {version} is newer than supported version {SCHEMA_VERSION}")
+    data.pop("version", None)
+    if version == 0:
+        data = upgrade_legacy_state(data)
+
+    entries = _entries(data)
+    for step in range(max(version, 1), SCHEMA_VERSION):
+        entries = MIGRATIONS[step](entries)
+    state = _assemble(entries)
+
+    if data:
+        log.warning("apq: ignored unknown state keys: %s", ", ".join(sorted(map(str, data))))
+    return state, version
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件数据模型
+
+内存中的玩家和会话使用 __slots__ 类，而不是每人一个字典：
+- Player 只保存六个字段，没有实例字典；性别和职业字符串经过 sys.intern，
+  同一职业的所有玩家共享一个字符串对象
+- Session 的 captain 直接引用成员列表中的那个 Player，更换角色只需修改一处，
+  队长信息和成员信息不会再不同步
+- 持久化格式（database.json、追加日志、SQLite 行、历史归档）保持不变，
+  由 from_dict / to_dict 显式转换
+
+两个类都提供只读的 get()，存储层、匹配队列和统计可以同时处理模型对象和日志中的字典
+"""
+
+import sys            # 字符串驻留
+from typing import Any, Dict, Iterator, List, Mapping, Optional  # 类型提示
+
+
+def _intern(value: Any) -> Any:
+    """驻留重复出现的短字符串（性别、职业），其他值原样返回"""
+    return sys.intern(value) if type(value) is str else value
+
+
+class Player:
+    """一名玩家的报名信息"""
+
+    FIELDS = ("qq_number", "nickname", "character_id", "gender", "job", "joined_at")
+    __slots__ = FIELDS
+
+    def __init__(self, qq_number: Optional[str] = None, nickname: Optional[str] = None,
+                 character_id: Optional[str] = None, gender: Optional[str] = None,
+                 job: Optional[str] = None, joined_at: Optional[int] = None):
+        """初始化玩家
+
+        Args:
+            qq_number: QQ号
+            nickname: 昵称
+            character_id: 角色ID
+            gender: 性别（br/gr）
+            job: 职业
+            joined_at: 报名时间戳，旧数据没有时为None
+        """
+        self.qq_number = qq_number
+        self.nickname = nickname
+        self.character_id = character_id
+        self.gender = _intern(gender)
+        self.job = _intern(job)
+        self.joined_at = joined_at
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Player":
+        """由持久化格式的字典创建玩家
+
+        Args:
+            data: 玩家字典（缺少的字段为None，多余的字段忽略）
+        Returns:
+            Player: 新的玩家对象
+        """
+        return cls(*(data.get(field) for field in cls.FIELDS))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为持久化格式的字典（没有报名时间时不写该字段，与旧数据一致）
+
+        Returns:
+            Dict[str, Any]: 玩家字典
+        """
+        data = {
+            "qq_number": self.qq_number,
+            "nickname": self.nickname,
+            "character_id": self.character_id,
+            "gender": self.gender,
+            "job": self.job,
+        }
+        if self.joined_at is not None:
+            data["joined_at"] = self.joined_at
+        return data
+
+    def update(self, fields: Mapping[str, Any]) -> None:
+        """更新部分字段（更换角色）
+
+        Args:
+            fields: 字段名 -> 新值
+        """
+        for key, value in fields.items():
+            setattr(self, key, _intern(value) if key in ("gender", "job") else value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """按字段名读取，与字典的 get 相同（字段为None时返回默认值）"""
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self) -> Iterator[str]:
+        """有值的字段名（使 dict(player) 得到与 to_dict 相同的内容）"""
+        return iter(self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"Player({self.qq_number!r}, {self.character_id!r}, {self.gender!r}, {self.job!r})"
+
+
+class Session:
+    """一个群聊的APQ会话"""
+
+    __slots__ = ("status", "captain", "members", "waitlist", "created_at")
+
+    def __init__(self, status: str = "idle", captain: Optional[Player] = None,
+                 members: Optional[List[Player]] = None, waitlist: Optional[List[Player]] = None,
+                 created_at: Optional[int] = None):
+        """初始化会话
+
+        Args:
+            status: 活动状态（idle/recruiting）
+            captain: 队长，引用 members 中的同一个对象
+            members: 成员列表（包含队长）
+            waitlist: 候补名单
+            created_at: 创建时间戳，旧数据没有时为None
+        """
+        self.status = status
+        self.captain = captain
+        self.members: List[Player] = members if members is not None else []
+        self.waitlist: List[Player] = waitlist if waitlist is not None else []
+        self.created_at = created_at
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Session":
+        """由持久化格式的字典创建会话
+
+        持久化格式中队长是一份独立的副本，这里改为引用QQ号相同的成员；
+        找不到对应成员时（旧数据）保留一个独立的队长对象
+
+        Args:
+            data: 会话字典
+        Returns:
+            Session: 新的会话对象
+        """
+        members = [Player.from_dict(p) for p in data.get("members") or []]
+        captain_data = data.get("captain") or {}
+        captain = None
+        if captain_data:
+            qq_number = captain_data.get("qq_number")
+            captain = next((p for p in members if p.qq_number == qq_number), None) or Player.from_dict(captain_data)
+        return cls(
+            status=data.get("status", "idle"),
+            captain=captain,
+            members=members,
+            waitlist=[Player.from_dict(p) for p in data.get("waitlist") or []],
+            created_at=data.get("created_at"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为持久化格式的字典（队长写成独立的副本）
+
+        Returns:
+            Dict[str, Any]: 会话字典
+        """
+        return {
+            "status": self.status,
+            "captain": self.captain.to_dict() if self.captain is not None else {},
+            "members": [p.to_dict() for p in self.members],
+            "waitlist": [p.to_dict() for p in self.waitlist],
+            "created_at": self.created_at,
+        }
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """按字段名读取，与字典的 get 相同（字段为None时返回默认值）"""
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    @property
+    def captain_qq(self) -> Optional[str]:
+        """队长的QQ号，没有队长时为None"""
+        return self.captain.qq_number if self.captain is not None else None
+
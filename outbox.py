@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件广播发件箱
+
+记录发送失败的广播，保存在 database.json 旁边的 outbox.json 中，插件重启后继续重试：
+- 每条记录对应一个 (群聊, 消息) 投递
+- 失败后按指数退避 + 随机抖动安排下一次重试
+- 超过最大重试次数后放弃，并计入统计
+"""
+
+import random         # 退避抖动
+import time           # 时间戳
+import uuid           # 投递记录ID
+from pathlib import Path    # 路径处理
+from typing import Any, Dict, List, Optional  # 类型提示
+
+from . import codec   # JSON 编解码
+from .storage import atomic_write_text  # 原子写入
+
+
+class Outbox:
+    """持久化的待投递广播队列"""
+
+    def __init__(self, path: Path, max_attempts: int = 8, base_delay: float = 5.0, max_delay: float = 600.0):
+        """初始化发件箱
+
+        Args:
+            path: 发件箱文件路径（outbox.json）
+            max_attempts: 单条投递的最大重试次数
+            base_delay: 第一次重试前的等待时间（秒）
+            max_delay: 退避等待时间上限（秒）
+        """
+        self.path = path
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+        self.entries: Dict[str, Dict[str, Any]] = {}  # 投递ID -> 投递记录（按加入顺序）
+        # 监控统计：累计重试次数 / 重试成功次数 / 放弃次数
+        self.stats: Dict[str, int] = {"retries": 0, "delivered": 0, "dropped": 0}
+
+    def load(self) -> None:
+        """从文件恢复未完成的投递"""
+        if not self.path.exists():
+            return
+        data = codec.loads(self.path.read_bytes() or b"{}")
+        for entry in data.get("entries", []):
+            self.entries[entry["id"]] = entry
+        self.stats.update(data.get("stats", {}))
+
+    def encode(self) -> bytes:
+        """编码当前发件箱（在事件循环线程上调用，得到一致的内容）
+
+        Returns:
+            bytes: 紧凑 JSON（UTF-8）
+        """
+        return codec.dumps({"entries": list(self.entries.values()), "stats": self.stats})
+
+    def write(self, data: bytes) -> None:
+        """原子写入发件箱文件（可在 I/O 线程中调用）
+
+        Args:
+            data: encode 的结果
+        """
+        atomic_write_text(self.path, data)
+
+    @property
+    def depth(self) -> int:
+        """待投递记录数"""
+        return len(self.entries)
+
+    def backoff(self, attempts: int) -> float:
+        """计算第 attempts 次失败后的等待时间
+
+        指数退避，并乘以 [0.5, 1.5) 的随机抖动，避免大量投递在同一时刻重试
+
+        Args:
+            attempts: 已失败次数
+        Returns:
+            float: 等待秒数
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        return delay * (0.5 + random.random())
+
+    def add(self, group_id: str, message: str, error: str, now: Optional[float] = None) -> None:
+        """记录一次失败的投递
+
+        Args:
+            group_id: 目标群聊
+            message: 消息内容
+            error: 首次失败原因
+            now: 当前时间戳，默认取系统时间
+        """
+        now = time.time() if now is None else now
+        entry_id = uuid.uuid4().hex
+        self.entries[entry_id] = {
+            "id": entry_id,
+            "group_id": group_id,
+            "message": message,
+            "attempts": 1,
+            "created_at": now,
+            "next_attempt_at": now + self.backoff(1),
+            "last_error": error,
+        }
+
+    def due(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """返回已到重试时间的投递
+
+        Args:
+            now: 当前时间戳
+        Returns:
+            List[Dict[str, Any]]: 到期的投递记录
+        """
+        now = time.time() if now is None else now
+        return [e for e in self.entries.values() if e["next_attempt_at"] <= now]
+
+    def next_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """距离最早一次重试还有多少秒
+
+        Args:
+            now: 当前时间戳
+        Returns:
+            Optional[float]: 秒数，发件箱为空时返回None
+        """
+        if not self.entries:
+            return None
+        now = time.time() if now is None else now
+        return max(0.0, min(e["next_attempt_at"] for e in self.entries.values()) - now)
+
+    def mark_success(self, entry_id: str) -> None:
+        """重试成功，移除投递记录
+
+        Args:
+            entry_id: 投递ID
+        """
+        if self.entries.pop(entry_id, None) is not None:
+            self.stats["retries"] += 1
+            self.stats["delivered"] += 1
+
+    def mark_failure(self, entry_id: str, error: str, now: Optional[float] = None) -> bool:
+        """重试失败，安排下一次重试或放弃
+
+        Args:
+            entry_id: 投递ID
+            error: 失败原因
+            now: 当前时间戳
+        Returns:
+            bool: True 表示已达到最大次数并放弃
+        """
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return False
+        now = time.time() if now is None else now
+        self.stats["retries"] += 1
+        entry["attempts"] += 1
+        entry["last_error"] = error
+        if entry["attempts"] >= self.max_attempts:
+            del self.entries[entry_id]
+            self.stats["dropped"] += 1
+            return True
+        entry["next_attempt_at"] = now + self.backoff(entry["attempts"])
+        return False
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件角色参数解析
+
+/创建APQ、/加入APQ、/更换APQ角色 共用的 <角色ID> <性别> <职业> 解析：
+- 命令前缀（可选的 / 或全角／，以及命令名本身）用模块加载时编译好的正则去掉
+- 参数用 str.split() 一次切分，全角空格（U+3000）、不间断空格等 Unicode 空白都视为分隔符
+- 性别支持中英文别名，全角字母先做 NFKC 规范化（ｂｒ -> br）
+- 职业可以包含空格（切分后剩余的部分原样拼回）
+"""
+
+import re             # 命令前缀
+import unicodedata    # 全角字符规范化
+from typing import Iterable, NamedTuple, Optional, Tuple  # 类型提示
+
+# 解析失败的原因
+PARSE_USAGE = "usage"    # 参数不足
+PARSE_GENDER = "gender"  # 性别无法识别
+
+# 性别别名 -> 标准代码（br=新娘，gr=新郎），比较前先 NFKC 规范化并转小写
+GENDER_ALIASES = {
+    "br": "br", "bride": "br", "新娘": "br", "娘": "br", "女": "br",
+    "gr": "gr", "groom": "gr", "新郎": "gr", "郎": "gr", "男": "gr",
+}
+
+# 消息开头的命令：可选的唤醒前缀 + 命令名 + 空白（命令名按最长优先匹配）
+_COMMAND_PREFIX = re.compile(
+    r"^[/／!！]?\s*(?:更换APQ角色|创建APQ|加入APQ)(?:\s+|$)",
+    re.IGNORECASE,
+)
+
+
+class Role(NamedTuple):
+    """解析出的角色信息"""
+    character_id: str
+    gender: str   # br / gr
+    job: str
+
+
+def parse_gender(token: str) -> Optional[str]:
+    """解析性别参数
+
+    Args:
+        token: 性别参数
+    Returns:
+        Optional[str]: "br"/"gr"，无法识别时返回None
+    """
+    return GENDER_ALIASES.get(unicodedata.normalize("NFKC", token).strip().lower())
+
+
+def strip_command(message: str) -> Optional[str]:
+    """去掉消息开头的命令名，得到参数部分
+
+    Args:
+        message: 原始消息文本
+    Returns:
+        Optional[str]: 参数部分，消息不是以角色命令开头时返回None
+    """
+    match = _COMMAND_PREFIX.match(message.lstrip())
+    if match is None:
+        return None
+    return message.lstrip()[match.end():]
+
+
+def parse_role(text: str) -> Tuple[Optional[Role], Optional[str]]:
+    """解析 <角色ID> <性别> <职业>
+
+    Args:
+        text: 参数部分（不含命令名）
+    Returns:
+        Tuple[Optional[Role], Optional[str]]: (角色信息, None) 或 (None, 失败原因 PARSE_USAGE/PARSE_GENDER)
+    """
+    tokens = text.split()
+    if len(tokens) < 3:
+        return None, PARSE_USAGE
+    gender = parse_gender(tokens[1])
+    if gender is None:
+        return None, PARSE_GENDER
+    return Role(tokens[0], gender, " ".join(tokens[2:])), None
+
+
+def parse_role_args(message: str, args: Iterable[str]) -> Tuple[Optional[Role], Optional[str]]:
+    """从命令消息或框架切分好的参数中解析角色信息
+
+    优先使用完整的消息文本（保留含空格的职业、处理全角空格），
+    消息不可用时退回到框架传入的参数
+
+    Args:
+        message: 事件的原始消息文本
+        args: 框架传入的 角色ID、性别、职业 参数
+    Returns:
+        Tuple[Optional[Role], Optional[str]]: 同 parse_role
+    """
+    text = strip_command(message) if message else None
+    if text is None:
+        text = " ".join(a for a in args if a)
+    return parse_role(text)
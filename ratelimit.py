@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件命令限流
+
+按QQ号和按群聊各用一组令牌桶限制命令频率，防止刷屏的 /加入APQ、/更换APQ角色 反复触发刷盘和广播：
+- 每个键（QQ号或群聊ID）一个桶，容量为 burst，按 rate（每秒）连续补充；
+  补充在取令牌时按经过的时间一次算出，不需要定时任务
+- 桶保存在按最近使用排序的字典中，取令牌时移到末尾，超过 capacity 个桶时淘汰最久未使用的，
+  查找、更新、淘汰都是 O(1)，内存有上限；被淘汰的键下次出现时是一个满桶，
+  而最久未使用的桶本来也早已补满，对限流效果没有影响
+- 命令处理器用 rate_limited 装饰器包装，在处理器做任何事情之前检查，不改变处理器的签名
+"""
+
+import functools      # 保留被包装函数的签名
+from collections import OrderedDict  # 按最近使用排序的桶
+from typing import Any, Callable, List  # 类型提示
+
+
+class TokenBucketLimiter:
+    """一组按键区分、数量有上限的令牌桶"""
+
+    def __init__(self, rate: float, burst: float, capacity: int = 10000):
+        """初始化限流器
+
+        Args:
+            rate: 每秒补充的令牌数，0 表示不限流
+            burst: 桶容量（允许的突发次数），至少为1
+            capacity: 最多保留的桶数
+        """
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1.0, float(burst))
+        self.capacity = max(1, int(capacity))
+        self._buckets: "OrderedDict[str, List[Any]]" = OrderedDict()  # 键 -> [令牌数, 上次更新时间, 已提示]
+        self.rejected = 0   # 累计拒绝次数
+        self.evicted = 0    # 累计淘汰的桶数
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用（rate 为 0 时不限流）"""
+        return self.rate > 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: str, now: float) -> float:
+        """尝试取一个令牌
+
+        Args:
+            key: QQ号或群聊ID
+            now: 当前时间（单调时钟，秒）
+        Returns:
+            float: 0 表示放行；否则为拒绝，值是还需等待的秒数
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now, False]
+            if len(self._buckets) > self.capacity:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            bucket[2] = False
+            return 0.0
+        self.rejected += 1
+        return (1.0 - bucket[0]) / self.rate
+
+    def refund(self, key: str) -> None:
+        """退回一个令牌（另一层限流拒绝了同一次请求时使用）
+
+        Args:
+            key: QQ号或群聊ID
+        """
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.burst, bucket[0] + 1.0)
+
+    def should_notify(self, key: str) -> bool:
+        """被拒绝后是否需要回复提示
+
+        连续被拒绝时只提示第一次，之后静默丢弃，直到再次放行，避免刷屏换来同样多的回复
+
+        Args:
+            key: QQ号或群聊ID
+        Returns:
+            bool: 本轮第一次被拒绝时返回True
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[2]:
+            return False
+        bucket[2] = True
+        return True
+
+
+def rate_limited(func: Callable) -> Callable:
+    """包装命令处理器，在处理器执行之前检查限流
+
+    处理器所在的对象需要提供 _check_rate_limit(event, command)，
+    返回 (是否拒绝, 拒绝时的回复或None)
+
+    Args:
+        func: 异步命令处理器，第一个参数为消息事件
+    Returns:
+        Callable: 包装后的处理器（保留原签名）
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(self, event: Any, *args: Any, **kwargs: Any):
+        limited, reply = self._check_rate_limit(event, name)
+        if limited:
+            return reply
+        return await func(self, event, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件出勤统计
+
+在每场APQ结束（写入历史归档）时增量更新计数器，查询时不再扫描历史：
+- 累计计数：每个QQ、每个角色、每个职业、br/gr 的出勤场数，各结局的场数
+- 按天分桶：每天一个桶，记录当天的场数和各QQ/职业/性别的出勤场数；超过保留天数的桶被丢弃
+- 最近N天的合计：每种天数维护一份滚动合计，日期变化时只加上新进入窗口的桶、减去移出窗口的桶，
+  新记录直接计入覆盖当天的合计，查询不再逐桶合并，均摊代价与窗口天数和出勤人数无关
+- 单个玩家的查询是字典查找，O(1)
+
+计数器保存在 stats.json 中；文件缺失、损坏或版本不符时由历史归档重建，
+启动时还会补上归档中比 stats.json 更新的记录（例如写完归档后进程退出）
+"""
+
+import bisect         # 有序日期列表中定位窗口边界
+import heapq          # 排行榜取前K
+import time           # 时间戳
+from collections import Counter  # 计数器
+from pathlib import Path    # 路径处理
+from typing import Any, Dict, Iterable, List, Optional, Tuple  # 类型提示
+
+from . import codec   # JSON 编解码
+from .matchmaking import job_key  # 职业比较键
+from .storage import atomic_write_text  # 原子写入
+
+# 计入出勤的结局：真正出发的队伍
+ATTENDED = ("completed", "matched")
+
+
+def day_key(ts: float) -> str:
+    """时间戳所属的日期桶（本地时间）
+
+    Args:
+        ts: Unix 时间戳
+    Returns:
+        str: YYYY-MM-DD
+    """
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+
+class AttendanceStats:
+    """增量维护的出勤计数器"""
+
+    VERSION = 1
+
+    def __init__(self, path: Path, retention_days: int = 90):
+        """初始化统计
+
+        Args:
+            path: 统计文件路径（stats.json）
+            retention_days: 按天分桶保留的天数
+        """
+        self.path = path
+        self.retention_days = max(1, int(retention_days))
+        self.reset()
+
+    def reset(self) -> None:
+        """清空所有计数"""
+        self.outcomes: Counter = Counter()          # 结局 -> 场数
+        self.by_qq: Counter = Counter()             # QQ号 -> 出勤场数
+        self.by_char: Counter = Counter()           # 角色ID（规范化）-> 出勤场数
+        self.by_job: Counter = Counter()            # 职业（规范化）-> 出勤人次
+        self.by_gender: Counter = Counter()         # br/gr -> 出勤人次
+        self.qq_chars: Dict[str, Counter] = {}      # QQ号 -> 角色ID -> 出勤场数
+        self.names: Dict[str, str] = {}             # QQ号 -> 最近一次使用的昵称（排行榜显示）
+        self.job_names: Dict[str, str] = {}         # 职业比较键 -> 最近一次使用的写法
+        # 日期 -> {"runs": 场数, "qq": {QQ号: 场数}, "job": {职业: 人次}, "gender": {性别: 人次}}
+        self.days: Dict[str, Dict[str, Any]] = {}
+        self._keys: List[str] = []                  # self.days 的日期，升序
+        # 天数 -> 滚动合计 {"first": 首日, "last": 末日, "runs", "qq", "job", "gender"}，覆盖 [first, last] 的桶
+        self._windows: Dict[int, Dict[str, Any]] = {}
+        # 已计入的最新记录时间，以及该时间上已计入的记录（补记时去重）
+        self.last_ts = 0
+        self.tail: List[str] = []
+
+    @staticmethod
+    def _record_id(record: Dict[str, Any]) -> str:
+        """同一秒内区分记录的键"""
+        return record.get("id") or f"{record.get('ts')}|{record.get('session')}|{record.get('outcome')}"
+
+    def apply(self, record: Dict[str, Any]) -> bool:
+        """把一条归档记录计入统计
+
+        Args:
+            record: 历史归档记录
+        Returns:
+            bool: 已经计入过（补记时重复）返回False
+        """
+        ts = int(record.get("ts", 0))
+        rid = self._record_id(record)
+        if ts < self.last_ts or (ts == self.last_ts and rid in self.tail):
+            return False
+        if ts > self.last_ts:
+            self.last_ts, self.tail = ts, []
+        self.tail.append(rid)
+
+        outcome = record.get("outcome", "")
+        self.outcomes[outcome] += 1
+        if outcome not in ATTENDED:
+            return True
+
+        day = day_key(ts)
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = {"runs": 0, "qq": {}, "job": {}, "gender": {}}
+            bisect.insort(self._keys, day)
+        delta = {"runs": 1, "qq": Counter(), "job": Counter(), "gender": Counter()}
+        for p in record.get("members", []):
+            qq = p.get("qq_number") or ""
+            job = job_key(p.get("job", ""))
+            gender = p.get("gender") or ""
+            char = (p.get("character_id") or "").strip().casefold()
+            self.by_qq[qq] += 1
+            self.by_char[char] += 1
+            self.by_job[job] += 1
+            self.by_gender[gender] += 1
+            self.qq_chars.setdefault(qq, Counter())[p.get("character_id") or ""] += 1
+            self.names[qq] = p.get("nickname") or qq
+            self.job_names[job] = (p.get("job") or "").strip()
+            delta["qq"][qq] += 1
+            delta["job"][job] += 1
+            delta["gender"][gender] += 1
+        self._merge(bucket, delta, 1)
+        # 已经覆盖这一天的滚动合计直接计入，之后进入窗口的合计在查询时从桶中加上
+        for totals in self._windows.values():
+            if totals["first"] <= day <= totals["last"]:
+                self._merge(totals, delta, 1)
+        self._prune(ts)
+        return True
+
+    @staticmethod
+    def _merge(target: Dict[str, Any], bucket: Dict[str, Any], sign: int) -> None:
+        """把一个桶加到（sign=1）或减出（sign=-1）合计中，减到0的键被删除
+
+        Args:
+            target: 日期桶或滚动合计
+            bucket: 要加减的桶
+            sign: 1 或 -1
+        """
+        target["runs"] += sign * bucket["runs"]
+        for field in ("qq", "job", "gender"):
+            counts = target[field]
+            for key, n in bucket[field].items():
+                total = counts.get(key, 0) + sign * n
+                if total:
+                    counts[key] = total
+                else:
+                    counts.pop(key, None)
+
+    def _prune(self, now: float) -> None:
+        """丢弃超过保留天数的日期桶
+
+        Args:
+            now: 当前时间戳
+        """
+        oldest = day_key(now - (self.retention_days - 1) * 86400)
+        if len(self.days) > self.retention_days:
+            cut = bisect.bisect_left(self._keys, oldest)
+            for key in self._keys[:cut]:
+                del self.days[key]
+            del self._keys[:cut]
+            # 覆盖了被丢弃的桶的合计无法再减出这些桶，下次查询时重新合并
+            for span in [n for n, totals in self._windows.items() if totals["first"] < oldest]:
+                del self._windows[span]
+
+    def rebuild(self, records: Iterable[Dict[str, Any]]) -> int:
+        """清空计数后由历史归档重新计入
+
+        Args:
+            records: 按时间顺序的归档记录（可以是流式迭代器）
+        Returns:
+            int: 计入的记录数
+        """
+        self.reset()
+        return sum(1 for record in records if self.apply(record))
+
+    def window(self, days: int, now: Optional[float] = None) -> Dict[str, Any]:
+        """最近 days 天的合计
+
+        每种天数保留一份滚动合计，只加减与上次查询相比进入、移出窗口的日期桶，
+        每个桶进出每份合计各一次；日期没有变化时直接返回合计
+
+        Args:
+            days: 天数（含今天），超过保留天数时按保留天数计算
+            now: 当前时间戳
+        Returns:
+            Dict[str, Any]: {"runs": 场数, "qq": Counter, "job": Counter, "gender": Counter}，
+                由统计内部维护，调用方不要修改
+        """
+        now = time.time() if now is None else now
+        span = max(1, min(days, self.retention_days))
+        first, last = day_key(now - (span - 1) * 86400), day_key(now)
+        totals = self._windows.get(span)
+        if totals is None or first < totals["first"] or last < totals["last"]:
+            # 第一次查询或时钟回拨：从空合计开始（空区间）
+            totals = self._windows[span] = {"first": "", "last": "", "runs": 0,
+                                            "qq": Counter(), "job": Counter(), "gender": Counter()}
+        keys = self._keys
+        # 减去移出窗口的桶：原区间内、早于新首日的部分
+        start = bisect.bisect_left(keys, totals["first"])
+        stop = min(bisect.bisect_left(keys, first), bisect.bisect_right(keys, totals["last"]))
+        for key in keys[start:stop]:
+            self._merge(totals, self.days[key], -1)
+        # 加上进入窗口的桶：新区间内、晚于原末日的部分
+        start = max(bisect.bisect_right(keys, totals["last"]), bisect.bisect_left(keys, first))
+        stop = bisect.bisect_right(keys, last)
+        for key in keys[start:stop]:
+            self._merge(totals, self.days[key], 1)
+        totals["first"], totals["last"] = first, last
+        return totals
+
+    @staticmethod
+    def top(counter: Counter, k: int) -> List[Tuple[str, int]]:
+        """计数最多的前 k 项
+
+        Args:
+            counter: 计数器
+            k: 数量
+        Returns:
+            List[Tuple[str, int]]: (键, 计数)，计数相同时按键排序
+        """
+        return heapq.nsmallest(k, counter.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    def load(self) -> bool:
+        """从 stats.json 恢复计数
+
+        Returns:
+            bool: 文件存在、完整且版本一致时返回True，否则需要由归档重建
+        """
+        if not self.path.exists():
+            return False
+        try:
+            data = codec.loads(self.path.read_bytes())
+        except ValueError:
+            return False
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return False
+        self.reset()
+        self.outcomes.update(data.get("outcomes", {}))
+        self.by_qq.update(data.get("by_qq", {}))
+        self.by_char.update(data.get("by_char", {}))
+        self.by_job.update(data.get("by_job", {}))
+        self.by_gender.update(data.get("by_gender", {}))
+        self.qq_chars = {qq: Counter(chars) for qq, chars in data.get("qq_chars", {}).items()}
+        self.names = dict(data.get("names", {}))
+        self.job_names = dict(data.get("job_names", {}))
+        self.days = dict(data.get("days", {}))
+        self._keys = sorted(self.days)
+        self.last_ts = int(data.get("last_ts", 0))
+        self.tail = list(data.get("tail", []))
+        return True
+
+    def encode(self) -> bytes:
+        """编码当前计数（在事件循环线程上调用，得到一致的内容）
+
+        Returns:
+            bytes: 紧凑 JSON（UTF-8）
+        """
+        return codec.dumps(
+            {
+                "version": self.VERSION,
+                "outcomes": self.outcomes,
+                "by_qq": self.by_qq,
+                "by_char": self.by_char,
+                "by_job": self.by_job,
+                "by_gender": self.by_gender,
+                "qq_chars": self.qq_chars,
+                "names": self.names,
+                "job_names": self.job_names,
+                "days": self.days,
+                "last_ts": self.last_ts,
+                "tail": self.tail,
+            }
+        )
+
+    def write(self, data: bytes) -> None:
+        """原子写入统计文件（可在 I/O 线程中调用）
+
+        Args:
+            data: encode 的结果
+        """
+        atomic_write_text(self.path, data)
@@ -0,0 +1,793 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件持久化存储层
+
+所有存储后端实现同一接口（StorageBackend），由插件根据 storage_mode 选择：
+- snapshot: 每次刷盘整文件重写 database.json
+- journal:  追加式日志 + 定期压缩回快照
+- sqlite:   SQLite（WAL 模式），单行变更只改动对应的行
+
+追加式日志（journal）存储：
+- 每次状态变更只向日志文件追加一条紧凑的 JSON 记录
+- 启动时先加载快照，再按顺序重放日志
+- 日志累积到一定条数后折叠回快照（压缩）
+
+快照和日志记录都是紧凑 JSON（无缩进），编解码见 codec.py（自动选用 orjson/msgspec）；
+快照写入采用 临时文件 + fsync + rename + 目录fsync 的原子方式，
+并保留最近 K 份完好的历史快照（database.json.1 ~ database.json.K），
+最新快照损坏时加载逻辑会依次回退到更早的快照
+
+快照的结构为 {"version", "sessions": {会话ID: {"status", "captain", "members", "waitlist", "created_at"}},
+"queues": {会话ID: [...]}, "tracked_groups": [...]}，
+加载时由 migrations.migrate 按版本逐步升级并校验，旧版本或内容不合法的快照不会原样交给插件
+"""
+
+import logging        # 默认日志记录器
+import os             # 文件同步与原子替换
+import shutil         # 不支持硬链接时复制历史快照
+import sqlite3        # SQLite 存储后端
+from pathlib import Path    # 路径处理
+from typing import Any, Dict, List, Optional, Tuple, Union  # 类型提示
+
+from . import codec   # JSON 编解码
+from .migrations import DEFAULT_SESSION, SCHEMA_VERSION, SchemaError, migrate  # 状态版本与迁移
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """将一条日志记录编码为单行紧凑 JSON
+
+    Args:
+        record: 日志记录字典
+    Returns:
+        bytes: 以换行结尾的 JSON 行
+    """
+    return codec.dumps(record) + b"\n"
+
+
+def encode_snapshot(state: Dict[str, Any], pretty: bool = False) -> bytes:
+    """将完整状态编码为快照（顶层加上当前的 version 字段）
+
+    Args:
+        state: 插件状态字典
+        pretty: 是否缩进两格（导出给人看时使用，database.json 默认紧凑）
+    Returns:
+        bytes: UTF-8 JSON
+    """
+    return codec.dumps({"version": SCHEMA_VERSION, **state}, pretty=pretty)
+
+
+def _fsync_dir(directory: Path) -> None:
+    """同步目录项，确保 rename 结果落盘（不支持的平台上静默跳过）
+
+    Args:
+        directory: 目录路径
+    """
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def backup_path(path: Path, index: int) -> Path:
+    """第 index 份历史快照的路径（1 为最新）
+
+    Args:
+        path: 快照文件路径
+        index: 历史序号
+    Returns:
+        Path: 形如 database.json.1 的路径
+    """
+    return path.with_name(f"{path.name}.{index}")
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    """让 target 成为 source 当前内容的一份独立副本（源文件保持原位）
+
+    优先创建硬链接（不复制数据）；文件系统不支持硬链接时退回到复制。
+    之后 source 被 rename 覆盖时只是目录项指向了新文件，硬链接仍指向旧内容
+
+    Args:
+        source: 源文件
+        target: 目标路径（已存在时被替换）
+    """
+    tmp_target = target.with_name(f".{target.name}.tmp")
+    try:
+        os.unlink(tmp_target)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(source, tmp_target)
+    except OSError:
+        shutil.copy2(source, tmp_target)
+    os.replace(tmp_target, target)
+
+
+def atomic_write_text(path: Path, text: Union[str, bytes], keep: int = 0) -> int:
+    """原子地写入文本文件，可选保留最近 keep 份旧版本
+
+    写入流程：临时文件 -> fsync -> 轮转旧快照 -> rename 覆盖 -> 目录fsync
+    轮转时当前文件留在原处，只把它硬链接（或复制）为 .1，rename 覆盖是最后一步，
+    任何一步失败或崩溃时 path 要么是旧内容、要么是新内容，不会缺失或留下半截
+
+    Args:
+        path: 目标文件路径
+        text: 文件内容（str 按 UTF-8 编码，bytes 原样写入）
+        keep: 保留的历史快照份数，0 表示不保留
+    Returns:
+        int: 写入的字节数
+    """
+    data = text if isinstance(text, bytes) else text.encode("utf-8")
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    if keep > 0 and path.exists():
+        # 从最旧的开始依次后移：.K-1 -> .K, ..., .1 -> .2, 当前 -> .1（当前文件保持原位）
+        for index in range(keep - 1, 0, -1):
+            older = backup_path(path, index)
+            if older.exists():
+                os.replace(older, backup_path(path, index + 1))
+        _link_or_copy(path, backup_path(path, 1))
+
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+    return len(data)
+
+
+def load_snapshot(path: Path, keep: int = 0,
+                  log: Optional[logging.Logger] = None) -> Optional[Tuple[Dict[str, Any], int, int]]:
+    """加载快照并升级到当前版本，最新快照无法解析或无法迁移时依次回退到历史快照
+
+    Args:
+        path: 快照文件路径
+        keep: 可回退的历史快照份数
+        log: 日志记录器
+    Returns:
+        Optional[Tuple[Dict[str, Any], int, int]]: 第一份可用快照迁移后的状态、其原来的版本、
+            以及它的历史序号（0 为最新快照），全部不可用时返回None
+    """
+    log = log or logging.getLogger(__name__)
+    candidates = [path] + [backup_path(path, i) for i in range(1, keep + 1)]
+    for index, candidate in enumerate(candidates):
+        if not candidate.exists():
+            continue
+        try:
+            data = codec.loads(candidate.read_bytes())
+        except (OSError, ValueError) as exc:
+            log.warning("apq: snapshot %s is unreadable (%s), trying an older one", candidate.name, exc)
+            continue
+        try:
+            state, version = migrate(data, log)
+        except SchemaError as exc:
+            log.warning("apq: snapshot %s cannot be migrated (%s), trying an older one", candidate.name, exc)
+            continue
+        if candidate != path:
+            log.warning("apq: recovered state from backup snapshot %s", candidate.name)
+            if path.exists():
+                # 把损坏的快照挪开保留现场，避免下次写入时被轮转进历史快照
+                os.replace(path, path.with_name(f"{path.name}.corrupt"))
+        return state, version, index
+    return None
+
+
+class StorageBackend:
+    """存储后端接口
+
+    刷盘分两步：prepare 在事件循环线程上把待写内容整理成与内存状态解耦的载荷，
+    write 在 I/O 线程中执行实际写入，保证序列化的是某一时刻一致的状态
+    """
+
+    name = "base"
+
+    def __init__(self, log: Optional[logging.Logger] = None):
+        """初始化公共统计
+
+        Args:
+            log: 日志记录器，默认使用模块级 logger
+        """
+        self.log = log or logging.getLogger(__name__)
+        self.bytes_written = 0  # 累计写入字节数（近似值，用于观测写放大）
+        self.upgraded_from: Optional[int] = None  # load 读到的快照是旧版本时为其版本号，插件据此立即写回新版本
+        self.recovered_from = 0  # load 读到的快照的历史序号，0 为最新快照，大于0 表示回退到了历史快照
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """读取持久化的状态
+
+        Returns:
+            Tuple: (完整状态或None, 需要在其上按顺序重放的变更记录)
+        """
+        raise NotImplementedError
+
+    def prepare(self, records: List[Dict[str, Any]], state: Dict[str, Any]) -> Any:
+        """整理一次刷盘的载荷（在事件循环线程上调用）
+
+        Args:
+            records: 自上次刷盘以来的变更记录
+            state: 当前完整状态
+        Returns:
+            Any: 交给 write 的载荷
+        """
+        raise NotImplementedError
+
+    def write(self, payload: Any) -> None:
+        """执行写入（在 I/O 线程中调用）
+
+        Args:
+            payload: prepare 返回的载荷
+        """
+        raise NotImplementedError
+
+    def checkpoint(self, state: Dict[str, Any]) -> None:
+        """同步写入一份完整状态（启动重放或迁移后使用）
+
+        Args:
+            state: 当前完整状态
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """释放后端持有的资源"""
+
+    def _load_snapshot(self, path: Path, keep: int) -> Optional[Dict[str, Any]]:
+        """加载并迁移快照，记录读到的是否为旧版本
+
+        Args:
+            path: 快照文件路径
+            keep: 可回退的历史快照份数
+        Returns:
+            Optional[Dict[str, Any]]: 当前版本的状态，没有可用快照时返回None
+        """
+        loaded = load_snapshot(path, keep, self.log)
+        if loaded is None:
+            return None
+        state, version, self.recovered_from = loaded
+        if version < SCHEMA_VERSION:
+            self.upgraded_from = version
+            self.log.info("apq: migrated %s from version %d to %d", path.name, version, SCHEMA_VERSION)
+        return state
+
+
+class SnapshotStore(StorageBackend):
+    """整文件快照存储：每次刷盘原子地重写 database.json"""
+
+    name = "snapshot"
+
+    def __init__(self, snapshot_path: Path, keep: int = 0, log: Optional[logging.Logger] = None):
+        """初始化快照存储
+
+        Args:
+            snapshot_path: 快照文件路径（即 database.json）
+            keep: 保留的历史快照份数
+            log: 日志记录器
+        """
+        super().__init__(log)
+        self.snapshot_path = snapshot_path
+        self.keep = max(0, int(keep))
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        state = self._load_snapshot(self.snapshot_path, self.keep)
+        if self.recovered_from:
+            # 整文件快照没有日志可以补回，较新的快照中的变更已经找不回来
+            self.log.error("apq: %s was unusable and %s was loaded instead; "
+                           "changes saved after that backup are LOST",
+                           self.snapshot_path.name, backup_path(self.snapshot_path, self.recovered_from).name)
+        return state, []
+
+    def prepare(self, records: List[Dict[str, Any]], state: Dict[str, Any]) -> bytes:
+        return encode_snapshot(state)
+
+    def write(self, payload: bytes) -> None:
+        self.bytes_written += atomic_write_text(self.snapshot_path, payload, keep=self.keep)
+
+    def checkpoint(self, state: Dict[str, Any]) -> None:
+        self.write(encode_snapshot(state))
+
+
+class JournalStore(StorageBackend):
+    """快照 + 追加日志的存储实现
+
+    snapshot_path 保存某一时刻的完整状态，journal_path 按行保存此后的每一次变更
+    加载时 快照 + 日志重放 = 最新状态
+
+    保留历史快照时，日志随快照一起轮转：压缩时旧日志改名为 journal.1（原来的 journal.1 -> .2 ...），
+    journal.i 记录的是从 database.json.i 到 database.json.(i-1) 之间的变更，因此
+    database.json.i + journal.i + ... + journal.1 + journal 同样等于最新状态，
+    最新快照损坏而回退到历史快照时不会丢失已经落盘的变更
+    """
+
+    name = "journal"
+
+    def __init__(self, snapshot_path: Path, journal_path: Path, compact_threshold: int = 200,
+                 keep: int = 0, log: Optional[logging.Logger] = None):
+        """初始化日志存储
+
+        Args:
+            snapshot_path: 快照文件路径（即 database.json）
+            journal_path: 追加日志文件路径
+            compact_threshold: 日志累积多少条后触发压缩
+            keep: 压缩时保留的历史快照份数
+            log: 日志记录器，默认使用模块级 logger
+        """
+        super().__init__(log)
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_threshold = max(1, int(compact_threshold))
+        self.keep = max(0, int(keep))
+        self.pending = 0  # 自上次压缩以来追加的日志条数
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """读取快照和待重放的日志记录
+
+        日志最后一行可能因崩溃而写了一半，解析失败的行会被跳过
+        回退到第 i 份历史快照时，依次重放 journal.i ... journal.1 和当前日志
+
+        Returns:
+            Tuple: (快照字典或None, 按写入顺序排列的日志记录列表)
+        """
+        snapshot = self._load_snapshot(self.snapshot_path, self.keep)
+
+        records: List[Dict[str, Any]] = []
+        for index in range(self.recovered_from, 0, -1):
+            journal = backup_path(self.journal_path, index)
+            if not journal.exists():
+                # 没有对应的日志（旧版本写入的历史快照，或文件被删除），这一段变更无法补回
+                self.log.error("apq: %s is missing; changes between %s and the next snapshot are LOST",
+                               journal.name, backup_path(self.snapshot_path, index).name)
+                continue
+            records.extend(self._read_journal(journal))
+        if self.recovered_from:
+            self.log.warning("apq: replaying %d journal records on top of %s", len(records),
+                             backup_path(self.snapshot_path, self.recovered_from).name)
+        current = self._read_journal(self.journal_path)
+        records.extend(current)
+
+        self.pending = len(current)
+        return snapshot, records
+
+    def _read_journal(self, path: Path) -> List[Dict[str, Any]]:
+        """读取一个日志文件中的全部完整记录
+
+        Args:
+            path: 日志文件路径（当前日志或 journal.i）
+        Returns:
+            List[Dict[str, Any]]: 按写入顺序排列的变更记录，文件不存在时为空
+        """
+        records: List[Dict[str, Any]] = []
+        if not path.exists():
+            return records
+        with path.open("rb") as fp:
+            for lineno, line in enumerate(fp, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = codec.loads(line)
+                except ValueError:
+                    # 半截写入的记录直接丢弃，不影响前面已完整落盘的记录
+                    self.log.warning("apq: %s line %d is corrupted, skipped", path.name, lineno)
+                    continue
+                if isinstance(record, dict) and "op" in record:
+                    records.append(record)
+        return records
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """向日志文件追加一条记录
+
+        Args:
+            record: 包含 op 字段的变更记录
+        """
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict[str, Any]]) -> None:
+        """一次性追加多条记录（合并刷盘时使用，只打开一次文件）
+
+        Args:
+            records: 变更记录列表
+        """
+        if not records:
+            return
+        data = b"".join(encode_record(r) for r in records)
+        with self.journal_path.open("ab") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self.pending += len(records)
+        self.bytes_written += len(data)
+
+    @property
+    def needs_compaction(self) -> bool:
+        """日志条数是否已达到压缩阈值"""
+        return self.pending >= self.compact_threshold
+
+    def compact(self, snapshot_text: bytes) -> None:
+        """将当前状态写成快照并清空日志
+
+        先写快照再处理日志：即使在两步之间崩溃，重放的也只是已经包含在快照中的覆盖型变更
+
+        Args:
+            snapshot_text: 已编码的完整状态（见 encode_snapshot）
+        """
+        # 快照存在时才会被轮转成 .1，日志要与它保持一致
+        rotated = self.keep > 0 and self.snapshot_path.exists()
+        self.bytes_written += atomic_write_text(self.snapshot_path, snapshot_text, keep=self.keep)
+        self._retire_journal(rotated)
+        self.pending = 0
+
+    def _retire_journal(self, rotated: bool) -> None:
+        """快照写入后清空当前日志，保留历史快照时把旧日志留给对应的历史快照
+
+        Args:
+            rotated: 本次写入是否把旧快照轮转成了 database.json.1
+        """
+        journal = self.journal_path
+        first = backup_path(journal, 1)
+        if rotated:
+            # 与快照同样从最旧的开始后移；缺失的一份要删掉目标，避免旧日志配上不相干的快照
+            for index in range(self.keep - 1, 0, -1):
+                older, target = backup_path(journal, index), backup_path(journal, index + 1)
+                if older.exists():
+                    os.replace(older, target)
+                elif target.exists():
+                    target.unlink()
+            if journal.exists():
+                os.replace(journal, first)
+            else:
+                atomic_write_text(first, b"")
+            _fsync_dir(journal.parent)
+            return
+        if self.keep > 0 and journal.exists() and backup_path(self.snapshot_path, 1).exists():
+            # 最新快照此前不存在（损坏后被挪开），database.json.1 之后的变更还在当前日志里，
+            # 并入 journal.1 后再清空，database.json.1 + journal.1 仍等于最新状态
+            with first.open("ab") as fp:
+                fp.write(journal.read_bytes())
+                fp.flush()
+                os.fsync(fp.fileno())
+        atomic_write_text(journal, b"")
+
+    def prepare(self, records: List[Dict[str, Any]],
+                state: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[bytes]]:
+        # 达到阈值时顺带编码快照，由 write 在追加之后压缩
+        snapshot_text = None
+        if self.pending + len(records) >= self.compact_threshold:
+            snapshot_text = encode_snapshot(state)
+        return records, snapshot_text
+
+    def write(self, payload: Tuple[List[Dict[str, Any]], Optional[bytes]]) -> None:
+        records, snapshot_text = payload
+        self.append_many(records)
+        if snapshot_text is not None:
+            self.compact(snapshot_text)
+
+    def checkpoint(self, state: Dict[str, Any]) -> None:
+        self.compact(encode_snapshot(state))
+
+
+# SQLite 表结构：会话 / 成员 / 记录的群聊
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    captain    TEXT NOT NULL,
+    created_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS members (
+    session_id   TEXT NOT NULL,
+    qq_number    TEXT NOT NULL,
+    nickname     TEXT,
+    character_id TEXT,
+    gender       TEXT,
+    job          TEXT,
+    joined_at    INTEGER,
+    position     INTEGER NOT NULL,
+    PRIMARY KEY (session_id, qq_number)
+);
+CREATE TABLE IF NOT EXISTS waitlist (
+    session_id   TEXT NOT NULL,
+    qq_number    TEXT PRIMARY KEY,
+    nickname     TEXT,
+    character_id TEXT,
+    gender       TEXT,
+    job          TEXT,
+    joined_at    INTEGER,
+    position     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queue (
+    session_id   TEXT NOT NULL,
+    qq_number    TEXT PRIMARY KEY,
+    nickname     TEXT,
+    character_id TEXT,
+    gender       TEXT,
+    job          TEXT,
+    joined_at    INTEGER,
+    position     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracked_groups (
+    group_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+"""
+
+# 预编译（参数化）语句，sqlite3 会按语句文本缓存编译结果
+SQL_UPSERT_SESSION = (
+    "INSERT OR REPLACE INTO sessions (session_id, status, captain, created_at) VALUES (?, ?, ?, ?)"
+)
+SQL_DELETE_SESSION = "DELETE FROM sessions WHERE session_id = ?"
+SQL_CLEAR_MEMBERS = "DELETE FROM members WHERE session_id = ?"
+SQL_CLEAR_SESSIONS = "DELETE FROM sessions"
+SQL_CLEAR_ALL_MEMBERS = "DELETE FROM members"
+# 一个QQ号同时只会出现在一个会话中，加入新会话时从任意会话中移除旧记录
+SQL_DELETE_MEMBER = "DELETE FROM members WHERE qq_number = ?"
+SQL_INSERT_MEMBER = (
+    "INSERT INTO members (session_id, qq_number, nickname, character_id, gender, job, joined_at, position) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM members WHERE session_id = ?))"
+)
+SQL_UPDATE_MEMBER = (
+    "UPDATE members SET character_id = ?, gender = ?, job = ? WHERE session_id = ? AND qq_number = ?"
+)
+SQL_ENQUEUE = (
+    "INSERT INTO queue (session_id, qq_number, nickname, character_id, gender, job, joined_at, position) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM queue WHERE session_id = ?))"
+)
+SQL_DEQUEUE = "DELETE FROM queue WHERE qq_number = ?"
+SQL_CLEAR_QUEUE = "DELETE FROM queue WHERE session_id = ?"
+SQL_CLEAR_ALL_QUEUES = "DELETE FROM queue"
+SQL_UPDATE_QUEUED = "UPDATE queue SET character_id = ?, gender = ?, job = ? WHERE qq_number = ?"
+SQL_WAITLIST = (
+    "INSERT INTO waitlist (session_id, qq_number, nickname, character_id, gender, job, joined_at, position) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM waitlist WHERE session_id = ?))"
+)
+SQL_UNWAIT = "DELETE FROM waitlist WHERE qq_number = ?"
+SQL_CLEAR_WAITLIST = "DELETE FROM waitlist WHERE session_id = ?"
+SQL_CLEAR_ALL_WAITLISTS = "DELETE FROM waitlist"
+SQL_UPDATE_WAITLISTED = "UPDATE waitlist SET character_id = ?, gender = ?, job = ? WHERE qq_number = ?"
+SQL_UPDATE_CAPTAIN = "UPDATE sessions SET captain = ? WHERE session_id = ?"
+SQL_INSERT_GROUP = (
+    "INSERT OR IGNORE INTO tracked_groups (group_id, position) "
+    "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM tracked_groups))"
+)
+SQL_CLEAR_GROUPS = "DELETE FROM tracked_groups"
+
+Statement = Tuple[str, tuple]
+
+
+def _member_params(session_id: str, player: Dict[str, Any]) -> tuple:
+    """生成插入成员语句的参数"""
+    return (
+        session_id,
+        player.get("qq_number"),
+        player.get("nickname"),
+        player.get("character_id"),
+        player.get("gender"),
+        player.get("job"),
+        player.get("joined_at"),
+        session_id,
+    )
+
+
+def _player_row(row: tuple) -> Dict[str, Any]:
+    """把 (会话ID, QQ号, 昵称, 角色ID, 性别, 职业, 报名时间) 行还原为玩家字典"""
+    player = {"qq_number": row[1], "nickname": row[2], "character_id": row[3], "gender": row[4], "job": row[5]}
+    if row[6] is not None:
+        player["joined_at"] = row[6]
+    return player
+
+
+def _captain_text(captain: Any) -> str:
+    """队长列保存的 JSON 文本"""
+    return codec.dumps(captain or {}).decode("utf-8")
+
+
+def _forget(qq_number: str) -> List[Statement]:
+    """一个QQ号同时只会出现在一处，重新报名前从成员、候补和匹配队列中移除旧记录"""
+    return [(SQL_DELETE_MEMBER, (qq_number,)), (SQL_UNWAIT, (qq_number,)), (SQL_DEQUEUE, (qq_number,))]
+
+
+class SQLiteStore(StorageBackend):
+    """SQLite 存储后端（WAL 模式）
+
+    每条变更记录被翻译成针对单行的 SQL 语句，退出/更换角色只改动一行，
+    而不是重写整个文件；没有专门翻译的变更类型回退为整表重写
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path, legacy_json_path: Optional[Path] = None,
+                 log: Optional[logging.Logger] = None):
+        """初始化 SQLite 存储
+
+        Args:
+            db_path: SQLite 数据库文件路径
+            legacy_json_path: 旧版 database.json 路径，首次启动时一次性迁移
+            log: 日志记录器
+        """
+        super().__init__(log)
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        # 写入在 I/O 线程中执行，加载在事件循环线程中执行，两者不会并发
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        # 旧版数据库没有时间戳列，补上（已有的行为空，按插件启动时间计算过期）
+        self._add_missing_column("sessions", "created_at", "INTEGER")
+        for table in ("members", "waitlist", "queue"):
+            self._add_missing_column(table, "joined_at", "INTEGER")
+
+    def _add_missing_column(self, table: str, column: str, decl: str) -> None:
+        """表中缺少某列时追加该列
+
+        Args:
+            table: 表名
+            column: 列名
+            decl: 列类型
+        """
+        columns = {r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        migrated = self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone()
+        if migrated is None:
+            self._migrate_from_json()
+        return self._read_state(), []
+
+    def _migrate_from_json(self) -> None:
+        """把旧版 database.json 一次性导入 SQLite，导入后原文件改名保留"""
+        legacy = None
+        if self.legacy_json_path is not None:
+            legacy = load_snapshot(self.legacy_json_path, 0, self.log)
+        if legacy is not None:
+            self.checkpoint(legacy[0])
+            os.replace(self.legacy_json_path, self.legacy_json_path.with_name(
+                f"{self.legacy_json_path.name}.migrated"))
+            self.log.info("apq: migrated %s into %s", self.legacy_json_path.name, self.db_path.name)
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', '1')")
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        """从数据表还原状态字典（所有会话）"""
+        sessions: Dict[str, Any] = {}
+        for sid, status, captain, created_at in self.conn.execute(
+            "SELECT session_id, status, captain, created_at FROM sessions"
+        ):
+            sessions[sid] = {"status": status, "captain": codec.loads(captain), "members": [], "waitlist": []}
+            if created_at is not None:
+                sessions[sid]["created_at"] = created_at
+        for table, key in (("members", "members"), ("waitlist", "waitlist")):
+            for r in self.conn.execute(
+                f"SELECT session_id, qq_number, nickname, character_id, gender, job, joined_at FROM {table} "
+                "ORDER BY session_id, position"
+            ):
+                session = sessions.get(r[0])
+                if session is None:
+                    continue
+                session[key].append(_player_row(r))
+        queues: Dict[str, List[Dict[str, Any]]] = {}
+        for r in self.conn.execute(
+            "SELECT session_id, qq_number, nickname, character_id, gender, job, joined_at FROM queue "
+            "ORDER BY session_id, position"
+        ):
+            queues.setdefault(r[0], []).append(_player_row(r))
+        groups = [r[0] for r in self.conn.execute("SELECT group_id FROM tracked_groups ORDER BY position")]
+        if not sessions and not queues and not groups:
+            return None
+        # 数据表本身总是当前结构，这里只做校验
+        state, _ = migrate({"version": SCHEMA_VERSION, "sessions": sessions, "queues": queues,
+                            "tracked_groups": groups}, self.log)
+        return state
+
+    @staticmethod
+    def _session_statements(sid: str, session: Dict[str, Any]) -> List[Statement]:
+        """把一个会话翻译成重写该会话的语句"""
+        statements: List[Statement] = [
+            (SQL_DELETE_SESSION, (sid,)),
+            (SQL_CLEAR_MEMBERS, (sid,)),
+            (SQL_CLEAR_WAITLIST, (sid,)),
+            (SQL_UPSERT_SESSION, (sid, session.get("status", "idle"),
+                                  _captain_text(session.get("captain")),
+                                  session.get("created_at"))),
+        ]
+        statements.extend((SQL_INSERT_MEMBER, _member_params(sid, p)) for p in session.get("members", []))
+        statements.extend((SQL_WAITLIST, _member_params(sid, p)) for p in session.get("waitlist", []))
+        return statements
+
+    def _full_statements(self, state: Dict[str, Any]) -> List[Statement]:
+        """把完整状态翻译成整表重写语句"""
+        statements: List[Statement] = [
+            (SQL_CLEAR_SESSIONS, ()),
+            (SQL_CLEAR_ALL_MEMBERS, ()),
+            (SQL_CLEAR_ALL_QUEUES, ()),
+            (SQL_CLEAR_ALL_WAITLISTS, ()),
+            (SQL_CLEAR_GROUPS, ()),
+        ]
+        for sid, session in state.get("sessions", {}).items():
+            statements.extend(self._session_statements(sid, session))
+        for sid, queue in state.get("queues", {}).items():
+            statements.extend((SQL_ENQUEUE, _member_params(sid, p)) for p in queue)
+        statements.extend((SQL_INSERT_GROUP, (g,)) for g in state.get("tracked_groups", []))
+        return statements
+
+    def _record_statements(self, record: Dict[str, Any], state: Dict[str, Any]) -> Optional[List[Statement]]:
+        """把一条变更记录翻译成只涉及所属会话的语句，无法翻译时返回None"""
+        sid = record.get("session", DEFAULT_SESSION)
+        op = record.get("op")
+        if op in ("join", "enqueue", "waitlist"):
+            player = record["player"]
+            insert = {"join": SQL_INSERT_MEMBER, "enqueue": SQL_ENQUEUE, "waitlist": SQL_WAITLIST}[op]
+            return _forget(player.get("qq_number")) + [(insert, _member_params(sid, player))]
+        if op in ("quit", "delete", "expire_member"):
+            return _forget(record["qq_number"])
+        if op == "promote":
+            session = state.get("sessions", {}).get(sid)
+            player = next((p for p in (session or {}).get("members", [])
+                           if p.get("qq_number") == record["qq_number"]), None)
+            if player is None:
+                # 之后的变更已经改变了该玩家，以完整状态为准
+                return None
+            return _forget(record["qq_number"]) + [(SQL_INSERT_MEMBER, _member_params(sid, player))]
+        if op == "match":
+            return [(SQL_DEQUEUE, (uid,)) for uid in record["qq_numbers"]]
+        if op == "clear_queue":
+            return [(SQL_CLEAR_QUEUE, (sid,))]
+        if op == "replace":
+            fields = (record["character_id"], record["gender"], record["job"])
+            statements = [
+                (SQL_UPDATE_MEMBER, fields + (sid, record["qq_number"])),
+                (SQL_UPDATE_QUEUED, fields + (record["qq_number"],)),
+                (SQL_UPDATE_WAITLISTED, fields + (record["qq_number"],)),
+            ]
+            session = state.get("sessions", {}).get(sid)
+            if session is not None:
+                statements.append(
+                    (SQL_UPDATE_CAPTAIN, (_captain_text(session.get("captain")), sid)))
+            return statements
+        if op == "track_group":
+            return [(SQL_INSERT_GROUP, (record["group_id"],))]
+        if op == "create":
+            player = record["player"]
+            return _forget(player.get("qq_number")) + [
+                (SQL_CLEAR_MEMBERS, (sid,)),
+                (SQL_CLEAR_WAITLIST, (sid,)),
+                (SQL_UPSERT_SESSION, (sid, "recruiting", _captain_text(player),
+                                      player.get("joined_at"))),
+                (SQL_INSERT_MEMBER, _member_params(sid, player)),
+            ]
+        if op == "expire_session" or (op == "reset" and "session" in record):
+            return [(SQL_DELETE_SESSION, (sid,)), (SQL_CLEAR_MEMBERS, (sid,)), (SQL_CLEAR_WAITLIST, (sid,))]
+        return None
+
+    def prepare(self, records: List[Dict[str, Any]], state: Dict[str, Any]) -> List[Statement]:
+        statements: List[Statement] = []
+        for record in records:
+            translated = self._record_statements(record, state)
+            if translated is None:
+                # 未翻译的变更（如重置）直接以当前完整状态为准，后面的记录已包含在其中
+                return self._full_statements(state)
+            statements.extend(translated)
+        return statements
+
+    def write(self, payload: List[Statement]) -> None:
+        if not payload:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for sql, params in payload:
+                self.conn.execute(sql, params)
+        self.bytes_written += sum(len(sql) + sum(len(str(p)) for p in params) for sql, params in payload)
+
+    def checkpoint(self, state: Dict[str, Any]) -> None:
+        self.write(self._full_statements(state))
+
+    def close(self) -> None:
+        self.conn.close()
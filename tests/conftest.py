@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共设置
+
+插件目录通过 benchmarks/_stubs.py 作为包加载（模块之间使用相对导入，不能按文件路径单独导入），
+没有安装 AstrBot 时由其中的替身代替
+"""
+
+import sys            # 路径处理
+from pathlib import Path    # 路径处理
+
+import pytest         # 测试框架
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import _stubs  # noqa: E402
+
+
+@pytest.fixture
+def new_plugin(tmp_path):
+    """在临时数据目录上实例化插件的工厂（需要在事件循环中调用），默认关闭限流和指标导出"""
+    main = _stubs.load_plugin()
+
+    def factory(**config):
+        _stubs.set_data_root(tmp_path)
+        config.setdefault("metrics_export_interval_seconds", 0)
+        config.setdefault("rate_limit_user_per_minute", 0)
+        config.setdefault("rate_limit_group_per_minute", 0)
+        return main.APQPlugin(_stubs.FakeContext(), main.AstrBotConfig(config))
+
+    return factory
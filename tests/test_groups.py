@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""群聊登记：去重与活跃时间刷新、只追加的 groups.jsonl、压缩重写和不活跃群的移除"""
+
+import asyncio        # 运行异步命令处理器
+
+import _stubs
+
+groups = _stubs.load_module("groups")
+main = _stubs.load_plugin()
+
+DAY = 86400
+
+
+def flush(registry) -> None:
+    """把待写入的行写入文件"""
+    payload = registry.drain()
+    if payload is not None:
+        registry.write(payload)
+
+
+def test_touch_dedupes_and_only_persists_coarse_refreshes(tmp_path):
+    registry = groups.GroupRegistry(tmp_path / "groups.jsonl", resolution=3600)
+    assert registry.touch("a", 1000) is True
+    assert registry.touch("b", 1000) is True
+    assert registry.touch("a", 2000) is False
+    # 距上次落盘不足 resolution 的刷新只更新内存
+    assert list(registry) == ["a", "b"] and registry.last_seen["a"] == 2000
+    flush(registry)
+    assert registry.lines == 2 and not registry.dirty
+
+    registry.touch("a", 1000 + 3600)
+    assert registry.dirty
+    flush(registry)
+    assert registry.lines == 3
+
+
+def test_load_replays_drops_and_clears_and_skips_a_torn_line(tmp_path):
+    path = tmp_path / "groups.jsonl"
+    registry = groups.GroupRegistry(path)
+    for group_id in "abc":
+        registry.touch(group_id, 100)
+    registry.clear()
+    for group_id in "xyz":
+        registry.touch(group_id, 200)
+    assert registry.evict(200 + DAY, 0) == []
+    registry.touch("y", 300 + DAY)
+    assert registry.evict(200 + DAY, DAY) == ["x", "z"]
+    flush(registry)
+    # 模拟崩溃：最后一行只写了一半
+    with path.open("ab") as fp:
+        fp.write(b'{"g": "w", "t"')
+
+    reloaded = groups.GroupRegistry(path)
+    assert reloaded.load()
+    assert list(reloaded) == ["y"] and reloaded.last_seen["y"] == 300 + DAY
+    assert not groups.GroupRegistry(tmp_path / "missing.jsonl").load()
+
+
+def test_file_is_compacted_when_it_outgrows_the_registry(tmp_path):
+    path = tmp_path / "groups.jsonl"
+    registry = groups.GroupRegistry(path, resolution=0)
+    for now in range(70):
+        registry.touch("a", now)
+        flush(registry)
+    # 超过 64 行后整张表被原子重写为每个群一行
+    assert registry.lines < 64
+    assert path.read_text(encoding="utf-8").count("\n") == registry.lines
+
+    reloaded = groups.GroupRegistry(path)
+    reloaded.load()
+    assert reloaded.last_seen == {"a": 69.0}
+
+
+def test_commands_register_groups_and_idle_groups_stop_receiving_broadcasts(new_plugin, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(main.time, "time", lambda: now[0])
+
+    async def run():
+        plugin = new_plugin(group_ttl_days=7)
+        ev = _stubs.FakeEvent
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        await plugin.create_apq(ev("2", group="200"), "c2", "gr", "拳手")
+        await plugin.query_apq(ev("3"))
+        registered = plugin._broadcast_groups()
+
+        now[0] += 6 * DAY
+        await plugin.query_apq(ev("1", group="100"))
+        now[0] += 2 * DAY
+        remaining = plugin._broadcast_groups()
+        await plugin.terminate()
+        return registered, remaining
+
+    registered, remaining = asyncio.run(run())
+    assert registered == ["aiocqhttp:GroupMessage:100", "aiocqhttp:GroupMessage:200"]
+    assert remaining == ["aiocqhttp:GroupMessage:100"]
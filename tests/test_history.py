@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""历史归档：按月分段追加、按时间范围扫描、截掉写了一半的段尾"""
+
+import asyncio        # 运行异步命令处理器
+import gzip           # 构造不完整的段尾
+import time           # 构造时间戳
+
+import _stubs
+
+history = _stubs.load_module("history")
+
+
+def ts_of(year: int, month: int, day: int) -> int:
+    """本地时间某天中午的时间戳"""
+    return int(time.mktime((year, month, day, 12, 0, 0, 0, 0, -1)))
+
+
+def record(ts: int, outcome: str = "completed") -> dict:
+    """构造一条只有一名成员的归档记录"""
+    member = {"qq_number": "1", "nickname": "n1", "character_id": "c1", "gender": "gr", "job": "拳手"}
+    return history.HistoryArchive.make_record(outcome, "g", [member], captain="1", ts=ts)
+
+
+def test_make_record_copies_member_fields():
+    member = {"qq_number": "1", "nickname": "n1", "character_id": "c1", "gender": "gr", "job": "拳手",
+              "joined_at": 123}
+    rec = history.HistoryArchive.make_record("matched", "g", [member], started_at=100, ts=200)
+    assert rec["members"] == [{k: member[k] for k in ("qq_number", "nickname", "character_id", "gender", "job")}]
+    assert (rec["outcome"], rec["captain"], rec["started_at"], rec["ts"]) == ("matched", None, 100, 200)
+    member["job"] = "法师"
+    assert rec["members"][0]["job"] == "拳手"
+
+
+def test_scan_reads_month_segments_in_time_order(tmp_path):
+    archive = history.HistoryArchive(tmp_path / "history")
+    stamps = [ts_of(2024, 1, 5), ts_of(2024, 1, 20), ts_of(2024, 3, 1), ts_of(2024, 3, 9)]
+    for ts in stamps:
+        archive.append(record(ts))
+    assert archive.segments() == ["2024-01", "2024-03"]
+
+    assert [r["ts"] for r in archive.scan()] == stamps
+    assert [r["ts"] for r in archive.scan(start=stamps[1], end=stamps[2])] == stamps[1:3]
+
+    latest, total = archive.recent(since=stamps[1], limit=2)
+    assert [r["ts"] for r in latest] == [stamps[3], stamps[2]]
+    assert total == 3
+
+
+def test_truncated_tail_is_cut_before_the_next_append(tmp_path, monkeypatch):
+    # 小块读取，让段尾检查跨越多个块
+    monkeypatch.setattr(history, "_SCAN_CHUNK", 16)
+    directory = tmp_path / "history"
+    archive = history.HistoryArchive(directory)
+    stamps = [ts_of(2024, 5, d) for d in (1, 2, 3)]
+    for ts in stamps:
+        archive.append(record(ts))
+    path = archive.segment_path("2024-05")
+    whole = path.stat().st_size
+    # 模拟崩溃：段尾留下写了一半的 gzip 成员
+    blob = gzip.compress(b'{"ts": 0}\n', mtime=0)
+    with open(path, "ab") as f:
+        f.write(blob[: len(blob) // 2])
+    assert history._valid_length(path) == whole
+
+    reopened = history.HistoryArchive(directory)
+    reopened.append(record(ts_of(2024, 5, 4)))
+    assert len(list(reopened.scan())) == 4
+
+
+def test_finished_runs_are_archived(new_plugin):
+    async def run():
+        plugin = new_plugin()
+        ev = _stubs.FakeEvent
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        for uid in "23456":
+            await plugin.join_apq(ev(uid, group="100"), f"c{uid}", "br", f"职业{uid}")
+        await plugin.create_apq(ev("7", group="100"), "c7", "gr", "拳手")
+        await plugin.cancel_apq(ev("7", group="100"))
+        await plugin.terminate()
+        return list(plugin.history.scan())
+
+    records = asyncio.run(run())
+    assert [r["outcome"] for r in records] == ["completed", "cancelled"]
+    assert [m["qq_number"] for m in records[0]["members"]] == ["1", "2", "3", "4", "5", "6"]
+    assert records[0]["captain"] == "1"
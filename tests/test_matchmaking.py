@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""匹配队列与组成规则：入队顺序、成队挑选、br/gr 人数与职业上限，以及新会话从匹配队列拉人"""
+
+import asyncio        # 运行异步命令处理器
+
+import _stubs
+
+matchmaking = _stubs.load_module("matchmaking")
+
+RULES = matchmaking.CompositionRules(team_size=6, min_br=1, max_br=5, min_gr=1, max_gr=5)
+
+
+def player(qq: str, gender: str, job: str = "刀飞") -> dict:
+    """构造一名玩家"""
+    return {"qq_number": qq, "nickname": f"n{qq}", "character_id": f"c{qq}", "gender": gender, "job": job}
+
+
+def queue_of(rules, *players) -> "matchmaking.MatchQueue":
+    """按给定顺序入队"""
+    queue = matchmaking.MatchQueue(rules)
+    for p in players:
+        queue.add(p)
+    return queue
+
+
+def qqs(party) -> list:
+    """队伍成员的QQ号，无法成队时为None"""
+    return None if party is None else [p["qq_number"] for p in party]
+
+
+def test_queue_keeps_join_order_and_requeue_moves_to_tail():
+    queue = queue_of(RULES, player("1", "br"), player("2", "br"), player("3", "gr"))
+    assert [queue.position(q) for q in "123"] == [1, 2, 3]
+
+    queue.add(player("1", "br"))
+    assert [queue.position(q) for q in "231"] == [1, 2, 3]
+
+    assert queue.remove("2")["qq_number"] == "2"
+    assert queue.remove("2") is None
+    assert "2" not in queue and len(queue) == 2
+
+
+def test_match_picks_the_earliest_players_that_fit():
+    brides = [player(str(i), "br") for i in range(1, 7)]
+    queue = queue_of(RULES, *brides)
+    # 6 名 br 没有 gr，凑不成队
+    assert queue.match() is None
+
+    queue.add(player("7", "gr"))
+    assert qqs(queue.match()) == ["1", "2", "3", "4", "5", "7"]
+    # match 只挑选不出队
+    assert len(queue) == 7
+
+
+def test_match_needs_a_full_team():
+    queue = queue_of(RULES, player("1", "br"), player("2", "gr"), player("3", "br"))
+    assert queue.match() is None
+
+
+def test_reindex_moves_player_to_new_bucket():
+    players = [player(str(i), "br") for i in range(1, 7)]
+    queue = queue_of(RULES, *players)
+    assert queue.match() is None
+
+    players[2]["gender"] = "gr"
+    queue.reindex("3")
+    assert qqs(queue.match()) == ["1", "2", "3", "4", "5", "6"]
+
+
+def test_splits_follow_the_br_gr_limits():
+    assert RULES.splits() == [1, 2, 3, 4, 5]
+    assert matchmaking.CompositionRules(team_size=6, min_br=2, max_br=6, min_gr=3, max_gr=6).splits() == [2, 3]
+    # 自相矛盾的规则没有可行的分配
+    assert matchmaking.CompositionRules(team_size=6, min_br=4, max_br=6, min_gr=3, max_gr=6).splits() == []
+
+
+def test_admits_reports_why_a_player_does_not_fit():
+    rules = RULES._replace(min_gr=2, max_per_job=2)
+    brides = [player(str(i), "br", job) for i, job in enumerate(["刀飞", "刀飞", "法师", "主教"], 1)]
+    assert rules.admits(brides, player("9", "gr", "弓手")) is None
+    assert "同一职业" in rules.admits(brides, player("9", "gr", "刀飞"))
+    # 第 5 名 br 会占掉留给 gr 的名额
+    assert "剩余名额" in rules.admits(brides, player("9", "br", "弓手"))
+    assert "br" in rules.admits(brides + [player("5", "br", "弓手")], player("9", "br", "船长"))
+
+
+def test_can_fill_counts_job_slots_shared_by_both_genders():
+    rules = matchmaking.CompositionRules(team_size=2, max_per_job=1)
+    # br 和 gr 各有一名候选，但同一职业只能上一人
+    assert not rules.can_fill({"br": 1, "gr": 1}, {("br", "a"): 1, ("gr", "a"): 1}, {})
+    assert rules.can_fill({"br": 1, "gr": 1}, {("br", "a"): 1, ("gr", "b"): 1}, {})
+    assert not rules.can_fill({"br": 1, "gr": 0}, {("br", "a"): 1}, {"a": 1})
+
+
+def test_match_finds_a_party_that_greedy_picking_misses():
+    rules = matchmaking.CompositionRules(team_size=6, min_br=1, max_br=4, min_gr=1, max_gr=5, max_per_job=1)
+    queue = queue_of(rules, player("1", "br", "A"), player("2", "br", "B"), player("3", "br", "C"),
+                     player("4", "br", "D"), player("5", "br", "E"), player("6", "gr", "A"), player("7", "gr", "F"))
+    # 按入队顺序贪心会先挑中 br/A，之后 gr/A 无法入队，只剩 gr/F 一名 gr
+    assert qqs(queue.match()) == ["2", "3", "4", "5", "6", "7"]
+
+
+def test_match_respects_job_cap_and_prefers_the_earliest_last_player():
+    rules = RULES._replace(max_per_job=2)
+    queue = queue_of(rules, *[player(str(i), "br", "刀飞") for i in range(1, 5)],
+                     player("5", "gr", "刀飞"), player("6", "br", "法师"), player("7", "gr", "主教"),
+                     player("8", "br", "弓手"), player("9", "gr", "船长"))
+    party = queue.match()
+    # gr 只有三名，需要全部入队，刀飞的另一个名额已被 5 号占用
+    assert qqs(party) == ["1", "5", "6", "7", "8", "9"]
+    assert sum(1 for p in party if p["job"] == "刀飞") == 2
+
+
+def test_empty_party_limits_fall_back_to_defaults(new_plugin):
+    async def run():
+        plugin = new_plugin(party_min_br="", party_max_br=None, party_min_gr=0, party_max_per_job="")
+        rules = plugin.composition
+        await plugin.terminate()
+        return rules
+
+    rules = asyncio.run(run())
+    assert (rules.min_br, rules.max_br, rules.min_gr, rules.max_gr, rules.max_per_job) == (1, 5, 0, 5, 0)
+
+
+def test_new_session_pulls_queued_players(new_plugin):
+    async def run():
+        plugin = new_plugin()
+        ev = _stubs.FakeEvent
+        await plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞")
+        await plugin.join_apq(ev("3", group="100"), "c3", "gr", "法师")
+        await plugin.join_apq(ev("4", group="200"), "c4", "br", "弓手")
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        sid = plugin._session_id(ev("1", group="100"))
+        members = [p.qq_number for p in plugin.state["sessions"][sid].members]
+        queued = {s: [p.qq_number for p in q] for s, q in plugin.state["queues"].items() if q}
+        await plugin.terminate()
+        return sid, members, queued
+
+    sid, members, queued = asyncio.run(run())
+    assert members == ["1", "2", "3"]
+    # 其他群的匹配队列不受影响
+    assert list(queued.values()) == [["4"]] and sid not in queued
+
+
+def test_waitlist_next_eligible_skips_players_that_do_not_fit():
+    rules = RULES._replace(max_br=3, max_per_job=2)
+    members = [player("1", "gr", "拳手"), player("2", "br", "刀飞"), player("3", "br", "刀飞")]
+    waitlist = matchmaking.Waitlist(rules)
+    for p in (player("4", "gr", "刀飞"), player("5", "br", "法师"), player("6", "gr", "主教")):
+        waitlist.add(p)
+    # 4 号的职业已满，5 号之后 br 仍未超限，按候补顺序轮到 5 号
+    assert waitlist.next_eligible(members)["qq_number"] == "5"
+    assert waitlist.next_eligible(members + [player("5", "br", "法师")])["qq_number"] == "6"
+    assert waitlist.next_eligible(members * 2) is None
+
+
+def test_waitlisted_player_is_promoted_in_order_and_keeps_place_on_rejoin(new_plugin):
+    async def run():
+        plugin = new_plugin(party_max_br=3)
+        ev = _stubs.FakeEvent
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        for uid in "234":
+            await plugin.join_apq(ev(uid, group="100"), f"c{uid}", "br", "刀飞")
+        await plugin.join_apq(ev("5", group="100"), "c5", "br", "法师")
+        await plugin.join_apq(ev("6", group="100"), "c6", "br", "弓手")
+        # 仍不满足规则的重新报名保留原来的候补位置
+        reply = await plugin.join_apq(ev("5", group="100"), "c5", "br", "法师")
+        sid = plugin._session_id(ev("1", group="100"))
+        session = plugin.state["sessions"][sid]
+        waiting = [p.qq_number for p in session.waitlist]
+
+        await plugin.quit_apq(ev("3", group="100"))
+        members = [p.qq_number for p in session.members]
+        promoted_waiting = [p.qq_number for p in session.waitlist]
+        await plugin.terminate()
+        return reply, waiting, members, promoted_waiting
+
+    reply, waiting, members, promoted_waiting = asyncio.run(run())
+    assert "第1位" in reply
+    assert waiting == ["5", "6"]
+    assert members == ["1", "2", "4", "5"]
+    assert promoted_waiting == ["6"]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""状态版本迁移：旧版本逐步升级到当前版本，不合法的内容整体拒绝"""
+
+import logging        # 捕获警告
+
+import pytest         # 测试框架
+
+import _stubs
+
+migrations = _stubs.load_module("migrations")
+
+
+def player(qq_number, **fields):
+    return {"qq_number": qq_number, "nickname": f"n{qq_number}", "character_id": f"c{qq_number}",
+            "gender": "br", "job": "刀飞", "joined_at": 1700000000, **fields}
+
+
+def test_v0_single_session_is_upgraded_to_current():
+    captain = player("1")
+    data = {"status": "recruiting", "captain": captain, "members": [captain, player("2")],
+            "tracked_groups": ["g1"]}
+    state, version = migrations.migrate(data)
+    assert version == 0
+    session = state["sessions"][migrations.DEFAULT_SESSION]
+    assert session["status"] == "recruiting"
+    assert [m["qq_number"] for m in session["members"]] == ["1", "2"]
+    assert session["waitlist"] == [] and session["created_at"] is None
+    assert state["queues"] == {} and state["tracked_groups"] == ["g1"]
+
+
+def test_empty_v0_state_has_no_sessions():
+    state, version = migrations.migrate({"status": "idle", "captain": {}, "members": []})
+    assert version == 0
+    assert state == {"sessions": {}, "queues": {}, "tracked_groups": []}
+
+
+def test_v1_sessions_get_missing_fields():
+    data = {"sessions": {"g1": {"status": "recruiting", "captain": None, "members": [player("1")]}},
+            "queues": {"g2": [player("2")]}, "tracked_groups": []}
+    state, version = migrations.migrate(data)
+    assert version == 1
+    session = state["sessions"]["g1"]
+    assert session["captain"] == {} and session["waitlist"] == [] and session["created_at"] is None
+    assert state["queues"]["g2"][0]["qq_number"] == "2"
+
+
+def test_current_version_is_unchanged():
+    session = {"status": "recruiting", "captain": player("1"), "members": [player("1")],
+               "waitlist": [player("2")], "created_at": 1700000000}
+    state, version = migrations.migrate({"version": migrations.SCHEMA_VERSION, "sessions": {"g1": session},
+                                         "queues": {}, "tracked_groups": ["g1"]})
+    assert version == migrations.SCHEMA_VERSION
+    assert state["sessions"]["g1"]["waitlist"][0]["qq_number"] == "2"
+
+
+def test_newer_version_is_rejected():
+    with pytest.raises(migrations.SchemaError):
+        migrations.migrate({"version": migrations.SCHEMA_VERSION + 1, "sessions": {}})
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    {"version": "2", "sessions": {}},
+    {"sessions": {"g1": {"status": "unknown", "members": []}}},
+    {"sessions": {"g1": {"status": "recruiting", "members": [{"qq_number": 123}]}}},
+    {"sessions": {}, "queues": {"g1": [player("1", joined_at="yesterday")]}},
+    {"sessions": {}, "tracked_groups": [1, 2]},
+])
+def test_invalid_state_is_rejected(data):
+    with pytest.raises(migrations.SchemaError):
+        migrations.migrate(data)
+
+
+def test_unknown_top_level_keys_are_dropped(caplog):
+    with caplog.at_level(logging.WARNING):
+        state, _ = migrations.migrate({"sessions": {}, "queues": {}, "extra": 1})
+    assert "extra" not in state
+    assert "extra" in caplog.text
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""数据模型：玩家和会话与持久化字典的往返，队长始终引用成员列表中的同一个对象"""
+
+import asyncio        # 运行异步命令处理器
+
+import pytest         # 测试框架
+
+import _stubs
+
+models = _stubs.load_module("models")
+Player, Session = models.Player, models.Session
+
+
+def player_dict(qq: str, **fields) -> dict:
+    """持久化格式的玩家字典"""
+    data = {"qq_number": qq, "nickname": f"n{qq}", "character_id": f"c{qq}", "gender": "br", "job": "刀飞"}
+    data.update(fields)
+    return data
+
+
+def test_player_round_trips_and_reads_like_a_dict():
+    old = player_dict("1")
+    player = Player.from_dict(dict(old, extra="ignored"))
+    # 旧数据没有报名时间，写回时也不带该字段
+    assert player.to_dict() == old and dict(player) == old
+    assert Player.from_dict(player_dict("2", joined_at=5)).to_dict()["joined_at"] == 5
+
+    assert player["job"] == "刀飞" and player.get("joined_at", 0) == 0 and player.get("unknown") is None
+    with pytest.raises(KeyError):
+        player["unknown"]
+    assert not hasattr(player, "__dict__")
+
+    player.update({"gender": "gr", "job": "".join(["拳", "手"])})
+    assert player.job is Player.from_dict(player_dict("3", job="拳手")).job
+
+
+def test_session_links_the_captain_to_its_member_entry():
+    data = {"status": "recruiting", "captain": player_dict("1"), "created_at": 10,
+            "members": [player_dict("1"), player_dict("2")], "waitlist": [player_dict("3")]}
+    session = Session.from_dict(data)
+    assert session.captain is session.members[0] and session.captain_qq == "1"
+    assert session.to_dict() == data
+    # 更换角色只改一处，队长信息随之变化
+    session.members[0].update({"job": "法师"})
+    assert session.to_dict()["captain"]["job"] == "法师"
+
+    # 找不到对应成员的旧数据保留独立的队长
+    orphan = Session.from_dict(dict(data, members=[player_dict("2")]))
+    assert orphan.captain.qq_number == "1" and orphan.captain not in orphan.members
+    assert Session.from_dict({}).to_dict() == {"status": "idle", "captain": {}, "members": [], "waitlist": [],
+                                               "created_at": None}
+
+
+def test_captain_rejoin_points_the_captain_at_the_new_entry(new_plugin):
+    async def run():
+        plugin = new_plugin()
+        ev = _stubs.FakeEvent
+        sid = plugin._session_id(ev("1", group="100"))
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        await plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞")
+        await plugin.join_apq(ev("1", group="100"), "c9", "br", "法师")
+        session = plugin._get_session(sid)
+        linked = [session.captain is p for p in session.members]
+        status = await plugin.query_apq(ev("9", group="100"))
+        await plugin.terminate()
+
+        reloaded = new_plugin()
+        session = reloaded._get_session(sid)
+        relinked = [session.captain is p for p in session.members]
+        await reloaded.terminate()
+        return linked, status, relinked
+
+    linked, status, relinked = asyncio.run(run())
+    assert linked == [False, True]
+    assert "【队长】\n  - [c9] br 法师" in status
+    assert relinked == [False, True]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""角色参数解析：命令前缀、全角空格、性别别名和含空格的职业"""
+
+import asyncio        # 运行异步命令处理器
+
+import pytest         # 测试框架
+
+import _stubs
+
+parsing = _stubs.load_module("parsing")
+Role = parsing.Role
+
+
+@pytest.mark.parametrize("token, expected", [
+    ("br", "br"), ("BR", "br"), ("ｂｒ", "br"), ("新娘", "br"), ("女", "br"), ("bride", "br"),
+    ("gr", "gr"), ("Ｇｒ", "gr"), ("新郎", "gr"), ("男", "gr"), ("groom", "gr"),
+    ("x", None), ("", None),
+])
+def test_parse_gender_accepts_aliases_and_fullwidth(token, expected):
+    assert parsing.parse_gender(token) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("/加入APQ abc br 刀飞", "abc br 刀飞"),
+    ("／创建APQ　abc gr 拳手", "abc gr 拳手"),
+    ("  /更换APQ角色 abc br 刀飞", "abc br 刀飞"),
+    ("/加入apq abc br 刀飞", "abc br 刀飞"),
+    ("/加入APQ", ""),
+    ("/查询APQ", None),
+    ("/加入APQX abc", None),
+])
+def test_strip_command(message, expected):
+    assert parsing.strip_command(message) == expected
+
+
+def test_parse_role_splits_on_unicode_whitespace_and_keeps_spaced_jobs():
+    assert parsing.parse_role("abc　新娘 Night  Lord") == (Role("abc", "br", "Night Lord"), None)
+    assert parsing.parse_role("abc br") == (None, parsing.PARSE_USAGE)
+    assert parsing.parse_role("abc 人妖 刀飞") == (None, parsing.PARSE_GENDER)
+
+
+def test_parse_role_args_falls_back_to_framework_args():
+    assert parsing.parse_role_args("/加入APQ abc gr 拳 手", ("abc", "gr", "拳")) == (Role("abc", "gr", "拳 手"), None)
+    # 消息不是以角色命令开头（例如别名触发）时使用框架切分好的参数
+    assert parsing.parse_role_args("", ("abc", "新郎", "拳手")) == (Role("abc", "gr", "拳手"), None)
+    assert parsing.parse_role_args("apq abc", ("abc", "", "")) == (None, parsing.PARSE_USAGE)
+
+
+def test_join_reports_usage_and_gender_errors(new_plugin):
+    async def run():
+        plugin = new_plugin()
+        ev = _stubs.FakeEvent
+        usage = await plugin.join_apq(ev("1", group="100", message="/加入APQ abc"), "abc")
+        gender = await plugin.join_apq(ev("1", group="100", message="/加入APQ abc xx 刀飞"), "abc", "xx", "刀飞")
+        created = await plugin.create_apq(ev("1", group="100", message="/创建APQ　abc　新郎　夜 行者"))
+        session = plugin._get_session(plugin._session_id(ev("1", group="100")))
+        await plugin.terminate()
+        return usage, gender, created, session.captain.job
+
+    usage, gender, created, job = asyncio.run(run())
+    assert "用法" in usage
+    assert "性别参数错误" in gender
+    assert "APQ组队已创建" in created and job == "夜 行者"
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""权限：admin_ids / moderator_ids 的等级查询，群管理员，以及各等级能执行的重置"""
+
+import asyncio        # 运行异步命令处理器
+
+import _stubs
+
+
+def config() -> dict:
+    """每个测试各用一份配置（测试会修改其中的列表）"""
+    return {"admin_ids": [10001, " 10002 "], "moderator_ids": ["20001", "10001"]}
+
+
+def levels(new_plugin, *events):
+    """按配置实例化插件，返回各事件发送者的权限等级"""
+    async def run():
+        plugin = new_plugin(**config())
+        result = [plugin._permission_level(event) for event in events]
+        await plugin.terminate()
+        return plugin, result
+
+    return asyncio.run(run())
+
+
+def test_levels_come_from_the_id_lists_and_group_roles(new_plugin):
+    ev = _stubs.FakeEvent
+    plugin, result = levels(new_plugin, ev("10001"), ev("10002"), ev("20001"), ev("30001"),
+                            ev("30001", group="100", admin=True))
+    member, moderator, admin = plugin.ROLE_MEMBER, plugin.ROLE_MODERATOR, plugin.ROLE_ADMIN
+    # 同时出现在两个列表中的ID取较高的等级；ID统一为去掉空白的字符串
+    assert result == [admin, admin, moderator, member, admin]
+    assert plugin._is_super_admin("10002") and not plugin._is_super_admin("20001")
+
+
+def test_lookups_do_not_read_the_config_lists(new_plugin):
+    plugin, _ = levels(new_plugin)
+    # 权限表在加载时构建，之后修改配置列表不影响查询（AstrBot 修改配置后会重新加载插件）
+    plugin.config["admin_ids"].append("30001")
+    plugin.config["moderator_ids"].clear()
+    assert plugin._role_of("30001") == plugin.ROLE_MEMBER
+    assert plugin._role_of("20001") == plugin.ROLE_MODERATOR
+
+
+def test_only_super_admins_reset_every_group(new_plugin):
+    async def run():
+        plugin = new_plugin(**config())
+        ev = _stubs.FakeEvent
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        await plugin.create_apq(ev("2", group="200"), "c2", "gr", "拳手")
+        replies = [
+            await plugin.reset_apq(ev("30001", group="100"), ""),
+            await plugin.reset_apq(ev("20001", group="100"), "全部"),
+            await plugin.reset_apq(ev("30001", group="100", admin=True), "全部"),
+        ]
+        before = sorted(plugin.state["sessions"])
+        replies.append(await plugin.reset_apq(ev("20001", group="100"), ""))
+        after_moderator = sorted(plugin.state["sessions"])
+        replies.append(await plugin.reset_apq(ev("10001", group="100"), "全部"))
+        after_admin = sorted(plugin.state["sessions"])
+        await plugin.terminate()
+        return replies, before, after_moderator, after_admin
+
+    replies, before, after_moderator, after_admin = asyncio.run(run())
+    assert "仅管理员" in replies[0]
+    assert "仅超级管理员" in replies[1] and "仅超级管理员" in replies[2]
+    assert len(before) == 2
+    assert len(after_moderator) == 1 and "已重置本群" in replies[3]
+    assert after_admin == [] and "已重置所有群" in replies[4]
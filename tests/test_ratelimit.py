@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""令牌桶限流：突发、补充、拒绝与淘汰"""
+
+import pytest         # 测试框架
+
+import _stubs
+
+ratelimit = _stubs.load_module("ratelimit")
+
+
+def test_burst_then_reject_with_wait_time():
+    limiter = ratelimit.TokenBucketLimiter(rate=1.0, burst=3)
+    assert [limiter.acquire("u", 0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("u", 0.0) == pytest.approx(1.0)
+    assert limiter.acquire("u", 0.5) == pytest.approx(0.5)
+    assert limiter.rejected == 2
+
+
+def test_tokens_refill_over_time_up_to_burst():
+    limiter = ratelimit.TokenBucketLimiter(rate=2.0, burst=2)
+    limiter.acquire("u", 0.0)
+    limiter.acquire("u", 0.0)
+    assert limiter.acquire("u", 0.0) > 0
+    assert limiter.acquire("u", 0.5) == 0.0
+    # 长时间空闲后最多只攒够 burst 个令牌
+    assert [limiter.acquire("u", 100.0) for _ in range(3)][-1] > 0
+
+
+def test_keys_are_independent():
+    limiter = ratelimit.TokenBucketLimiter(rate=1.0, burst=1)
+    assert limiter.acquire("a", 0.0) == 0.0
+    assert limiter.acquire("a", 0.0) > 0
+    assert limiter.acquire("b", 0.0) == 0.0
+
+
+def test_refund_returns_a_token():
+    limiter = ratelimit.TokenBucketLimiter(rate=1.0, burst=1)
+    limiter.acquire("u", 0.0)
+    limiter.refund("u")
+    assert limiter.acquire("u", 0.0) == 0.0
+
+
+def test_notify_only_once_per_rejection_streak():
+    limiter = ratelimit.TokenBucketLimiter(rate=1.0, burst=1)
+    limiter.acquire("u", 0.0)
+    limiter.acquire("u", 0.0)
+    assert limiter.should_notify("u") is True
+    limiter.acquire("u", 0.1)
+    assert limiter.should_notify("u") is False
+    # 再次放行后重新计算
+    assert limiter.acquire("u", 2.0) == 0.0
+    limiter.acquire("u", 2.0)
+    assert limiter.should_notify("u") is True
+
+
+def test_least_recently_used_bucket_is_evicted():
+    limiter = ratelimit.TokenBucketLimiter(rate=0.001, burst=1, capacity=2)
+    limiter.acquire("a", 0.0)
+    limiter.acquire("b", 0.0)
+    limiter.acquire("a", 0.0)   # 被拒绝，但 a 成为最近使用的桶
+    limiter.acquire("c", 0.0)   # 超出容量，淘汰最久未使用的 b
+    assert len(limiter) == 2 and limiter.evicted == 1
+    assert limiter.acquire("a", 0.0) > 0
+    assert limiter.acquire("c", 0.0) > 0
+    # 被淘汰的键下次出现时是一个满桶
+    assert limiter.acquire("b", 0.0) == 0.0
+
+
+def test_zero_rate_disables_limiting():
+    assert not ratelimit.TokenBucketLimiter(rate=0, burst=1).enabled
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""名单文本缓存：按视图版本复用，变更后重新拼接，br/gr 人数随变更增量维护"""
+
+import asyncio        # 运行异步命令处理器
+
+import _stubs
+
+
+def counts(session) -> tuple:
+    """按成员现算的 br/gr 人数"""
+    genders = [p.gender for p in session.members]
+    return genders.count("br"), genders.count("gr")
+
+
+def test_queries_reuse_the_text_until_a_mutation_republishes_the_view(new_plugin):
+    async def run():
+        plugin = new_plugin()
+        ev = _stubs.FakeEvent
+        sid = plugin._session_id(ev("1", group="100"))
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        first = await plugin.query_apq(ev("9", group="100"))
+        cached = plugin._roster_text[sid]
+        again = await plugin.query_apq(ev("9", group="100"))
+        reused = plugin._roster_text[sid] is cached
+
+        await plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞")
+        view = plugin._get_view(sid)
+        joined = await plugin.query_apq(ev("9", group="100"))
+        await plugin.terminate()
+        return first, again, reused, cached.version, view, joined
+
+    first, again, reused, old_version, view, joined = asyncio.run(run())
+    assert first == again and reused
+    assert view.version > old_version
+    assert "c2" not in first and "c2" in joined
+    assert "总人数：2，br：1，gr：1" in joined
+
+
+def test_counts_follow_role_changes_quits_and_resets(new_plugin):
+    async def run():
+        plugin = new_plugin()
+        ev = _stubs.FakeEvent
+        sid = plugin._session_id(ev("1", group="100"))
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        for uid, gender in (("2", "br"), ("3", "br"), ("4", "gr")):
+            await plugin.join_apq(ev(uid, group="100"), f"c{uid}", gender, f"职业{uid}")
+        seen = []
+
+        async def check():
+            view = plugin._get_view(sid)
+            seen.append(((view.br_count, view.gr_count), counts(plugin._get_session(sid))))
+            return await plugin.query_apq(ev("9", group="100"))
+
+        await check()
+        await plugin.replace_apq(ev("3", group="100"), "c3", "gr", "拳手")
+        await check()
+        await plugin.quit_apq(ev("4", group="100"))
+        text = await check()
+        await plugin.reset_apq(ev("1", group="100", admin=True), "")
+        dropped = sid not in plugin._roster_text and not plugin._get_view(sid).members
+        await plugin.terminate()
+        return seen, text, dropped
+
+    seen, text, dropped = asyncio.run(run())
+    assert [cached for cached, _ in seen] == [(2, 2), (1, 3), (1, 2)]
+    assert all(cached == recounted for cached, recounted in seen)
+    assert "总人数：3，br：1，gr：2" in text
+    # 会话被重置后缓存随视图一起移除
+    assert dropped
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""出勤统计：增量计数、最近N天的滚动合计、保留天数与持久化"""
+
+import time           # 构造时间戳
+from collections import Counter  # 计数器
+
+import _stubs
+
+stats = _stubs.load_module("stats")
+
+DAY = 86400
+NOON = int(time.mktime((2024, 6, 1, 12, 0, 0, 0, 0, -1)))
+
+
+def run(ts: int, *qqs: str, outcome: str = "completed", rid: str = "") -> dict:
+    """一场APQ的归档记录，成员按 QQ号 交替分配 br/gr"""
+    members = [{"qq_number": qq, "nickname": f"n{qq}", "character_id": f"c{qq}",
+                "gender": "br" if i % 2 else "gr", "job": "刀飞" if i % 2 else "拳手"}
+               for i, qq in enumerate(qqs)]
+    return {"id": rid or f"{ts}-{'-'.join(qqs)}", "ts": ts, "outcome": outcome, "session": "g", "members": members}
+
+
+def totals(window: dict) -> tuple:
+    """合计的可比较形式"""
+    return window["runs"], dict(window["qq"]), dict(window["gender"])
+
+
+def test_only_attended_runs_count_and_duplicates_are_skipped(tmp_path):
+    counters = stats.AttendanceStats(tmp_path / "stats.json")
+    record = run(NOON, "1", "2")
+    assert counters.apply(record)
+    assert not counters.apply(record)
+    assert counters.apply(run(NOON + 60, "1", outcome="cancelled"))
+    assert counters.outcomes == {"completed": 1, "cancelled": 1}
+    assert dict(counters.by_qq) == {"1": 1, "2": 1}
+    assert totals(counters.window(1, NOON)) == (1, {"1": 1, "2": 1}, {"gr": 1, "br": 1})
+
+
+def test_window_slides_with_the_date_and_sees_new_records(tmp_path):
+    counters = stats.AttendanceStats(tmp_path / "stats.json")
+    counters.apply(run(NOON, "1", "2"))
+    counters.apply(run(NOON + DAY, "1"))
+    assert totals(counters.window(2, NOON + DAY)) == (2, {"1": 2, "2": 1}, {"gr": 2, "br": 1})
+
+    # 已查询过的窗口直接计入新记录
+    counters.apply(run(NOON + DAY + 60, "3"))
+    assert totals(counters.window(2, NOON + DAY)) == (3, {"1": 2, "2": 1, "3": 1}, {"gr": 3, "br": 1})
+
+    # 第二天起第一天移出窗口，计数减到0的玩家不再出现
+    assert totals(counters.window(2, NOON + 2 * DAY)) == (2, {"1": 1, "3": 1}, {"gr": 2})
+    assert totals(counters.window(2, NOON + 5 * DAY)) == (0, {}, {})
+    # 时钟回拨时重新合并
+    assert totals(counters.window(1, NOON)) == (1, {"1": 1, "2": 1}, {"gr": 1, "br": 1})
+
+
+def test_buckets_older_than_retention_are_dropped(tmp_path):
+    counters = stats.AttendanceStats(tmp_path / "stats.json", retention_days=3)
+    for day in range(5):
+        counters.apply(run(NOON + day * DAY, str(day)))
+    assert len(counters.days) == 3
+    # 查询天数不超过保留天数
+    assert totals(counters.window(30, NOON + 4 * DAY)) == (3, {"2": 1, "3": 1, "4": 1}, {"gr": 3})
+    assert counters.by_qq["0"] == 1
+
+
+def test_counters_survive_a_round_trip_through_stats_json(tmp_path):
+    path = tmp_path / "stats.json"
+    counters = stats.AttendanceStats(path)
+    for day in range(3):
+        counters.apply(run(NOON + day * DAY, "1", str(day + 2)))
+    counters.write(counters.encode())
+
+    loaded = stats.AttendanceStats(path)
+    assert loaded.load()
+    assert totals(loaded.window(7, NOON + 2 * DAY)) == totals(counters.window(7, NOON + 2 * DAY))
+    assert loaded.last_ts == counters.last_ts
+    # 补记已计入的最后一条记录时被跳过
+    assert not loaded.apply(run(NOON + 2 * DAY, "1", "4"))
+
+    path.write_bytes(b"{broken")
+    assert not stats.AttendanceStats(path).load()
+
+
+def test_top_breaks_ties_by_key():
+    counter = Counter({"b": 2, "a": 2, "c": 5, "d": 1})
+    assert stats.AttendanceStats.top(counter, 3) == [("c", 5), ("a", 2), ("b", 2)]
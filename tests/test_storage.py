@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""持久化：三种存储模式重启后状态一致，快照损坏时回退不丢失变更，旧版本数据启动时升级"""
+
+import asyncio        # 运行异步命令处理器
+import os             # 模拟崩溃
+from pathlib import Path    # 路径处理
+
+import pytest         # 测试框架
+
+import _stubs
+
+main = _stubs.load_plugin()
+codec = _stubs.load_module("codec")
+storage = _stubs.load_module("storage")
+migrations = _stubs.load_module("migrations")
+
+MODES = ("snapshot", "journal", "sqlite")
+
+
+def make_plugin(data_root: Path, **config):
+    """在指定的数据根目录上实例化插件（需要在事件循环中调用）"""
+    _stubs.set_data_root(data_root)
+    config.setdefault("metrics_export_interval_seconds", 0)
+    config.setdefault("rate_limit_user_per_minute", 0)
+    config.setdefault("rate_limit_group_per_minute", 0)
+    return main.APQPlugin(_stubs.FakeContext(), main.AstrBotConfig(config))
+
+
+def dump(plugin, timestamps: bool = True):
+    """插件内存状态的可比较形式"""
+    def strip(player):
+        data = player.to_dict()
+        if not timestamps:
+            data.pop("joined_at", None)
+        return data
+
+    sessions = {}
+    for sid, session in plugin.state["sessions"].items():
+        sessions[sid] = {
+            "status": session.status,
+            "captain": session.captain_qq,
+            "members": [strip(p) for p in session.members],
+            "waitlist": [strip(p) for p in session.waitlist],
+        }
+    queues = {sid: [strip(p) for p in queue] for sid, queue in plugin.state["queues"].items()}
+    return {"sessions": sessions, "queues": queues}
+
+
+async def workload(plugin, each=None) -> None:
+    """覆盖创建、加入、候补、更换角色、退出和匹配队列的命令序列
+
+    Args:
+        plugin: 插件实例
+        each: 每条命令之后等待的协程函数（如立即刷盘），默认不等待
+    """
+    ev = _stubs.FakeEvent
+    commands = [
+        lambda: plugin.create_apq(ev("1", group="100"), "cap", "gr", "拳手"),
+        lambda: plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞"),
+        lambda: plugin.join_apq(ev("3", group="100"), "c3", "br", "刀飞"),
+        lambda: plugin.join_apq(ev("4", group="100"), "c4", "br", "刀飞"),
+        lambda: plugin.join_apq(ev("5", group="100"), "c5", "br", "刀飞"),
+        lambda: plugin.replace_apq(ev("3", group="100"), "d3", "gr", "法师"),
+        lambda: plugin.quit_apq(ev("4", group="100")),
+        lambda: plugin.join_apq(ev("6", group="200"), "q6", "br", "弓手"),
+        lambda: plugin.join_apq(ev("7", group="200"), "q7", "gr", "主教"),
+    ]
+    for command in commands:
+        await command()
+        if each is not None:
+            await each()
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_restart_restores_the_same_state(tmp_path, mode):
+    async def run():
+        plugin = make_plugin(tmp_path, storage_mode=mode)
+        await workload(plugin)
+        before = dump(plugin)
+        await plugin.terminate()
+
+        restarted = make_plugin(tmp_path, storage_mode=mode)
+        after = dump(restarted)
+        await restarted.terminate()
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert before["sessions"] and before["queues"]
+    assert after == before
+
+
+def test_backends_agree(tmp_path):
+    async def run(mode):
+        plugin = make_plugin(tmp_path / mode, storage_mode=mode)
+        await workload(plugin)
+        await plugin.terminate()
+        restarted = make_plugin(tmp_path / mode, storage_mode=mode)
+        state = dump(restarted, timestamps=False)
+        await restarted.terminate()
+        return state
+
+    states = [asyncio.run(run(mode)) for mode in MODES]
+    assert states[0] == states[1] == states[2]
+
+
+@pytest.mark.parametrize("broken", [["database.json"], ["database.json", "database.json.1"]])
+def test_journal_fallback_replays_rotated_journals(tmp_path, broken):
+    config = {"storage_mode": "journal", "journal_compact_threshold": 2, "snapshot_keep": 3}
+
+    async def run():
+        plugin = make_plugin(tmp_path, **config)
+        # 每条命令后立即刷盘，让日志多次压缩、轮转出历史快照
+        await workload(plugin, each=plugin._flush)
+        before = dump(plugin)
+        await plugin.terminate()
+
+        data_dir = plugin.data_dir
+        for name in broken:
+            (data_dir / name).write_bytes(b"{broken")
+        restarted = make_plugin(tmp_path, **config)
+        after = dump(restarted)
+        await restarted.terminate()
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert after == before
+
+
+def test_legacy_database_is_upgraded_on_start(tmp_path):
+    captain = {"qq_number": "1", "nickname": "n1", "character_id": "cap", "gender": "gr", "job": "拳手"}
+    legacy = {"status": "recruiting", "captain": captain, "members": [captain], "tracked_groups": []}
+    data_dir = tmp_path / "mapleroyalsapq"
+    data_dir.mkdir()
+    (data_dir / "database.json").write_bytes(codec.dumps(legacy))
+
+    async def run():
+        plugin = make_plugin(tmp_path, storage_mode="snapshot")
+        state = dump(plugin)
+        await plugin.terminate()
+        return state
+
+    state = asyncio.run(run())
+    assert state["sessions"][migrations.DEFAULT_SESSION]["captain"] == "1"
+    written = codec.loads((data_dir / "database.json").read_bytes())
+    assert written["version"] == migrations.SCHEMA_VERSION
+    # 升级前的原文件作为历史快照保留
+    assert "version" not in codec.loads((data_dir / "database.json.1").read_bytes())
+
+
+def test_atomic_write_keeps_target_if_final_rename_fails(tmp_path, monkeypatch):
+    path = tmp_path / "db.json"
+    for i in range(3):
+        storage.atomic_write_text(path, f"v{i}", keep=2)
+    assert [path.read_text(), storage.backup_path(path, 1).read_text(),
+            storage.backup_path(path, 2).read_text()] == ["v2", "v1", "v0"]
+
+    real_replace = os.replace
+
+    def crash_on_target(src, dst):
+        if Path(dst) == path:
+            raise OSError("simulated crash")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(storage.os, "replace", crash_on_target)
+    with pytest.raises(OSError):
+        storage.atomic_write_text(path, "v3", keep=2)
+    assert path.read_text() == "v2"
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""过期定时器：到期顺序、召集超时和报名超时，失效的定时器被丢弃"""
+
+import asyncio        # 运行异步命令处理器
+
+import _stubs
+
+timers = _stubs.load_module("timers")
+main = _stubs.load_plugin()
+
+
+def test_pop_due_returns_expired_keys_in_deadline_order():
+    heap = timers.TimerHeap()
+    assert heap.next_deadline() is None
+    assert heap.schedule(30, "c") is True
+    assert heap.schedule(10, "a") is True
+    # 同一时刻到期的定时器按安排顺序触发，不会成为新的最早定时器
+    assert heap.schedule(10, "b") is False
+    assert heap.next_deadline() == 10
+
+    assert heap.pop_due(5) == []
+    assert heap.pop_due(10) == ["a", "b"]
+    assert len(heap) == 1
+    heap.clear()
+    assert heap.pop_due(100) == []
+
+
+class Clock:
+    """可手动拨动的 time.time 替身"""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_recruiting_session_expires_after_ttl(new_plugin, monkeypatch):
+    clock = Clock(1_700_000_000)
+    monkeypatch.setattr(main.time, "time", clock)
+
+    async def run():
+        plugin = new_plugin(session_ttl_minutes=30)
+        ev = _stubs.FakeEvent
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        await plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞")
+        sid = plugin._session_id(ev("1", group="100"))
+
+        clock.now += 29 * 60
+        await plugin._expire(plugin._timers.pop_due(clock.now))
+        alive = plugin._get_session(sid).status
+
+        clock.now += 2 * 60
+        await plugin._expire(plugin._timers.pop_due(clock.now))
+        session = plugin._get_session(sid)
+        await plugin.terminate()
+        return alive, session
+
+    alive, session = asyncio.run(run())
+    assert alive == "recruiting"
+    assert session is None
+
+
+def test_member_timer_is_dropped_after_rejoin(new_plugin, monkeypatch):
+    clock = Clock(1_700_000_000)
+    monkeypatch.setattr(main.time, "time", clock)
+
+    async def run():
+        plugin = new_plugin(member_timeout_minutes=10, session_ttl_minutes=0)
+        ev = _stubs.FakeEvent
+        await plugin.create_apq(ev("1", group="100"), "c1", "gr", "拳手")
+        await plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞")
+        clock.now += 5 * 60
+        await plugin.quit_apq(ev("2", group="100"))
+        await plugin.join_apq(ev("2", group="100"), "c2", "br", "刀飞")
+        sid = plugin._session_id(ev("1", group="100"))
+
+        def members():
+            return [p.qq_number for p in plugin._get_session(sid).members]
+
+        # 第一次报名的定时器到期：报名已不是当初那一次，直接丢弃
+        clock.now += 6 * 60
+        await plugin._expire(plugin._timers.pop_due(clock.now))
+        after_stale = members()
+
+        # 重新报名的定时器到期；队长不会因报名超时被移除
+        clock.now += 5 * 60
+        await plugin._expire(plugin._timers.pop_due(clock.now))
+        after_expiry = members()
+        await plugin.terminate()
+        return after_stale, after_expiry
+
+    after_stale, after_expiry = asyncio.run(run())
+    assert after_stale == ["1", "2"]
+    assert after_expiry == ["1"]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+APQ 插件过期定时器
+
+所有会话的召集超时和成员报名超时共用一个小顶堆，由插件的单个后台任务驱动，
+而不是每个会话一个任务：
+- 安排定时器只需一次堆插入，O(log n)
+- 不支持取消：到期时由调用方检查定时器是否仍然有效（会话/报名是否还是当初那一个），
+  失效的定时器直接丢弃。每个定时器的到期时间都不超过配置的超时时长，
+  因此堆的大小受该时间窗口内的报名次数限制，不会无限增长
+"""
+
+import heapq          # 小顶堆
+import itertools      # 插入序号
+from typing import Any, Hashable, List, Optional, Tuple  # 类型提示
+
+
+class TimerHeap:
+    """按到期时间排序的定时器集合"""
+
+    def __init__(self):
+        # (到期时间戳, 插入序号, 定时器键)，插入序号保证同一时刻到期的定时器按安排顺序触发
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, deadline: float, key: Hashable) -> bool:
+        """安排一个定时器
+
+        Args:
+            deadline: 到期时间戳
+            key: 定时器键，到期时原样返回
+        Returns:
+            bool: 新定时器成为最早到期的定时器时返回True（需要唤醒等待中的任务）
+        """
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        return self._heap[0][2] is key
+
+    def next_deadline(self) -> Optional[float]:
+        """最早的到期时间戳
+
+        Returns:
+            Optional[float]: 到期时间戳，没有定时器时返回None
+        """
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[Any]:
+        """取出所有已到期的定时器
+
+        Args:
+            now: 当前时间戳
+        Returns:
+            List[Any]: 到期的定时器键（按到期时间排序）
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def clear(self) -> None:
+        """移除所有定时器"""
+        self._heap.clear()